@@ -0,0 +1,187 @@
+"""Call graph and cached function summaries for interprocedural analysis"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Set
+
+import attr
+from physfix.dataflow.cfg_node import CFGNode, FunctionCFG
+from physfix.parse.cpp_parser import Token, Variable
+from physfix.parse.cpp_utils import get_call_arguments, get_statement_tokens
+
+
+@attr.s(eq=False)
+class CallSite:
+    """Call of a function defined in the same configuration"""
+    cfgnode: CFGNode = attr.ib()
+    call_token: Token = attr.ib()  # The '(' token of the call
+    caller: FunctionCFG = attr.ib()
+    callee: FunctionCFG = attr.ib()
+
+    def get_arguments(self) -> List[Token]:
+        return get_call_arguments(self.call_token)
+
+
+def get_node_tokens(cfgnode: CFGNode) -> List[Token]:
+    """Returns the statement tokens of a basic or conditional block"""
+    if cfgnode.get_type() == "basic":
+        return get_statement_tokens(cfgnode.token)
+    elif cfgnode.get_type() == "conditional":
+        return get_statement_tokens(cfgnode.condition)
+
+    return []
+
+
+def is_return_node(cfgnode: CFGNode) -> bool:
+    """Checks if a cfg node is a return statement. The root of a statement is its first token"""
+    return cfgnode.get_type() == "basic" and cfgnode.token.str == "return"
+
+
+def is_global_variable(variable: Variable) -> bool:
+    """Checks if a variable is in scope in every function, so definitions of it can be used across calls"""
+    return not (variable.isLocal or variable.isArgument)
+
+
+class CallGraph:
+    """Calls between the functions of a configuration"""
+    def __init__(self, function_cfgs: List[FunctionCFG]):
+        self.function_cfgs = function_cfgs
+        # Maps cppcheck Function objects to the CFG of the function
+        self.function_map = {c.function_declaration.function: c for c in function_cfgs}
+        self.call_sites: Dict[FunctionCFG, List[CallSite]] = {c: [] for c in function_cfgs}
+        self.callers: Dict[FunctionCFG, List[CallSite]] = {c: [] for c in function_cfgs}
+
+        for cfg in function_cfgs:
+            for n in cfg.nodes:
+                for t in get_node_tokens(n):
+                    if t.str == "(" and t.astOperand1 and t.astOperand1.function in self.function_map:
+                        call_site = CallSite(n, t, cfg, self.function_map[t.astOperand1.function])
+                        self.call_sites[cfg].append(call_site)
+                        self.callers[call_site.callee].append(call_site)
+
+    def get_callees(self, cfg: FunctionCFG) -> List[FunctionCFG]:
+        callees = []
+        for call_site in self.call_sites[cfg]:
+            if call_site.callee not in callees:
+                callees.append(call_site.callee)
+
+        return callees
+
+    def get_bottom_up_order(self) -> List[FunctionCFG]:
+        """Orders functions so callees come before their callers. Recursive calls are cut arbitrarily"""
+        order: List[FunctionCFG] = []
+        seen: Set[FunctionCFG] = set()
+
+        for root in self.function_cfgs:
+            if root in seen:
+                continue
+
+            seen.add(root)
+            stack = [(root, iter(self.get_callees(root)))]
+            while stack:
+                cur, callees = stack[-1]
+                for callee in callees:
+                    if callee not in seen:
+                        seen.add(callee)
+                        stack.append((callee, iter(self.get_callees(callee))))
+                        break
+                else:
+                    stack.pop()
+                    order.append(cur)
+
+        return order
+
+
+@attr.s()
+class FunctionSummary:
+    """Summary of a function which callers can use instead of analyzing its body"""
+    name: str = attr.ib()
+    key: str = attr.ib()
+    argument_names: List[str] = attr.ib()
+    return_arguments: List[int] = attr.ib()  # Indices of arguments which flow into the return value
+    argument_units: List[List[Dict]] = attr.ib(factory=list)  # Phys units of each argument sorted by likelihood
+
+    def to_dict(self) -> Dict:
+        """Serializes FunctionSummary to dict"""
+        return attr.asdict(self)
+
+    @staticmethod
+    def from_dict(summary_dict: Dict) -> FunctionSummary:
+        return FunctionSummary(**summary_dict)
+
+
+def get_function_key(cfg: FunctionCFG, callee_keys: List[str] = ()) -> str:
+    """Hashes the tokens of a function so identical functions (e.g. from a shared header) have the same key.
+    Summaries depend on the summaries of the callees, so their keys are part of the key.
+    """
+    function_declaration = cfg.function_declaration
+    tokens = []
+    cur = function_declaration.token_start
+    while cur and cur != function_declaration.token_end:
+        tokens.append(cur.str)
+        cur = cur.next
+
+    arguments = [v.nameToken.str for v in cfg.entry_block.function_arguments]
+    key_str = json.dumps([function_declaration.name, arguments, tokens, list(callee_keys)])
+
+    return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+
+def get_argument_units(cfg: FunctionCFG, phys_var_map: Dict) -> List[List[Dict]]:
+    """Phys units of each argument of a function. Units come from the Phys output of one file"""
+    return [[u.to_dict() for u in phys_var_map[v.Id].units] if v.Id in phys_var_map else []
+            for v in cfg.entry_block.function_arguments]
+
+
+def create_function_summary(cfg: FunctionCFG, dependency_graph, phys_var_map: Dict = None,
+                            key: str = None) -> FunctionSummary:
+    """Summarizes which arguments of a function flow into its return value. key defaults to the
+    key of the function without its callees, see get_function_key
+    """
+    arguments = cfg.entry_block.function_arguments
+
+    return_nodes = [d for d in dependency_graph.nodes if is_return_node(d.cfgnode)]
+
+    # Arguments whose definition in the entry block is in the backward slice of a return statement
+    flowing = set()
+    for return_node in return_nodes:
+        for d in dependency_graph.backward_slice(return_node):
+            if d.cfgnode is cfg.entry_block:
+                flowing.add(d.variable)
+
+    argument_units = get_argument_units(cfg, phys_var_map) if phys_var_map is not None else []
+
+    return FunctionSummary(cfg.function_declaration.name, key if key is not None else get_function_key(cfg),
+                           [v.nameToken.str for v in arguments],
+                           [idx for idx, v in enumerate(arguments) if v in flowing],
+                           argument_units)
+
+
+class SummaryCache:
+    """Persists function summaries as json so they are reused across files which share functions.
+    Argument units are stored without them, since Phys units belong to the file they were inferred in.
+    """
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self.summaries: Dict[str, FunctionSummary] = {}
+
+        if os.path.exists(cache_path):
+            with open(cache_path) as f:
+                for key, summary_dict in json.load(f).items():
+                    self.summaries[key] = FunctionSummary.from_dict(summary_dict)
+
+    def get(self, key: str) -> Optional[FunctionSummary]:
+        return self.summaries.get(key)
+
+    def put(self, summary: FunctionSummary):
+        self.summaries[summary.key] = attr.evolve(summary, argument_units=[])
+
+    def save(self):
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        with open(self.cache_path, "w") as f:
+            json.dump({k: s.to_dict() for k, s in self.summaries.items()}, f)
@@ -213,6 +213,37 @@ class FunctionCFG:
 
         return adjacency_list
 
+    def create_reverse_postorder(self) -> List[CFGNode]:
+        """Orders nodes in reverse postorder of a depth first search from the entry block.
+        Successors are visited in the order given by create_node_mapping so the ordering
+        is deterministic. Nodes unreachable from the entry block are placed at the end.
+        """
+        node_mapping = self.create_node_mapping()
+
+        def ordered_next(node: CFGNode) -> List[CFGNode]:
+            return sorted(node.next, key=lambda n: node_mapping.get(n, len(node_mapping)))
+
+        postorder: List[CFGNode] = []
+        seen = {self.entry_block}
+        stack = [(self.entry_block, iter(ordered_next(self.entry_block)))]
+
+        while stack:
+            cur, next_nodes = stack[-1]
+
+            for next_node in next_nodes:
+                if next_node not in seen:
+                    seen.add(next_node)
+                    stack.append((next_node, iter(ordered_next(next_node))))
+                    break
+            else:
+                stack.pop()
+                postorder.append(cur)
+
+        reverse_postorder = postorder[::-1]
+        reverse_postorder.extend(n for n in self.nodes if n not in seen)
+
+        return reverse_postorder
+
     def to_dict(self) -> List[Dict]:
         """Serializes nodes of CFG into maping of node IDs to CFGNodes"""
         serialized_nodes_dict: Dict[int, Dict] = {}
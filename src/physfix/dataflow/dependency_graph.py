@@ -1,14 +1,18 @@
 from __future__ import annotations
 
-from collections import deque
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set, Tuple
 
 import attr
-from physfix.parse.cpp_parser import Variable
+from physfix.parse.cpp_parser import Token, Variable
+from physfix.parse.cpp_utils import get_root_token, get_statement_tokens, get_vars_from_statement
 from physfix.parse.dump_to_ast import DumpToAST
 from physfix.dataflow.ast_to_cfg import ASTToCFG, CFGNode, FunctionCFG
-from physfix.dataflow.reach_def import (ReachDef, DefUsePair, 
-                                        create_def_use_pairs, create_reach_definitions)
+from physfix.dataflow.call_graph import (CallGraph, FunctionSummary, SummaryCache, create_function_summary,
+                                         get_argument_units, get_function_key, is_global_variable, is_return_node)
+from physfix.dataflow.reach_def import (ReachDef, DefUsePair, ReachDefQuery, create_def_use_pair,
+                                        create_def_use_pairs, create_live_variables, create_reach_definitions,
+                                        get_reachable_nodes, propagate_definitions, update_reach_definitions)
+from physfix.dataflow.ssa import FunctionSSA
 
 
 @attr.s(eq=False, repr=False)
@@ -17,6 +21,10 @@ class DependencyNode:
     variable: Variable = attr.ib()
     next: Set[DependencyNode] = attr.ib(factory=set)
     previous: Set[DependencyNode] = attr.ib(factory=set)
+    # Edges to nodes in the graphs of other functions, from call arguments to the callee's parameters and
+    # from the callee's return statements to the call. Components and slices only follow next and previous.
+    call_next: Set[DependencyNode] = attr.ib(factory=set)
+    call_previous: Set[DependencyNode] = attr.ib(factory=set)
 
     def to_dict(self) -> Dict:
         """Serializes DepenencyNode to dict"""
@@ -31,12 +39,78 @@ class DependencyNode:
         return str(self.to_dict())
 
 
+def create_dependency_nodes(def_use_pair: DefUsePair) -> List[DependencyNode]:
+    """Creates a DependencyNode for every variable defined in a cfg node, or a single node without
+    a variable if nothing is defined
+    """
+    if not def_use_pair.define:
+        return [DependencyNode(def_use_pair.cfgnode, None)]
+
+    return [DependencyNode(def_use_pair.cfgnode, v) for v in def_use_pair.define]
+
+
+def get_node_dependencies(reach_def: Set[ReachDef], def_use_pair: DefUsePair) -> Set[ReachDef]:
+    """Gets the reaching definitions which are used and not killed by a cfg node"""
+    return {r for r in reach_def if r.variable not in def_use_pair.define and r.variable in def_use_pair.use}
+
+
+class DisjointSet:
+    """Union-find with path halving and union by size"""
+    def __init__(self, items):
+        self.parent = {i: i for i in items}
+        self.size = {i: 1 for i in items}
+
+    def find(self, item):
+        """Returns the representative item of the set containing item"""
+        while self.parent[item] is not item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+
+        return item
+
+    def union(self, item_1, item_2):
+        """Merges the sets containing item_1 and item_2"""
+        root_1, root_2 = self.find(item_1), self.find(item_2)
+        if root_1 is root_2:
+            return
+
+        if self.size[root_1] < self.size[root_2]:
+            root_1, root_2 = root_2, root_1
+
+        self.parent[root_2] = root_1
+        self.size[root_1] += self.size[root_2]
+
+
 @attr.s(eq=False)
 class DependencyGraph:
     cfg: FunctionCFG = attr.ib()
     nodes: List[DependencyNode] = attr.ib()
     reach_definition: Dict[CFGNode, Set[ReachDef]] = attr.ib()
     def_use_pairs: Dict[CFGNode, DefUsePair] = attr.ib()
+    ssa: FunctionSSA = attr.ib(default=None)
+    live_variables: Dict[CFGNode, Set[Variable]] = attr.ib(default=None)
+    # Definitions of global variables in callers and callees which reach each node
+    call_reaching_defs: Dict[CFGNode, Set[ReachDef]] = attr.ib(factory=dict)
+    _component_ids: Dict[DependencyNode, int] = attr.ib(init=False, default=None, repr=False)
+    _components: List[List[DependencyNode]] = attr.ib(init=False, default=None, repr=False)
+    _scc_ids: Dict[DependencyNode, int] = attr.ib(init=False, default=None, repr=False)
+    _sccs: List[List[DependencyNode]] = attr.ib(init=False, default=None, repr=False)
+    _backward_closure: List[int] = attr.ib(init=False, default=None, repr=False)
+    _forward_closure: List[int] = attr.ib(init=False, default=None, repr=False)
+
+    def get_reaching_defs(self, cfgnode: CFGNode, interprocedural=False) -> Set[ReachDef]:
+        """Returns the definitions which reach a node, from the SSA form if the graph has one. With
+        interprocedural, definitions of global variables in callers and callees are included too.
+        """
+        if self.ssa is not None:
+            reach_def = self.ssa.reaching_defs_at(cfgnode)
+        else:
+            reach_def = self.reach_definition[cfgnode]
+
+        if interprocedural and cfgnode in self.call_reaching_defs:
+            return reach_def | self.call_reaching_defs[cfgnode]
+
+        return reach_def
 
     def create_node_mapping(self) -> Dict[CFGNode, int]:
         """Maps DependencyNode to a unique int. IDs are determined
@@ -105,36 +179,260 @@ class DependencyGraph:
 
         return serialized_nodes_dict
 
+    def create_component_index(self):
+        """Assigns every node the ID of its connected component using union-find. IDs are given
+        to components in the order their first node appears in self.nodes
+        """
+        disjoint_set = DisjointSet(self.nodes)
+        for n in self.nodes:
+            for next_n in n.next:
+                disjoint_set.union(n, next_n)
+
+        root_ids: Dict[DependencyNode, int] = {}
+        self._component_ids = {}
+        self._components = []
+        for n in self.nodes:
+            root = disjoint_set.find(n)
+            if root not in root_ids:
+                root_ids[root] = len(self._components)
+                self._components.append([])
+
+            self._component_ids[n] = root_ids[root]
+            self._components[root_ids[root]].append(n)
+
+    def get_component_id(self, node: DependencyNode) -> int:
+        """Returns the ID of the connected component containing node"""
+        if self._component_ids is None:
+            self.create_component_index()
+
+        return self._component_ids[node]
+
+    def same_component(self, node_1: DependencyNode, node_2: DependencyNode) -> bool:
+        """Checks if two nodes are connected"""
+        return self.get_component_id(node_1) == self.get_component_id(node_2)
+
+    def get_component_nodes(self, component_id: int) -> List[DependencyNode]:
+        """Returns all nodes in a connected component"""
+        if self._components is None:
+            self.create_component_index()
+
+        return self._components[component_id]
+
     def get_connected_components(self) -> List[Set[DependencyNode]]:
         """Returns a list of sets containing connected components"""
-        connected_components: List[Set[CFGNode]] = []
-        all_nodes = deque(self.nodes)
-        processed: Set[CFGNode] = set()
+        if self._components is None:
+            self.create_component_index()
+
+        return [set(c) for c in self._components]
 
-        while all_nodes:
-            root = all_nodes.pop()
-            if root in processed:
+    def create_condensation(self):
+        """Finds strongly connected components with Tarjan's algorithm and orders them topologically,
+        so every edge goes from a component to the same or a later component
+        """
+        node_order = {n: idx for idx, n in enumerate(self.nodes)}
+
+        def ordered_next(node: DependencyNode) -> List[DependencyNode]:
+            return sorted(node.next, key=node_order.get)
+
+        index: Dict[DependencyNode, int] = {}
+        lowlink: Dict[DependencyNode, int] = {}
+        stack: List[DependencyNode] = []
+        on_stack: Set[DependencyNode] = set()
+        sccs: List[List[DependencyNode]] = []
+
+        def visit(node: DependencyNode):
+            index[node] = lowlink[node] = len(index)
+            stack.append(node)
+            on_stack.add(node)
+
+        # Iterative so large graphs don't hit the recursion limit
+        for root in self.nodes:
+            if root in index:
                 continue
 
-            q = deque([root])
-            connected = set()
-            while q:
-                cur = q.pop()
+            visit(root)
+            work = [(root, iter(ordered_next(root)))]
+            while work:
+                cur, next_nodes = work[-1]
+
+                for next_node in next_nodes:
+                    if next_node not in index:
+                        visit(next_node)
+                        work.append((next_node, iter(ordered_next(next_node))))
+                        break
+                    elif next_node in on_stack:
+                        lowlink[cur] = min(lowlink[cur], index[next_node])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[cur])
+
+                    if lowlink[cur] == index[cur]:
+                        scc = []
+                        while True:
+                            n = stack.pop()
+                            on_stack.remove(n)
+                            scc.append(n)
+                            if n is cur:
+                                break
+                        scc.sort(key=node_order.get)
+                        sccs.append(scc)
+
+        # Tarjan's algorithm finds components in reverse topological order
+        sccs.reverse()
+        self._sccs = sccs
+        self._scc_ids = {}
+        for scc_id, scc in enumerate(sccs):
+            for n in scc:
+                self._scc_ids[n] = scc_id
+
+    def get_scc_id(self, node: DependencyNode) -> int:
+        """Returns the position in topological order of the strongly connected component containing node"""
+        if self._scc_ids is None:
+            self.create_condensation()
+
+        return self._scc_ids[node]
+
+    def get_topological_order(self) -> List[List[DependencyNode]]:
+        """Returns strongly connected components in topological order"""
+        if self._sccs is None:
+            self.create_condensation()
+
+        return self._sccs
+
+    def create_slice_closures(self):
+        """Computes the transitive closure of the condensed graph in both directions. The closure of
+        each strongly connected component is stored as an int bitset of component IDs
+        """
+        sccs = self.get_topological_order()
+
+        # Predecessors of a component always come earlier in topological order
+        backward = [1 << i for i in range(len(sccs))]
+        for scc_id, scc in enumerate(sccs):
+            for n in scc:
+                for prev_n in n.previous:
+                    backward[scc_id] |= backward[self._scc_ids[prev_n]]
+
+        forward = [1 << i for i in range(len(sccs))]
+        for scc_id in range(len(sccs) - 1, -1, -1):
+            for n in sccs[scc_id]:
+                for next_n in n.next:
+                    forward[scc_id] |= forward[self._scc_ids[next_n]]
+
+        self._backward_closure = backward
+        self._forward_closure = forward
+
+    def _closure_nodes(self, closure: int) -> Set[DependencyNode]:
+        """Returns the nodes of every component in a closure bitset"""
+        nodes = set()
+        while closure:
+            lowest_bit = closure & -closure
+            nodes.update(self._sccs[lowest_bit.bit_length() - 1])
+            closure ^= lowest_bit
+
+        return nodes
+
+    def backward_slice(self, node: DependencyNode) -> Set[DependencyNode]:
+        """Returns node and every node it depends on"""
+        if self._backward_closure is None:
+            self.create_slice_closures()
+
+        return self._closure_nodes(self._backward_closure[self.get_scc_id(node)])
+
+    def forward_slice(self, node: DependencyNode) -> Set[DependencyNode]:
+        """Returns node and every node which depends on it"""
+        if self._forward_closure is None:
+            self.create_slice_closures()
+
+        return self._closure_nodes(self._forward_closure[self.get_scc_id(node)])
+
+    def replace_statement(self, cfgnode: CFGNode, token, statement_index: StatementIndex = None) -> Set[CFGNode]:
+        """Replaces the token tree of a basic or conditional block and updates the graph in place.
+        Only reaching definitions downstream of cfgnode are solved again and only the edges into
+        affected nodes are rebuilt. Pass the statement index the graph was added to so it's updated
+        too. Call edges of the statement are removed. Returns the cfg nodes whose reaching definitions changed.
+        """
+        old_root_token_id, _ = StatementIndex.get_root(cfgnode)
+        if cfgnode.get_type() == "basic":
+            cfgnode.token = token
+        elif cfgnode.get_type() == "conditional":
+            cfgnode.condition = token
+        else:
+            raise ValueError(f"Can't replace statement of {cfgnode.get_type()} node")
+
+        def_use_pair = create_def_use_pair(cfgnode)
+        self.def_use_pairs[cfgnode] = def_use_pair
+
+        if isinstance(self.reach_definition, ReachDefQuery):
+            # Memoized queries may depend on the old statement, so start a fresh query
+            self.reach_definition = ReachDefQuery(self.cfg, self.def_use_pairs)
+            changed = get_reachable_nodes(cfgnode)
+        else:
+            changed = update_reach_definitions(self.cfg, self.def_use_pairs, self.reach_definition, cfgnode)
+
+        # Swap out the nodes of the statement, keeping their position in self.nodes
+        old_nodes = [n for n in self.nodes if n.cfgnode is cfgnode]
+        affected: Set[DependencyNode] = set()
+        for old_node in old_nodes:
+            for prev_n in old_node.previous:
+                prev_n.next.discard(old_node)
+            for next_n in old_node.next:
+                next_n.previous.discard(old_node)
+                affected.add(next_n)
+            for prev_n in old_node.call_previous:
+                prev_n.call_next.discard(old_node)
+            for next_n in old_node.call_next:
+                next_n.call_previous.discard(old_node)
+
+        new_nodes = []
+        if def_use_pair.define or def_use_pair.use:
+            new_nodes = create_dependency_nodes(def_use_pair)
+
+        insert_idx = self.nodes.index(old_nodes[0]) if old_nodes else len(self.nodes)
+        self.nodes = [n for n in self.nodes if n.cfgnode is not cfgnode]
+        self.nodes[insert_idx:insert_idx] = new_nodes
+        affected.difference_update(old_nodes)
+        affected.update(new_nodes)
+
+        if self.ssa is not None:
+            # SSA renaming isn't incremental, but only uses downstream of the statement can be renamed
+            self.ssa = FunctionSSA(self.cfg, self.def_use_pairs)
+
+        affected.update(n for n in self.nodes if n.cfgnode in changed)
+
+        # Rebuild the edges into every affected node
+        variable_nodes: Dict[Tuple[CFGNode, Variable], List[DependencyNode]] = {}
+        for n in self.nodes:
+            variable_nodes.setdefault((n.cfgnode, n.variable), []).append(n)
+
+        for d in affected:
+            for prev_n in d.previous:
+                prev_n.next.discard(d)
+            d.previous.clear()
 
-                if cur in connected:
-                    continue
+            cur_pair = self.def_use_pairs[d.cfgnode]
+            if self.ssa is not None:
+                reach_def = set()
+                for use_var in cur_pair.use - cur_pair.define:
+                    reach_def.update(self.ssa.reaching_definitions(d.cfgnode, use_var))
+            else:
+                reach_def = get_node_dependencies(self.reach_definition[d.cfgnode], cur_pair)
 
-                connected.add(cur)
-                processed.add(cur)
-                for n in cur.next:
-                    q.append(n)
-                for n in cur.previous:
-                    q.append(n)
+            for r in reach_def:
+                for prev_n in variable_nodes.get((r.def_node, r.variable), []):
+                    d.previous.add(prev_n)
+                    prev_n.next.add(d)
 
-            connected_components.append(connected)
+        self.live_variables = create_live_variables(self.cfg, self.def_use_pairs)
+        self._component_ids = self._components = None
+        self._scc_ids = self._sccs = None
+        self._backward_closure = self._forward_closure = None
 
-        return connected
+        if statement_index is not None:
+            statement_index.update_statement(self, cfgnode, old_root_token_id)
 
+        return changed
 
     # def get_node_connected_components(self, dependency_node) -> Set[DependencyNode]:
     #     """Gets all components connected to a node"""
@@ -160,69 +458,245 @@ class DependencyGraph:
     #     return connected
 
 
+@attr.s(eq=False)
+class StatementEntry:
+    """Dependency nodes of the statement with a given root token"""
+    dependency_graph: DependencyGraph = attr.ib()
+    cfgnode: CFGNode = attr.ib()
+    root_token: Token = attr.ib()  # For conditionals this is the condition below the root token
+    dependency_nodes: List[DependencyNode] = attr.ib(factory=list)
+
+
+class StatementIndex:
+    """Maps the token Ids Phys reports errors with to statements in the dependency graphs"""
+    def __init__(self, dependency_graphs: List[DependencyGraph] = None):
+        self.statements: Dict[str, StatementEntry] = {}  # Maps root token Id to statement
+        self.tokens: Dict[str, Token] = {}  # Maps token Id to token for every basic block statement
+
+        for dependency_graph in dependency_graphs or []:
+            self.add_graph(dependency_graph)
+
+    @staticmethod
+    def get_root(cfgnode: CFGNode) -> Tuple[Optional[str], Optional[Token]]:
+        """Returns the root token Id a statement is indexed by and the token its entry stores"""
+        if cfgnode.get_type() == "basic":
+            return cfgnode.token.Id, cfgnode.token
+        elif cfgnode.get_type() == "conditional":
+            conditional_root = get_root_token(cfgnode.condition)
+            return conditional_root.Id, conditional_root.astOperand2
+
+        return None, None
+
+    def add_graph(self, dependency_graph: DependencyGraph):
+        """Indexes the statements of a graph. Statements already indexed from other graphs are replaced"""
+        for n in dependency_graph.nodes:
+            self._add_node(dependency_graph, n)
+
+    def _add_node(self, dependency_graph: DependencyGraph, n: DependencyNode):
+        cfgnode = n.cfgnode
+        root_token_id, root_token = self.get_root(cfgnode)
+        if root_token_id is None:
+            return
+
+        entry = self.statements.get(root_token_id)
+        if entry is None or entry.dependency_graph is not dependency_graph or entry.cfgnode is not cfgnode:
+            entry = StatementEntry(dependency_graph, cfgnode, root_token)
+            self.statements[root_token_id] = entry
+
+            if cfgnode.get_type() == "basic":
+                for t in get_statement_tokens(root_token):
+                    self.tokens[t.Id] = t
+        entry.dependency_nodes.append(n)
+
+    def update_statement(self, dependency_graph: DependencyGraph, cfgnode: CFGNode, old_root_token_id: str):
+        """Indexes a statement again after DependencyGraph.replace_statement, old_root_token_id is the
+        root token Id of the statement before it was replaced
+        """
+        entry = self.statements.get(old_root_token_id)
+        if entry is not None and entry.cfgnode is cfgnode:
+            del self.statements[old_root_token_id]
+            if cfgnode.get_type() == "basic":
+                for t in get_statement_tokens(entry.root_token):
+                    if self.tokens.get(t.Id) is t:
+                        del self.tokens[t.Id]
+
+        for n in dependency_graph.nodes:
+            if n.cfgnode is cfgnode:
+                self._add_node(dependency_graph, n)
+
+    def get_statement(self, root_token_id: str) -> StatementEntry:
+        return self.statements.get(root_token_id)
+
+    def get_token(self, token_id: str) -> Token:
+        return self.tokens.get(token_id)
+
+
 class CFGToDependencyGraph:
-    """Converts function CFGs into Dependency Graphs"""
-    def __init__(self, ast_to_cfg: ASTToCFG):
+    """Converts function CFGs into Dependency Graphs. With use_ssa the edges come from the SSA
+    def-use chains and reaching definitions are only computed for nodes that are queried.
+    With interprocedural, functions are summarized callees first and the graphs are linked at
+    call sites, see link_calls.
+    """
+    def __init__(self, ast_to_cfg: ASTToCFG, use_ssa=False, interprocedural=False,
+                 summary_cache: SummaryCache = None, phys_var_map: Dict = None):
         self.ast_to_cfg = ast_to_cfg
+        self.use_ssa = use_ssa
+        self.interprocedural = interprocedural
+        self.summary_cache = summary_cache
+        self.phys_var_map = phys_var_map
 
         if not self.ast_to_cfg.function_cfgs:
             self.ast_to_cfg.convert()
 
         self.function_cfgs = self.ast_to_cfg.function_cfgs
         self.dependency_graph = []
+        self.call_graph: CallGraph = None
+        self.summaries: Dict[FunctionCFG, FunctionSummary] = {}
+        self.function_graphs: Dict[FunctionCFG, DependencyGraph] = {}
+        self.statement_index = StatementIndex()
 
     def convert(self):
         """Returns dependency graphs for all function CFGs"""
-        dependency_graphs = [self._create_dependency_graph(c) for c in self.function_cfgs]
-        self.dependency_graph.extend(dependency_graphs)
+        if not self.interprocedural:
+            dependency_graphs = [self._create_dependency_graph(c) for c in self.function_cfgs]
+            self.dependency_graph.extend(dependency_graphs)
+            for d in dependency_graphs:
+                self.statement_index.add_graph(d)
+
+            return self.dependency_graph
+
+        self.call_graph = CallGraph(self.function_cfgs)
+        for cfg in self.call_graph.get_bottom_up_order():
+            self.function_graphs[cfg] = self._create_dependency_graph(cfg)
+            self.summaries[cfg] = self._get_function_summary(cfg, self.function_graphs[cfg])
+
+        if self.summary_cache:
+            self.summary_cache.save()
+
+        self.link_calls()
+        self.dependency_graph.extend(self.function_graphs[c] for c in self.function_cfgs)
+        for c in self.function_cfgs:
+            self.statement_index.add_graph(self.function_graphs[c])
 
         return self.dependency_graph
 
-    def _create_dependency_graph(self, cfg: FunctionCFG) -> List[DependencyNode]:
-        # Maps CFGNode to set of ReachDef which represent variables which are used to define other variables
-        # in CFGNode
-        node_dependency_mapping: Dict[CFGNode, Set[ReachDef]] = {}
-        def_use_pairs = create_def_use_pairs(cfg)
-        reach_definitions = create_reach_definitions(cfg, def_use_pairs)
+    def replace_statement(self, dependency_graph: DependencyGraph, cfgnode: CFGNode, token) -> Set[CFGNode]:
+        """DependencyGraph.replace_statement which also keeps statement_index and the links between
+        functions up to date
+        """
+        changed = dependency_graph.replace_statement(cfgnode, token, self.statement_index)
+        if self.interprocedural:
+            # The statement may call other functions now
+            self.call_graph = CallGraph(self.function_cfgs)
+            self.link_calls()
+
+        return changed
+
+    def link_calls(self):
+        """Links the graphs of functions at every call site. Definitions of the arguments get edges to
+        the callee's parameters and the callee's return statements get edges to the call. Definitions of
+        global variables reaching the end of a callee reach the nodes after the call, then definitions
+        reaching a call reach the callee.
+        """
+        variable_nodes: Dict[Tuple[CFGNode, Variable], List[DependencyNode]] = {}
+        for dependency_graph in self.function_graphs.values():
+            dependency_graph.call_reaching_defs = {}
+            for n in dependency_graph.nodes:
+                n.call_next.clear()
+                n.call_previous.clear()
+                variable_nodes.setdefault((n.cfgnode, n.variable), []).append(n)
+
+        def link(prev_n: DependencyNode, next_n: DependencyNode):
+            prev_n.call_next.add(next_n)
+            next_n.call_previous.add(prev_n)
+
+        def add_reaching_defs(dependency_graph: DependencyGraph, start_nodes: List[CFGNode], reach_def: Set[ReachDef]):
+            propagated = propagate_definitions(start_nodes, reach_def, dependency_graph.def_use_pairs)
+            for cfgnode, defs in propagated.items():
+                dependency_graph.call_reaching_defs.setdefault(cfgnode, set()).update(defs)
+
+        order = self.call_graph.get_bottom_up_order()
+        for cfg in order:
+            caller_graph = self.function_graphs[cfg]
+            for call_site in self.call_graph.call_sites[cfg]:
+                callee_graph = self.function_graphs[call_site.callee]
+                call_nodes = [n for n in caller_graph.nodes if n.cfgnode is call_site.cfgnode]
+
+                for return_node in callee_graph.nodes:
+                    if is_return_node(return_node.cfgnode):
+                        for call_node in call_nodes:
+                            link(return_node, call_node)
+
+                reach_def = caller_graph.get_reaching_defs(call_site.cfgnode)
+                parameters = call_site.callee.entry_block.function_arguments
+                for argument, parameter in zip(call_site.get_arguments(), parameters):
+                    argument_variables = set(get_vars_from_statement(get_statement_tokens(argument)))
+                    for r in reach_def:
+                        if r.variable not in argument_variables:
+                            continue
+
+                        for prev_n in variable_nodes.get((r.def_node, r.variable), []):
+                            for parameter_node in variable_nodes.get((call_site.callee.entry_block, parameter), []):
+                                link(prev_n, parameter_node)
+
+                callee_defs = set()
+                for n in call_site.callee.nodes:
+                    if n.get_type() == "exit":
+                        callee_defs.update(r for r in callee_graph.get_reaching_defs(n, interprocedural=True)
+                                           if is_global_variable(r.variable))
+                add_reaching_defs(caller_graph, list(call_site.cfgnode.next), callee_defs)
+
+        # Callers come before their callees, so definitions are passed down through every caller
+        for cfg in reversed(order):
+            caller_graph = self.function_graphs[cfg]
+            for call_site in self.call_graph.call_sites[cfg]:
+                caller_defs = {r for r in caller_graph.get_reaching_defs(call_site.cfgnode, interprocedural=True)
+                               if is_global_variable(r.variable)}
+                add_reaching_defs(self.function_graphs[call_site.callee], [call_site.callee.entry_block], caller_defs)
+
+    def _get_function_summary(self, cfg: FunctionCFG, dependency_graph: DependencyGraph) -> FunctionSummary:
+        """Gets summary from the cache if possible, otherwise creates it and adds it to the cache.
+        Argument units always come from this file's Phys output.
+        """
+        # Callees are summarized first, except recursive calls which are keyed by their own tokens
+        callee_keys = [self.summaries[c].key if c in self.summaries else get_function_key(c)
+                       for c in self.call_graph.get_callees(cfg)]
+        key = get_function_key(cfg, callee_keys)
 
-        # Get all variables which are used to define other variables in each node
-        for cur_node, reach_def in reach_definitions.items():
-            cur_def: Set[Variable] = def_use_pairs[cur_node].define
-            cur_use: Set[Variable] = def_use_pairs[cur_node].use
-            remove = set()
+        summary = self.summary_cache.get(key) if self.summary_cache else None
+        if summary is None:
+            summary = create_function_summary(cfg, dependency_graph, key=key)
+            if self.summary_cache:
+                self.summary_cache.put(summary)
+                summary = self.summary_cache.get(key)
 
-            if not (cur_use or cur_def):
-                continue
+        if self.phys_var_map is not None:
+            summary = attr.evolve(summary, argument_units=get_argument_units(cfg, self.phys_var_map))
 
-            for r in reach_def:
-                reach_var = r.variable
-                # If the variable is killed by the statement or if variable isn't used in statement
-                if reach_var in cur_def or reach_var not in cur_use:
-                    remove.add(r)
+        return summary
 
-            node_dependency_mapping[cur_node] = reach_definitions[cur_node].copy()
-            node_dependency_mapping[cur_node] -= remove
+    def _create_dependency_graph(self, cfg: FunctionCFG) -> List[DependencyNode]:
+        def_use_pairs = create_def_use_pairs(cfg)
+        ssa = None
 
-        cfg_dependency_node_mapping = {}  # Maps CFGNode to set of DependencyNodes
+        # Maps CFGNode to set of ReachDef which represent variables which are used to define other variables
+        # in CFGNode
+        node_dependency_mapping: Dict[CFGNode, Set[ReachDef]]
+        if self.use_ssa:
+            ssa = FunctionSSA(cfg, def_use_pairs)
+            reach_definitions = ReachDefQuery(cfg, def_use_pairs)
+            node_dependency_mapping = self._ssa_node_dependencies(cfg, ssa, def_use_pairs)
+        else:
+            reach_definitions = create_reach_definitions(cfg, def_use_pairs)
+            node_dependency_mapping = self._reach_node_dependencies(reach_definitions, def_use_pairs)
+
+        cfg_dependency_node_mapping = {}  # Maps (CFGNode, Variable) to set of DependencyNodes
         dependency_graph_nodes = []  # All DependencyNodes
-        # print([x.get_type() for x in node_dependency_mapping])
         # Create all nodes of dependency graph for all variables in each node
         for cur_node in node_dependency_mapping:
-            cfg_dependency_node_mapping[cur_node] = set()
-            cur_def = def_use_pairs[cur_node].define
-
-            if not cur_def:
-                d_node = DependencyNode(cur_node, None)
-                cfg_dependency_node_mapping[(cur_node, None)] = {d_node}
-                dependency_graph_nodes.append(d_node)
-
-            for def_var in cur_def:
-                if (cur_node, def_var) not in cfg_dependency_node_mapping:
-                    cfg_dependency_node_mapping[(cur_node, def_var)] = set()
-
-                d_node = DependencyNode(cur_node, def_var)
+            for d_node in create_dependency_nodes(def_use_pairs[cur_node]):
+                cfg_dependency_node_mapping.setdefault((cur_node, d_node.variable), set()).add(d_node)
                 dependency_graph_nodes.append(d_node)
-                cfg_dependency_node_mapping[(cur_node, def_var)].add(d_node)
 
         # Set previous and next nodes for all dependency nodes
         for d in dependency_graph_nodes:
@@ -235,11 +709,43 @@ class CFGToDependencyGraph:
                 for p in prev:
                     p.next.add(d)
 
+        live_variables = create_live_variables(cfg, def_use_pairs)
         dependency_graph = DependencyGraph(cfg, dependency_graph_nodes, reach_definitions,
-                                           def_use_pairs)
+                                           def_use_pairs, ssa, live_variables)
         # print([x.cfgnode.get_type() for x in dependency_graph_nodes])
         return dependency_graph
 
+    def _reach_node_dependencies(self, reach_definitions: Dict[CFGNode, Set[ReachDef]],
+                                 def_use_pairs: Dict[CFGNode, DefUsePair]) -> Dict[CFGNode, Set[ReachDef]]:
+        """Get all variables which are used to define other variables in each node"""
+        node_dependency_mapping: Dict[CFGNode, Set[ReachDef]] = {}
+
+        for cur_node, reach_def in reach_definitions.items():
+            if not (def_use_pairs[cur_node].use or def_use_pairs[cur_node].define):
+                continue
+
+            node_dependency_mapping[cur_node] = get_node_dependencies(reach_def, def_use_pairs[cur_node])
+
+        return node_dependency_mapping
+
+    def _ssa_node_dependencies(self, cfg: FunctionCFG, ssa: FunctionSSA,
+                               def_use_pairs: Dict[CFGNode, DefUsePair]) -> Dict[CFGNode, Set[ReachDef]]:
+        """Same as _reach_node_dependencies but only follows the SSA def-use chains of used variables"""
+        node_dependency_mapping: Dict[CFGNode, Set[ReachDef]] = {}
+
+        for cur_node in cfg.nodes:
+            cur_def: Set[Variable] = def_use_pairs[cur_node].define
+            cur_use: Set[Variable] = def_use_pairs[cur_node].use
+
+            if not (cur_use or cur_def):
+                continue
+
+            node_dependency_mapping[cur_node] = set()
+            for use_var in cur_use - cur_def:
+                node_dependency_mapping[cur_node].update(ssa.reaching_definitions(cur_node, use_var))
+
+        return node_dependency_mapping
+
 
 def main():
     test_path = "/home/rewong/physfix/tests/data_dependency_test/test_2.cpp.dump"
@@ -1,13 +1,15 @@
 from __future__ import annotations
 
 from collections import deque
-from typing import Dict, Set, Tuple
+from collections.abc import Mapping
+from typing import Dict, List, Set, Tuple
 
 import attr
 from physfix.parse.cpp_parser import Variable
 from physfix.parse.cpp_utils import (get_lhs_from_statement, get_rhs_from_statement,
                                      get_statement_tokens, get_vars_from_statement)
 from physfix.dataflow.ast_to_cfg import CFGNode, FunctionCFG
+from physfix.dataflow.worklist import Worklist
 
 #TODO: Everything here is based off of: http://www.cs.toronto.edu/~chechik/courses16/csc410/dataflowReadings.pdf
 
@@ -28,6 +30,31 @@ class DefUsePair:
 
         return def_use_dict
 
+
+def create_def_use_pair(cfgnode: CFGNode) -> DefUsePair:
+    """Finds the variables defined and used in a single cfg node"""
+    cur_type = cfgnode.get_type()
+    block_def_use = DefUsePair(cfgnode)
+
+    if cur_type == "entry":
+        block_def_use.define.update(cfgnode.function_arguments)
+    elif cur_type == "basic":
+        statement = get_statement_tokens(cfgnode.token)
+        lhs = get_lhs_from_statement(statement)
+        rhs = get_rhs_from_statement(statement)
+
+        if lhs:
+            block_def_use.define.update(get_vars_from_statement(lhs))
+        if rhs:
+            block_def_use.use.update(get_vars_from_statement(rhs))
+        else:
+            block_def_use.use.update(get_vars_from_statement(statement))
+    elif cur_type == "conditional":
+        block_def_use.use.update(get_vars_from_statement(get_statement_tokens(cfgnode.condition)))
+
+    return block_def_use
+
+
 def create_def_use_pairs(cfg: FunctionCFG) -> Dict[CFGNode, DefUsePair]:
     """Maps every node in CFG to a dictionary containing a def, use pair"""
     def_use_pairs = {}
@@ -40,35 +67,16 @@ def create_def_use_pairs(cfg: FunctionCFG) -> Dict[CFGNode, DefUsePair]:
         if cur in seen:
             continue
 
-        cur_type = cur.get_type()
-        block_def_use = DefUsePair(cur)
-
-        if cur_type == "entry":
-            block_def_use.define.update(cur.function_arguments)
-        elif cur_type == "basic":
-            statement = get_statement_tokens(cur.token)
-            lhs = get_lhs_from_statement(statement)
-            rhs = get_rhs_from_statement(statement)
-
-            if lhs:
-                block_def_use.define.update(get_vars_from_statement(lhs))
-            if rhs:
-                block_def_use.use.update(get_vars_from_statement(rhs))
-            else:
-                block_def_use.use.update(get_vars_from_statement(statement))
-        elif cur_type == "conditional":
-            block_def_use.use.update(get_vars_from_statement(get_statement_tokens(cur.condition)))
-
         for next_node in cur.next:
             queue.append(next_node)
 
         seen.add(cur)
-        def_use_pairs[cur] = block_def_use
+        def_use_pairs[cur] = create_def_use_pair(cur)
 
     return def_use_pairs
 
 
-@attr.s(eq=False)
+@attr.s(frozen=True)
 class ReachDef:
     """Data class of a variable dn the CFGNode which defines it"""
     def_node: CFGNode = attr.ib()
@@ -84,22 +92,47 @@ class ReachDef:
         return reach_def_dict
 
 
-def create_reach_definitions(cfg: FunctionCFG, 
-                             def_use_pairs: Dict[CFGNode, DefUsePair]) -> Dict[CFGNode, Set[ReachDef]]:
+def _transfer_reach(cur: CFGNode, reach_cur: Set[ReachDef], def_use_pairs: Dict[CFGNode, DefUsePair],
+                    reach_def_map: Dict[Tuple[CFGNode, Variable], ReachDef]) -> Set[ReachDef]:
+    """Applies the gen/kill sets of cur to the definitions reaching cur"""
+    if not def_use_pairs[cur].define:  # If nothing is defined then then kill and gen are empty sets
+        return reach_cur
+
+    gen: Set[ReachDef] = set()
+    kill: Set[Variable] = set()
+    for def_var in def_use_pairs[cur].define:
+        if (cur, def_var) not in reach_def_map:
+            reach_def_map[(cur, def_var)] = ReachDef(cur, def_var)
+        gen.add(reach_def_map[(cur, def_var)])
+        kill.add(def_var)
+
+    new_reach_out = gen
+    for reach_def in reach_cur:
+        if reach_def.variable not in kill:
+            new_reach_out.add(reach_def)
+
+    return new_reach_out
+
+
+def create_reach_definitions(cfg: FunctionCFG, def_use_pairs: Dict[CFGNode, DefUsePair],
+                             worklist: Worklist = None) -> Dict[CFGNode, Set[ReachDef]]:
     """Calculates variables that reach a node for all nodes in CFG. Returns a mapping 
-    between CFGNodes and ReachNodes.
+    between CFGNodes and ReachNodes. Nodes are processed in reverse postorder, pass in
+    a worklist to inspect how many times each node was processed.
     """
-    reach_def_map: Dict[Tuple(CFGNode, Variable), ReachDef] = {}
+    reach_def_map: Dict[Tuple[CFGNode, Variable], ReachDef] = {}
     reach_out: Dict[CFGNode, Set[ReachDef]] = {}
     reach: Dict[CFGNode, Set[ReachDef]] = {}
     for n in cfg.nodes:
         reach_out[n] = set()
         reach[n] = set()
 
-    queue = deque(cfg.nodes)
+    if worklist is None:
+        worklist = Worklist.forward(cfg)
+    worklist.extend(cfg.nodes)
 
-    while queue:
-        cur: CFGNode = queue.popleft()
+    while worklist:
+        cur: CFGNode = worklist.pop()
         old_reach_out: Set[ReachDef] = reach_out[cur]
 
         reach_cur = set()
@@ -107,30 +140,195 @@ def create_reach_definitions(cfg: FunctionCFG,
             reach_cur.update(reach_out[prev])
         reach[cur] = reach_cur
 
-        gen: Set[ReachDef] = set()
-        kill: Set[Variable] = set()
-        new_reach_out: Dict[CFGNode, Set[ReachDef]] = set()
-        if def_use_pairs[cur].define:
-            for def_var in def_use_pairs[cur].define:
-                if (cur, def_var) in reach_def_map:
-                    gen.add(reach_def_map[(cur, def_var)])
-                else:
-                    new_reach_def = ReachDef(cur, def_var)
-                    reach_def_map[(cur, def_var)] = new_reach_def
-                    gen.add(new_reach_def)
-                kill.add(def_var)
-
-            new_reach_out.update(gen)
-            for reach_def in reach[cur]:
-                variable = reach_def.variable
-                if variable not in kill:
-                    new_reach_out.add(reach_def)
-        else:  # If nothing is defined then then kill and gen are empty sets
-            new_reach_out = reach[cur]
-
+        new_reach_out = _transfer_reach(cur, reach_cur, def_use_pairs, reach_def_map)
         reach_out[cur] = new_reach_out
 
         if new_reach_out != old_reach_out:
-            queue.extend(cur.next)
+            worklist.extend(cur.next)
+
+    return reach
+
+
+def get_reachable_nodes(node: CFGNode) -> Set[CFGNode]:
+    """Returns node and every node reachable from it"""
+    reachable = {node}
+    stack = [node]
+    while stack:
+        cur = stack.pop()
+        for next_node in cur.next:
+            if next_node not in reachable:
+                reachable.add(next_node)
+                stack.append(next_node)
+
+    return reachable
+
+
+def propagate_definitions(start_nodes: List[CFGNode], definitions: Set[ReachDef],
+                          def_use_pairs: Dict[CFGNode, DefUsePair]) -> Dict[CFGNode, Set[ReachDef]]:
+    """Finds the nodes definitions from outside the function reach when entering it at start_nodes.
+    A definition stops at the nodes which define its variable again.
+    """
+    reach: Dict[CFGNode, Set[ReachDef]] = {}
+    for r in definitions:
+        seen = set(start_nodes)
+        stack = list(start_nodes)
+        while stack:
+            cur = stack.pop()
+            reach.setdefault(cur, set()).add(r)
+            if r.variable in def_use_pairs[cur].define:
+                continue
+
+            for next_node in cur.next:
+                if next_node not in seen:
+                    seen.add(next_node)
+                    stack.append(next_node)
+
+    return reach
+
 
-    return reach
\ No newline at end of file
+def update_reach_definitions(cfg: FunctionCFG, def_use_pairs: Dict[CFGNode, DefUsePair],
+                             reach: Dict[CFGNode, Set[ReachDef]], changed_node: CFGNode,
+                             worklist: Worklist = None) -> Set[CFGNode]:
+    """Updates reach in place after the def/use pair of changed_node has changed. Only the nodes
+    which changed_node can reach are solved again. Returns the nodes whose reaching definitions changed.
+    """
+    region = get_reachable_nodes(changed_node)
+
+    # Definitions leaving nodes outside of the region are unchanged
+    reach_def_map: Dict[Tuple[CFGNode, Variable], ReachDef] = {}
+    reach_out: Dict[CFGNode, Set[ReachDef]] = {}
+    for n in region:
+        reach_out[n] = set()
+        for prev in n.previous:
+            if prev not in region and prev not in reach_out:
+                reach_out[prev] = _transfer_reach(prev, reach[prev], def_use_pairs, reach_def_map)
+
+    if worklist is None:
+        worklist = Worklist.forward(cfg)
+    worklist.extend(region)
+
+    region_reach: Dict[CFGNode, Set[ReachDef]] = {}
+    while worklist:
+        cur = worklist.pop()
+
+        reach_cur = set()
+        for prev in cur.previous:
+            reach_cur.update(reach_out[prev])
+        region_reach[cur] = reach_cur
+
+        new_reach_out = _transfer_reach(cur, reach_cur, def_use_pairs, reach_def_map)
+        if new_reach_out != reach_out[cur]:
+            reach_out[cur] = new_reach_out
+            worklist.extend(n for n in cur.next if n in region)
+
+    changed = set()
+    for n, reach_n in region_reach.items():
+        if reach_n != reach[n]:
+            reach[n] = reach_n
+            changed.add(n)
+
+    return changed
+
+
+def create_live_variables(cfg: FunctionCFG, def_use_pairs: Dict[CFGNode, DefUsePair],
+                          worklist: Worklist = None) -> Dict[CFGNode, Set[Variable]]:
+    """Calculates the variables which are live on entry to each node in CFG, meaning they are
+    used in the node or in a later node before being redefined.
+    """
+    live: Dict[CFGNode, Set[Variable]] = {}
+    for n in cfg.nodes:
+        live[n] = set()
+
+    if worklist is None:
+        worklist = Worklist.backward(cfg)
+    worklist.extend(cfg.nodes)
+
+    while worklist:
+        cur: CFGNode = worklist.pop()
+
+        live_out: Set[Variable] = set()
+        for next_node in cur.next:
+            live_out.update(live.get(next_node, set()))
+
+        new_live = live_out - def_use_pairs[cur].define
+        new_live.update(def_use_pairs[cur].use)
+
+        if new_live != live[cur]:
+            live[cur] = new_live
+            worklist.extend(cur.previous)
+
+    return live
+
+
+class ReachDefQuery(Mapping):
+    """Demand driven reaching definitions. Querying a node only solves the nodes which can
+    reach it, and every solved node is memoized so later queries only solve what is new.
+    Can be used in place of the mapping returned by create_reach_definitions.
+    """
+    def __init__(self, cfg: FunctionCFG, def_use_pairs: Dict[CFGNode, DefUsePair] = None):
+        self.cfg = cfg
+        self.def_use_pairs = def_use_pairs if def_use_pairs is not None else create_def_use_pairs(cfg)
+        self.priorities = {n: idx for idx, n in enumerate(cfg.create_reverse_postorder())}
+
+        self.reach_def_map: Dict[Tuple[CFGNode, Variable], ReachDef] = {}
+        self.reach: Dict[CFGNode, Set[ReachDef]] = {}  # Only holds nodes which are fully solved
+        self.reach_out: Dict[CFGNode, Set[ReachDef]] = {}
+
+    def reaching_defs_at(self, node: CFGNode) -> Set[ReachDef]:
+        """Returns the definitions which reach node"""
+        if node in self.reach:
+            return self.reach[node]
+
+        # Find the unsolved nodes which can reach node, solved nodes are the boundary of the search
+        region = {node}
+        stack = [node]
+        while stack:
+            cur = stack.pop()
+            for prev in cur.previous:
+                if prev not in region and prev not in self.reach:
+                    region.add(prev)
+                    stack.append(prev)
+
+        region_reach: Dict[CFGNode, Set[ReachDef]] = {}
+        for n in region:
+            self.reach_out[n] = set()
+
+        worklist = Worklist(self.priorities)
+        worklist.extend(region)
+
+        while worklist:
+            cur = worklist.pop()
+
+            reach_cur = set()
+            for prev in cur.previous:
+                reach_cur.update(self.reach_out[prev])
+            region_reach[cur] = reach_cur
+
+            new_reach_out = _transfer_reach(cur, reach_cur, self.def_use_pairs, self.reach_def_map)
+            if new_reach_out != self.reach_out[cur]:
+                self.reach_out[cur] = new_reach_out
+                worklist.extend(n for n in cur.next if n in region)
+
+        self.reach.update(region_reach)
+
+        return self.reach[node]
+
+    def __getitem__(self, node: CFGNode) -> Set[ReachDef]:
+        return self.reaching_defs_at(node)
+
+    def __contains__(self, node) -> bool:
+        return node in self.priorities
+
+    def __iter__(self):
+        return iter(self.cfg.nodes)
+
+    def __len__(self):
+        return len(self.cfg.nodes)
+
+
+def reaching_defs_at(cfg: FunctionCFG, node: CFGNode,
+                     def_use_pairs: Dict[CFGNode, DefUsePair] = None) -> Set[ReachDef]:
+    """Calculates the variables which reach a single node without solving the whole CFG.
+    Use ReachDefQuery directly to memoize results between queries.
+    """
+    return ReachDefQuery(cfg, def_use_pairs).reaching_defs_at(node)
@@ -0,0 +1,252 @@
+"""Static single assignment form of function CFGs"""
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, List, Set
+
+import attr
+from physfix.parse.cpp_parser import Variable
+from physfix.dataflow.cfg_node import CFGNode, FunctionCFG
+from physfix.dataflow.reach_def import DefUsePair, ReachDef, create_def_use_pairs
+
+# Dominators are computed with "A Simple, Fast Dominance Algorithm" (Cooper, Harvey, Kennedy) and phis
+# are placed with the dominance frontier algorithm from Cytron et al.
+
+
+@attr.s(eq=False, repr=False)
+class SSAVariable:
+    """Single version of a variable. Version 0 is the value the variable has before any definition"""
+    variable: Variable = attr.ib()
+    version: int = attr.ib()
+    def_node: CFGNode = attr.ib(default=None)
+    phi: PhiFunction = attr.ib(default=None)
+    uses: List[CFGNode] = attr.ib(factory=list)  # Def-use chain
+
+    def __repr__(self):
+        return f"{self.variable.nameToken.str}_{self.version}"
+
+
+@attr.s(eq=False, repr=False)
+class PhiFunction:
+    """Merges the versions of a variable flowing into a node from each of its predecessors"""
+    node: CFGNode = attr.ib()
+    variable: Variable = attr.ib()
+    target: SSAVariable = attr.ib(default=None)
+    operands: Dict[CFGNode, SSAVariable] = attr.ib(factory=dict)
+
+    def __repr__(self):
+        return f"{self.target} = phi({', '.join(repr(o) for o in self.operands.values())})"
+
+
+class FunctionSSA:
+    """SSA form of a FunctionCFG. Only nodes reachable from the entry block are renamed"""
+    def __init__(self, cfg: FunctionCFG, def_use_pairs: Dict[CFGNode, DefUsePair] = None):
+        self.cfg = cfg
+        self.def_use_pairs = def_use_pairs if def_use_pairs is not None else create_def_use_pairs(cfg)
+
+        self.reverse_postorder = [n for n in cfg.create_reverse_postorder() if n in self.def_use_pairs]
+        self.order = {n: idx for idx, n in enumerate(self.reverse_postorder)}
+
+        self.idom: Dict[CFGNode, CFGNode] = {}
+        self.dominator_tree: Dict[CFGNode, List[CFGNode]] = {}
+        self.dominance_frontiers: Dict[CFGNode, Set[CFGNode]] = {}
+        self.phis: Dict[CFGNode, Dict[Variable, PhiFunction]] = {}
+        self.definitions: Dict[CFGNode, Dict[Variable, SSAVariable]] = {}
+        self.uses: Dict[CFGNode, Dict[Variable, SSAVariable]] = {}
+        self.versions: Dict[Variable, List[SSAVariable]] = {}
+
+        self._reach_cache: Dict[SSAVariable, Set[ReachDef]] = {}
+
+        self._create_dominator_tree()
+        self._create_dominance_frontiers()
+        self._place_phis()
+        self._rename()
+
+    def _predecessors(self, node: CFGNode) -> List[CFGNode]:
+        """Predecessors of node which are reachable from the entry block"""
+        return sorted((p for p in node.previous if p in self.order), key=self.order.get)
+
+    def _successors(self, node: CFGNode) -> List[CFGNode]:
+        """Successors of node which are reachable from the entry block"""
+        return sorted((n for n in node.next if n in self.order), key=self.order.get)
+
+    def _create_dominator_tree(self):
+        entry = self.cfg.entry_block
+        idom = {entry: entry}
+
+        def intersect(n1: CFGNode, n2: CFGNode) -> CFGNode:
+            while n1 != n2:
+                while self.order[n1] > self.order[n2]:
+                    n1 = idom[n1]
+                while self.order[n2] > self.order[n1]:
+                    n2 = idom[n2]
+            return n1
+
+        changed = True
+        while changed:
+            changed = False
+            for n in self.reverse_postorder[1:]:
+                processed = [p for p in self._predecessors(n) if p in idom]
+                new_idom = processed[0]
+                for p in processed[1:]:
+                    new_idom = intersect(p, new_idom)
+
+                if idom.get(n) != new_idom:
+                    idom[n] = new_idom
+                    changed = True
+
+        self.idom = idom
+        self.dominator_tree = {n: [] for n in self.reverse_postorder}
+        for n in self.reverse_postorder[1:]:
+            self.dominator_tree[idom[n]].append(n)
+
+    def _create_dominance_frontiers(self):
+        self.dominance_frontiers = {n: set() for n in self.reverse_postorder}
+
+        for n in self.reverse_postorder:
+            predecessors = self._predecessors(n)
+            if len(predecessors) < 2:
+                continue
+
+            for p in predecessors:
+                runner = p
+                while runner != self.idom[n]:
+                    self.dominance_frontiers[runner].add(n)
+                    runner = self.idom[runner]
+
+    def _place_phis(self):
+        self.phis = {n: {} for n in self.reverse_postorder}
+
+        def_sites: Dict[Variable, List[CFGNode]] = {}
+        for n in self.reverse_postorder:
+            for v in self.def_use_pairs[n].define:
+                def_sites.setdefault(v, []).append(n)
+
+        for v, sites in def_sites.items():
+            queue = deque(sites)
+            queued = set(sites)
+            while queue:
+                cur = queue.popleft()
+                for frontier in sorted(self.dominance_frontiers[cur], key=self.order.get):
+                    if v in self.phis[frontier]:
+                        continue
+
+                    self.phis[frontier][v] = PhiFunction(frontier, v)
+                    if frontier not in queued:
+                        queued.add(frontier)
+                        queue.append(frontier)
+
+    def _new_version(self, variable: Variable, def_node: CFGNode = None) -> SSAVariable:
+        versions = self.versions.setdefault(variable, [])
+        if not versions and def_node is not None:
+            versions.append(SSAVariable(variable, 0))
+
+        ssa_var = SSAVariable(variable, len(versions), def_node)
+        versions.append(ssa_var)
+
+        return ssa_var
+
+    def _rename(self):
+        stacks: Dict[Variable, List[SSAVariable]] = {}
+
+        def current(variable: Variable) -> SSAVariable:
+            if not stacks.get(variable):
+                if variable not in self.versions:
+                    self._new_version(variable)
+                return self.versions[variable][0]
+            return stacks[variable][-1]
+
+        # Iterative walk of the dominator tree so deep functions don't hit the recursion limit
+        walk = [(self.cfg.entry_block, False)]
+        pushed: Dict[CFGNode, List[Variable]] = {}
+        while walk:
+            n, exiting = walk.pop()
+
+            if exiting:
+                for v in pushed.pop(n):
+                    stacks[v].pop()
+                continue
+
+            pushed[n] = []
+            self.uses[n] = {}
+            self.definitions[n] = {}
+
+            for v, phi in self.phis[n].items():
+                phi.target = self._new_version(v, n)
+                phi.target.phi = phi
+                stacks.setdefault(v, []).append(phi.target)
+                pushed[n].append(v)
+
+            for v in self.def_use_pairs[n].use:
+                ssa_var = current(v)
+                ssa_var.uses.append(n)
+                self.uses[n][v] = ssa_var
+
+            for v in self.def_use_pairs[n].define:
+                ssa_var = self._new_version(v, n)
+                self.definitions[n][v] = ssa_var
+                stacks.setdefault(v, []).append(ssa_var)
+                pushed[n].append(v)
+
+            for next_node in self._successors(n):
+                for v, phi in self.phis[next_node].items():
+                    phi.operands[n] = current(v)
+
+            walk.append((n, True))
+            for child in reversed(self.dominator_tree[n]):
+                walk.append((child, False))
+
+    def resolve(self, ssa_var: SSAVariable) -> Set[ReachDef]:
+        """Follows phi functions back to the definitions which make up an SSA variable"""
+        if ssa_var in self._reach_cache:
+            return self._reach_cache[ssa_var]
+
+        reach_defs = set()
+        seen = set()
+        stack = [ssa_var]
+        while stack:
+            cur = stack.pop()
+            if cur in seen:
+                continue
+            seen.add(cur)
+
+            if cur.phi:
+                stack.extend(cur.phi.operands.values())
+            elif cur.def_node is not None:
+                reach_defs.add(ReachDef(cur.def_node, cur.variable))
+
+        self._reach_cache[ssa_var] = reach_defs
+
+        return reach_defs
+
+    def reaching_definitions(self, node: CFGNode, variable: Variable) -> Set[ReachDef]:
+        """Returns the definitions of a variable used in node which reach node"""
+        if variable not in self.uses.get(node, {}):
+            return set()
+
+        return self.resolve(self.uses[node][variable])
+
+    def reaching_defs_at(self, node: CFGNode) -> Set[ReachDef]:
+        """Returns the definitions of every variable which reach node, the same as the dense reaching
+        definitions. The version of each variable at node is found by walking up the dominator tree.
+        """
+        if node not in self.definitions:  # Not reachable from the entry block
+            return set()
+
+        versions: Dict[Variable, SSAVariable] = {}
+        for v, phi in self.phis[node].items():
+            versions.setdefault(v, phi.target)
+
+        cur = node
+        while cur is not self.idom[cur]:
+            cur = self.idom[cur]
+            for v, ssa_var in self.definitions[cur].items():
+                versions.setdefault(v, ssa_var)
+            for v, phi in self.phis[cur].items():
+                versions.setdefault(v, phi.target)
+
+        reach_defs = set()
+        for ssa_var in versions.values():
+            reach_defs.update(self.resolve(ssa_var))
+
+        return reach_defs
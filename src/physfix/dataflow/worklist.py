@@ -0,0 +1,62 @@
+"""Worklist for solving dataflow equations over a CFG"""
+from __future__ import annotations
+
+import heapq
+from typing import Dict, Iterable, List, Set, Tuple
+
+from physfix.dataflow.cfg_node import CFGNode, FunctionCFG
+
+
+class Worklist:
+    """Holds each CFGNode at most once and always pops the node with the lowest priority.
+    Also counts how many times each node has been popped so convergence can be checked.
+    """
+    def __init__(self, priorities: Dict[CFGNode, int]):
+        self.priorities = priorities
+        self.heap: List[Tuple[int, int, CFGNode]] = []
+        self.queued: Set[CFGNode] = set()
+        self.iteration_counts: Dict[CFGNode, int] = {}
+        self.iterations = 0
+        self._push_count = 0  # Breaks ties between nodes without a priority
+
+    @staticmethod
+    def forward(cfg: FunctionCFG) -> Worklist:
+        """Creates a worklist which pops nodes in reverse postorder"""
+        reverse_postorder = cfg.create_reverse_postorder()
+        return Worklist({n: idx for idx, n in enumerate(reverse_postorder)})
+
+    @staticmethod
+    def backward(cfg: FunctionCFG) -> Worklist:
+        """Creates a worklist which pops nodes in postorder, for analyses that flow backwards"""
+        reverse_postorder = cfg.create_reverse_postorder()
+        return Worklist({n: idx for idx, n in enumerate(reversed(reverse_postorder))})
+
+    def push(self, node: CFGNode) -> bool:
+        """Queues a node. Returns False if the node was already queued"""
+        if node in self.queued:
+            return False
+
+        priority = self.priorities.get(node, len(self.priorities))
+        heapq.heappush(self.heap, (priority, self._push_count, node))
+        self._push_count += 1
+        self.queued.add(node)
+
+        return True
+
+    def extend(self, nodes: Iterable[CFGNode]):
+        """Queues every node in nodes"""
+        for n in nodes:
+            self.push(n)
+
+    def pop(self) -> CFGNode:
+        """Removes and returns the queued node with the lowest priority"""
+        _, _, node = heapq.heappop(self.heap)
+        self.queued.remove(node)
+
+        self.iterations += 1
+        self.iteration_counts[node] = self.iteration_counts.get(node, 0) + 1
+
+        return node
+
+    def __len__(self):
+        return len(self.heap)
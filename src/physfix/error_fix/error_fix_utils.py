@@ -1,16 +1,21 @@
 from __future__ import annotations
 
 import json
-import uuid
-from collections import deque
-from typing import Dict, List, Set, Tuple, Union
+import math
+from fractions import Fraction
+from typing import Dict, Iterator, List, Mapping, Optional, Set, Tuple, Union
 
 import attr
-from physfix.parse.cpp_utils import get_root_token
 from physfix.dataflow.ast_to_cfg import CFGNode
-from physfix.dataflow.dependency_graph import DependencyGraph, DependencyNode
+from physfix.dataflow.dependency_graph import DependencyGraph, DependencyNode, StatementIndex
+from physfix.error_fix.expr_node import ExprNode
+from physfix.error_fix.phys_output import TokenUnitTable
+from physfix.error_fix.unit import Unit, to_probability, to_unit
+from physfix.error_fix.unit_search import SearchBudget, UnitSearchCache, search_unit_products
 from physfix.parse.cpp_parser import Token, Variable
-from physfix.parse.cpp_utils import get_statement_tokens
+
+# Probabilities are clamped to this before taking their log, for units Phys gave no chance
+MIN_PROBABILITY = 1e-9
 
 
 @attr.s(eq=False)
@@ -25,64 +30,65 @@ class Error:
     error_token = attr.ib(default=None)
 
     @staticmethod
-    def from_dict(phys_output_dict, dependency_graphs) -> List[Error]:
-        # print(output_dict)
+    def from_dict(phys_output_dict, dependency_graphs, statement_index: StatementIndex = None) -> List[Error]:
+        """Creates errors from Phys output. Pass the statement index from CFGToDependencyGraph
+        to avoid indexing the graphs again
+        """
         error_dict = phys_output_dict["errors"]
+        if statement_index is None:
+            statement_index = StatementIndex(dependency_graphs)
 
         error_objs = []
         for e in error_dict:
             e_obj = Error(e["root_token_id"], e["token_id"], e["error_type"])
 
-            for d in dependency_graphs:
-                for n in d.nodes:
-                    # TODO: Implies that addition/subtraction inconsistencies only happen in basic blocks, need to fix
-                    if n.cfgnode.get_type() == "basic":
-                        if n.cfgnode.token.Id == e_obj.root_token_id:
-                            e_obj.root_token = n.cfgnode.token
-                            e_obj.cfgnode = n.cfgnode
-                            e_obj.dependency_node = n
-                            e_obj.dependency_graph = d
-                            for t in get_statement_tokens(e_obj.root_token):
-                                if t.Id == e_obj.error_token_id:
-                                    e_obj.error_token = t
-                                    break
-                    elif n.cfgnode.get_type() == "conditional":
-                        conditional_root = get_root_token(n.cfgnode.condition)
-                        if conditional_root.Id == e_obj.root_token_id:
-                            e_obj.root_token = conditional_root.astOperand2
-                            e_obj.cfgnode = n.cfgnode
-                            e_obj.dependency_node = n
-                            e_obj.dependency_graph = d
-                            e_obj.error_token = e_obj.root_token
+            # TODO: Implies that addition/subtraction inconsistencies only happen in basic blocks, need to fix
+            statement = statement_index.get_statement(e_obj.root_token_id)
+            if statement:
+                e_obj.root_token = statement.root_token
+                e_obj.cfgnode = statement.cfgnode
+                e_obj.dependency_node = statement.dependency_nodes[-1]
+                e_obj.dependency_graph = statement.dependency_graph
+
+                if statement.cfgnode.get_type() == "conditional":
+                    e_obj.error_token = e_obj.root_token
+                else:
+                    e_obj.error_token = statement_index.get_token(e_obj.error_token_id)
 
             error_objs.append(e_obj)
 
         return error_objs
 
+
+def to_units(units: List) -> List[Unit]:
+    """Converts Phys units to Units"""
+    return [to_unit(u) for u in units]
+
+
 @attr.s()
 class PhysVar:
     var_name: str = attr.ib()
     var_id: str = attr.ib()
-    units: List[Dict] = attr.ib()  # Units sorted by likelihood by Phys
+    units: List[Unit] = attr.ib()  # Units sorted by likelihood by Phys
+    probabilities: List[float] = attr.ib(default=None)  # Probability of each unit, read from the Phys units if None
+
+    def __attrs_post_init__(self):
+        if self.probabilities is None:
+            self.probabilities = [to_probability(u) for u in self.units]
+        self.units = to_units(self.units)
+
+    def get_cost(self) -> float:
+        """-log of the probability of the most likely unit, so costs of a product of variables add up"""
+        probability = self.probabilities[0] if self.probabilities else 0.0
+        return -math.log(max(probability, MIN_PROBABILITY))
 
     @staticmethod
     def from_dict(phys_output_dict) -> List[PhysVar]:
-        # print(output_dict)
         var_dict = phys_output_dict["variables"]
 
         phys_var_objs = []
         for v in var_dict:
-            var_name = v["var_name"]
-            var_id = v["var_id"]
-
-            units = []
-            for u in v["units"]:
-                if isinstance(u, list):
-                    units.append(u[0])
-                elif isinstance(u, dict):
-                    units.append(u)
-
-            phys_var_objs.append(PhysVar(var_name, var_id, units))
+            phys_var_objs.append(PhysVar(v["var_name"], v["var_id"], v["units"]))
 
         return phys_var_objs
 
@@ -98,11 +104,28 @@ class PhysVar:
 @attr.s()
 class Change:
     token_to_fix: Token = attr.ib()
-    changes: List[Token] = attr.ib()
+    changes: List[ExprNode] = attr.ib()  # Use ExprNode.to_token to get a token tree
+    truncated: bool = attr.ib(default=False)  # The search ran out of budget, better changes may exist
+
+
+def get_token_unit_map(phys_output_dict) -> Mapping[str, Unit]:
+    """Maps token Ids to the units Phys gave them. Output from load_phys_output already has a
+    TokenUnitTable, which is returned as is.
+    """
+    if isinstance(phys_output_dict["token_units"], TokenUnitTable):
+        return phys_output_dict["token_units"]
 
+    return {token_id: to_unit(u) for token_id, u in phys_output_dict["token_units"].items()}
 
-def get_token_unit_map(phys_output_dict):
-    return phys_output_dict["token_units"] 
+
+def get_token_units(token: Token, phys_var_map: Dict[str, PhysVar], token_unit_map: Dict[str, Unit]) -> Optional[Unit]:
+    """Returns the most likely unit of a token, or None if Phys didn't give it a unit"""
+    if token.variable:
+        if token.variable.Id in phys_var_map and phys_var_map[token.variable.Id].units:
+            return phys_var_map[token.variable.Id].units[0]
+        return None
+
+    return token_unit_map.get(token.Id)
 
 
 def dependency_node_to_error_map(errors) -> Dict[Tuple[DependencyGraph, DependencyNode], Set[Error]]:
@@ -119,301 +142,163 @@ def dependency_node_to_error_map(errors) -> Dict[Tuple[DependencyGraph, Dependen
     return dependency_error_map
 
 
-def get_connected_errors(errors: List[Error]) -> List[Set[Error]]:
-    """Returns list of sets of errors which are connected in the dependency graph"""
-    dependency_error_map = dependency_node_to_error_map(errors)
-
-    connected_errors: List[Set[Error]] = []
-    seen = set()
+def get_connected_errors(errors: List[Error]) -> List[List[Error]]:
+    """Returns list of lists of errors which are connected in the dependency graph. Errors which
+    couldn't be matched to a dependency graph are left out.
+    """
+    connected_errors: Dict[Tuple[DependencyGraph, int], List[Error]] = {}
 
     for e in errors:
-        if (e.dependency_graph, e.dependency_node) in seen:
+        if not (e.dependency_graph and e.dependency_node):
             continue
 
-        q = deque()
-        q.append((e.dependency_graph, e.dependency_node))
-        connected = []
-        while q:
-            cur = q.pop()
-
-            if cur in seen:
-                continue
-
-            if not (cur[0] and cur[1]):
-                continue
-
-            connected.extend(dependency_error_map[cur])
-            seen.add(cur)
-
-            for n in cur[1].next:
-                if (cur[0], n) in dependency_error_map:
-                    q.append(dependency_error_map[(cur[0], n)])
-            for n in cur[1].previous:
-                if (cur[0], n) in dependency_error_map:
-                    q.append(dependency_error_map[(cur[0], n)])
-
-        connected_errors.append(connected)
-
-    return connected_errors
-
-def get_root_errors(connected_errors: Set[Error]):
-    dependency_error_map = dependency_node_to_error_map(list(connected_errors))
-    root_error = None
-
-    seen = set()
-    q = deque()
-    q.append(connected_errors[0].dependency_node)
-
-    dependency_graph = connected_errors[0].dependency_graph  # All nodes should be a part of the same graph
-    while q:
-        cur = q.pop()
-
-        if cur in seen:  # This means loop so we arbitrarily assign root error
-            root_error = connected_errors[0]
-            break
-
-        if (dependency_graph, cur) in dependency_error_map:
-            node_root_error = None
-
-            for e in dependency_error_map[(dependency_graph, cur)]:
-                if not node_root_error:
-                    node_root_error = e
-                else:
-                    if e.error_type != "VARIABLE_MULTIPLE_UNITS":
-                        node_root_error = e
-
-            root_error = node_root_error
-        
-        seen.add(cur)
-
-        if cur.previous:
-            q.extend(cur.previous)
-    
-    return root_error
-
-
-def multiply_units(u1: Dict[str, Union[int, float]], u2: Dict[str, Union[int, float]]):
-    new_unit = u1.copy()
-
-    for unit_name, unit_expt in u2.items():
-        if unit_name in new_unit:
-            new_unit[unit_name] += unit_expt
+        component = (e.dependency_graph, e.dependency_graph.get_component_id(e.dependency_node))
+        if component in connected_errors:
+            connected_errors[component].append(e)
         else:
-            new_unit[unit_name] = unit_expt
+            connected_errors[component] = [e]
 
-    return new_unit
+    return list(connected_errors.values())
 
 
-def divide_units(u1: Dict[str, Union[int, float]], u2: Dict[str, Union[int, float]]):
-    new_unit = u1.copy()
+def get_root_errors(connected_errors: List[Error]) -> Error:
+    """Returns the error furthest upstream in the dependency graph. Errors in the same strongly
+    connected component (a loop) are ordered by error type, then by their order in connected_errors.
+    """
+    def root_order(idx_error: Tuple[int, Error]):
+        idx, e = idx_error
+        return (e.dependency_graph.get_scc_id(e.dependency_node), e.error_type == "VARIABLE_MULTIPLE_UNITS", idx)
 
-    for unit_name, unit_expt in u2.items():
-        if unit_name in new_unit:
-            new_unit[unit_name] -= unit_expt
-        else:
-            new_unit[unit_name] = -1 * unit_expt
+    return min(enumerate(connected_errors), key=root_order)[1]
 
-    return new_unit
 
+def multiply_units(u1: Unit, u2: Unit) -> Unit:
+    return u1 * u2
 
-def expt_units(u1: Dict[str, Union[int, float]], power: Union[int, float]):
-    new_unit = u1.copy()
 
-    for unit_name in new_unit:
-        new_unit[unit_name] *= power
+def divide_units(u1: Unit, u2: Unit) -> Unit:
+    return u1 / u2
 
-    return new_unit
 
+def expt_units(u1: Unit, power: Union[int, float, Fraction]) -> Unit:
+    return u1 ** power
 
-def unit_diff(u1: Dict[str, Union[int, float]], u2: Dict[str, Union[int, float]]):
-    """Calculates the unit that u1 would have to be multiplied by to get u2"""
-    diff = {}
 
-    for unit_name, unit_expt in u2.items():
-        if unit_name in u1:
-            if unit_expt - u1[unit_name] != 0:
-                diff[unit_name] = unit_expt - u1[unit_name]
-        else:
-            diff[unit_name] = unit_expt
+def units_equal(u1: Unit, u2: Unit) -> bool:
+    """Units are interned so equal units are the same object"""
+    return u1 is u2
 
-    return diff
 
+def unit_diff(u1: Unit, u2: Unit) -> Unit:
+    """Calculates the unit that u1 would have to be multiplied by to get u2"""
+    return u2 / u1
 
-def inverse_unit(lhs_unit, token, phys_var_map: Dict[str, PhysVar], token_unit_map: Dict[str, Dict]):
-    error_correct_unit = lhs_unit
 
+def inverse_unit(lhs_unit: Unit, token, phys_var_map: Dict[str, PhysVar], token_unit_map: Dict[str, Unit]) -> Optional[Unit]:
+    """Returns the unit token needs for its statement to have lhs_unit. The operations between the
+    root and token are undone from the root down, since each one applies to the result of the ones
+    below it. Returns None if an operand along the way has no unit.
+    """
+    path = []
     cur = token
     while cur.astParent:
-        parent = cur.astParent
-        if parent.str == "*":
-            other_operand = parent.astOperand1 if parent.astOperand2 == cur else parent.astOperand1
-
-            if other_operand.variable:
-                error_correct_unit = multiply_units(error_correct_unit, phys_var_map[other_operand.Id].units)
-            else:
-                error_correct_unit = multiply_units(error_correct_unit, token_unit_map[other_operand.Id].units)
-        elif parent.str == "/":
-            other_operand = parent.astOperand1 if parent.astOperand2 == cur else parent.astOperand1
+        path.append((cur.astParent, cur))
+        cur = cur.astParent
 
-            if other_operand.variable:
-                error_correct_unit = divide_units(error_correct_unit, phys_var_map[other_operand.Id].units)
+    error_correct_unit = lhs_unit
+    for parent, child in reversed(path):
+        if parent.str in ["*", "/"]:
+            other_operand = parent.astOperand1 if parent.astOperand2 is child else parent.astOperand2
+            other_unit = get_token_units(other_operand, phys_var_map, token_unit_map) if other_operand else None
+            if other_unit is None:
+                return None
+
+            # Undo the operation of the parent to find the unit child needs
+            if parent.str == "*":
+                error_correct_unit = divide_units(error_correct_unit, other_unit)
+            elif parent.astOperand1 is child:
+                error_correct_unit = multiply_units(error_correct_unit, other_unit)
             else:
-                error_correct_unit = divide_units(error_correct_unit, token_unit_map[other_operand.Id].units)
-        elif parent.str == "(":
-            if parent.astOperand1.str == "sqrt":
+                error_correct_unit = divide_units(other_unit, error_correct_unit)
+        elif parent.str == "(" and parent.astOperand2 is child:
+            if parent.astOperand1 and parent.astOperand1.str == "sqrt":
                 error_correct_unit = expt_units(error_correct_unit, 2)
             # Maybe consider pow function in the future?
 
-        cur = parent
-    
     return error_correct_unit
 
 
-def make_arithmetic_token(arithmetic_op) -> Token:
-    new_token = Token(None)
-    new_token.str = arithmetic_op
-    new_token.Id = str(uuid.uuid4())
-    new_token.isArithmeticalOp = True
-    new_token.isOp = True
-
-    return new_token
-
-def copy_variable_token(var: Variable) -> Token:
-    new_token = Token(None)
-    new_token.str = var.nameToken.str
-    new_token.Id = str(uuid.uuid4())
-    new_token.varId = var.Id
-    new_token.variableId = var.Id
-    new_token.variable = var
-
-    return new_token
-
-
-def apply_unit_multiplication(token: Token, cur_unit: Dict, target_unit: Dict, phys_var_map, dependency_node, dependency_graph,
-                              depth=5):
-    """Given a token (t) with a current unit, attempt to transform t to have the target unit by 
-    applying the rules t -> t * x or t -> t / x, where x is a variable which reaches t
+def get_candidate_variables(dependency_node: DependencyNode, dependency_graph: DependencyGraph,
+                            phys_var_map: Dict[str, PhysVar], live_only=True) -> List[Variable]:
+    """Returns the variables with known units which reach a dependency node, including global variables
+    defined in callers and callees. With live_only, variables which are dead at the node (not used in it
+    or afterwards before being redefined) are left out.
     """
-    # token_unit_diff = unit_diff(target_unit, cur_unit)
-    reach_defs = dependency_graph.reach_definition[dependency_node.cfgnode]
-    candidate_change_tuples = []
-
-    q = []
-    q.append(([], [], cur_unit))  # Tuple of vars to multiply by, vars to divide by, and the current unit difference
-    # print(cur_unit, target_unit)
-    for _ in range(depth):
-        new_q = []
-        for mult_vars, div_vars, units in q:
-            if units == target_unit:
-                candidate_change_tuples.append((mult_vars, div_vars))
-
-            for r in reach_defs:
-                reach_var = r.variable
-
-                if reach_var.Id not in phys_var_map:
-                    continue
-                
-                reach_units = phys_var_map[reach_var.Id].units[0]
-
-                if not reach_units:
-                    continue
-                
-                if reach_var not in div_vars:
-                    multiplication_units = multiply_units(units, reach_units)
-                    new_q.append((mult_vars + [reach_var], div_vars, multiplication_units))
-
-                if reach_var not in mult_vars:
-                    division_units = divide_units(units, reach_units) 
-                    new_q.append((mult_vars, div_vars + [reach_var], division_units))
-        
-        q = new_q
-
-    # Change tuples into a list of tokens which can be made into a tree later
-    change_trees = []
-
-    # print(get_statement_tokens(token.copy()))
-    # print([x.str for x in get_statement_tokens(token.copy())])
-    for mult_vars, div_vars in candidate_change_tuples:
-        head = Token(None)
-        cur = head
-        for var in mult_vars:
-            mult_token = make_arithmetic_token("*")
-            mult_token.astParent = cur
-            mult_token.astParentId = cur.Id
-
-            var_token = copy_variable_token(var)
-            var_token.astParent = mult_token
-            var_token.astParentId = mult_token.Id
-
-            mult_token.astOperand1 = var_token
-            mult_token.astOperand1Id = var_token.Id
-
-            cur.astOperand2 = mult_token
-            cur.astOperand2Id = mult_token.Id
-            cur = cur.astOperand2
+    cfgnode = dependency_node.cfgnode
+    live_variables = None
+    if live_only and dependency_graph.live_variables is not None:
+        live_variables = dependency_graph.live_variables.get(cfgnode)
 
-        if not div_vars:
-            var_token = token.copy()
-            var_token.astParent = cur
-            var_token.astParentId = cur.Id
+    candidates = {}
+    for r in dependency_graph.get_reaching_defs(cfgnode, interprocedural=True):
+        reach_var = r.variable
 
-            cur.astOperand2 = var_token
-            cur.astOperand2Id = var_token.Id
+        if reach_var.Id not in phys_var_map or not phys_var_map[reach_var.Id].units:
+            continue
 
-            change_trees.append(head.astOperand2)
+        if not phys_var_map[reach_var.Id].units[0]:
             continue
 
-        new_div_vars = [token] + div_vars
-        for idx, var in enumerate(new_div_vars):
-            var_token = None
-            if idx == len(new_div_vars) - 2:
-                div_token = make_arithmetic_token("/")
-                div_token.astParent = cur
-                div_token.astParentId = cur.Id
-
-                var_token_1 = None
-                if isinstance(var, Variable):
-                    var_token_1 = copy_variable_token(var)
-                else:
-                    var_token_1 = var.copy()
+        if live_variables is not None and reach_var not in live_variables:
+            continue
 
-                var_token_1.astParent = div_token
-                var_token_1.astParentId = div_token.Id
+        candidates[reach_var.Id] = reach_var
 
-                var_token_2 = copy_variable_token(new_div_vars[idx + 1])
+    return sorted(candidates.values(), key=lambda v: (v.nameToken.str, v.Id))
 
-                var_token_2.astParent = div_token
-                var_token_2.astParentId = div_token.Id
 
-                div_token.astOperand1 = var_token_1
-                div_token.astOperand1Id = var_token_1.Id
+def create_change_tree(token: Token, mult_vars: List[Variable], div_vars: List[Variable]) -> ExprNode:
+    """Creates the expression mult_vars[0] * (mult_vars[1] * ... (token / div_vars[0] / div_vars[1] ...))"""
+    base = ExprNode.from_token(token)
+    for var in div_vars:
+        base = ExprNode.from_op("/", base, ExprNode.from_variable(var))
 
-                div_token.astOperand2 = var_token_2
-                div_token.astOperand2d = var_token_2.Id
+    for var in reversed(mult_vars):
+        base = ExprNode.from_op("*", ExprNode.from_variable(var), base)
 
-                cur.astOperand2 = div_token
-                cur.astOperand2Id = div_token.Id
-                break
+    return base
 
-            div_token = make_arithmetic_token("/")
-            div_token.astParent = cur
-            div_token.astParentId = cur.Id
 
-            if isinstance(var, Variable):
-                var_token = copy_variable_token(var)
-            else:
-                var_token = var.copy()
+def search_unit_changes(cur_unit: Unit, target_unit: Unit, phys_var_map, dependency_node, dependency_graph,
+                        depth=5, live_only=True, engine="python",
+                        search_cache: UnitSearchCache = None,
+                        budget: SearchBudget = None) -> Iterator[Tuple[List[Variable], List[Variable]]]:
+    """Lazily yields (variables to multiply by, variables to divide by) which turn cur_unit into
+    target_unit, using the fewest variables first (at most depth - 1), then the most likely changes by
+    the probabilities Phys gave the units of the variables. engine is "python" or "numpy", see unit_search.py. Pass a search_cache
+    to share searches between errors and a started budget to bound the search.
+    """
+    if cur_unit is None or target_unit is None:
+        return
 
-            var_token.astParent = div_token
-            var_token.astParentId = div_token.Id
+    candidate_vars = get_candidate_variables(dependency_node, dependency_graph, phys_var_map, live_only)
+    candidate_units = [phys_var_map[v.Id].units[0] for v in candidate_vars]
+    candidate_costs = [phys_var_map[v.Id].get_cost() for v in candidate_vars]
 
-            div_token.astOperand1 = var_token
-            div_token.astOperand1Id = var_token.Id
+    search = search_cache.search_unit_products if search_cache is not None else search_unit_products
+    for mult_idxs, div_idxs in search(cur_unit, target_unit, candidate_units, depth - 1, candidate_costs, engine,
+                                      budget):
+        yield [candidate_vars[i] for i in mult_idxs], [candidate_vars[i] for i in div_idxs]
 
-            cur.astOperand2 = div_token
-            cur.astOperand2Id = div_token.Id
-            cur = cur.astOperand2
-        
-        change_trees.append(head.astOperand2)
 
-    return change_trees
+def apply_unit_multiplication(token: Token, cur_unit: Unit, target_unit: Unit, phys_var_map, dependency_node, dependency_graph,
+                              depth=5, live_only=True, engine="python",
+                              search_cache: UnitSearchCache = None, budget: SearchBudget = None) -> Iterator[ExprNode]:
+    """Given a token (t) with a current unit, attempt to transform t to have the target unit by 
+    applying the rules t -> t * x or t -> t / x, where x is a variable which reaches t.
+    Lazily yields changes in the order of search_unit_changes, so only as many changes as are
+    consumed get built.
+    """
+    for mult_vars, div_vars in search_unit_changes(cur_unit, target_unit, phys_var_map, dependency_node,
+                                                   dependency_graph, depth, live_only, engine, search_cache, budget):
+        yield create_change_tree(token, mult_vars, div_vars)
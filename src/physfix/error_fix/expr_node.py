@@ -0,0 +1,83 @@
+"""Immutable expression trees for candidate changes. Candidates are only turned into cppcheck Tokens
+when they're applied or shown, since most candidates never are.
+"""
+from __future__ import annotations
+
+import uuid
+from typing import Tuple
+
+import attr
+from physfix.parse.cpp_parser import Token, Variable
+
+
+def make_arithmetic_token(arithmetic_op) -> Token:
+    new_token = Token(None)
+    new_token.str = arithmetic_op
+    new_token.Id = str(uuid.uuid4())
+    new_token.isArithmeticalOp = True
+    new_token.isOp = True
+
+    return new_token
+
+
+def copy_variable_token(var: Variable) -> Token:
+    new_token = Token(None)
+    new_token.str = var.nameToken.str
+    new_token.Id = str(uuid.uuid4())
+    new_token.varId = var.Id
+    new_token.variableId = var.Id
+    new_token.variable = var
+
+    return new_token
+
+
+@attr.s(frozen=True, slots=True, eq=False, repr=False)
+class ExprNode:
+    """Node of a candidate change. Either an operation with children, a variable, or an existing
+    token tree (the term being fixed) which is kept as is
+    """
+    op: str = attr.ib(default=None)
+    children: Tuple[ExprNode, ...] = attr.ib(default=())
+    variable: Variable = attr.ib(default=None)
+    token: Token = attr.ib(default=None)
+
+    @staticmethod
+    def from_variable(variable: Variable) -> ExprNode:
+        return ExprNode(variable=variable)
+
+    @staticmethod
+    def from_token(token: Token) -> ExprNode:
+        return ExprNode(token=token)
+
+    @staticmethod
+    def from_op(op: str, left: ExprNode, right: ExprNode) -> ExprNode:
+        return ExprNode(op, (left, right))
+
+    def to_token(self) -> Token:
+        """Creates a new token tree for the expression"""
+        if self.token is not None:
+            return self.token.copy()
+        elif self.variable is not None:
+            return copy_variable_token(self.variable)
+
+        op_token = make_arithmetic_token(self.op)
+        left, right = [c.to_token() for c in self.children]
+        for operand in [left, right]:
+            operand.astParent = op_token
+            operand.astParentId = op_token.Id
+
+        op_token.astOperand1 = left
+        op_token.astOperand1Id = left.Id
+        op_token.astOperand2 = right
+        op_token.astOperand2Id = right.Id
+
+        return op_token
+
+    def __repr__(self):
+        # Same format as Token.__repr__
+        if self.token is not None:
+            return repr(self.token)
+        elif self.variable is not None:
+            return self.variable.nameToken.str
+
+        return f"{repr(self.children[0])} {self.op} {repr(self.children[1])}"
@@ -1,15 +1,26 @@
 from __future__ import annotations
 
+from itertools import islice
 from typing import Dict
 
-from physfix.error_fix.error_fix_utils import (Change, Error, PhysVar, inverse_unit, apply_unit_multiplication)
+from physfix.error_fix.error_fix_utils import (Change, Error, PhysVar, inverse_unit, apply_unit_multiplication,
+                                               get_token_units)
+from physfix.error_fix.fixer_registry import register_fixer
+from physfix.error_fix.unit import Unit
+from physfix.error_fix.unit_inference import change_resolves_error
+from physfix.error_fix.unit_search import SearchBudget, UnitSearchCache
 from physfix.parse.cpp_utils import (get_statement_tokens,
                                      get_vars_from_statement, get_lhs_from_statement)
 
 
-def fix_addition_subtraction(error: Error, phys_var_map: Dict[str, PhysVar], token_unit_map: Dict[str, Dict],
-                             max_fixes=5):
-    """Make sure to run get_error_dependency_node on error before this"""
+@register_fixer("ADDITION_OF_INCOMPATIBLE_UNITS")
+def fix_addition_subtraction(error: Error, phys_var_map: Dict[str, PhysVar], token_unit_map: Dict[str, Unit],
+                             max_fixes=5, live_only=True, engine="python",
+                             search_cache: UnitSearchCache = None, budget: SearchBudget = None):
+    """Make sure to run get_error_dependency_node on error before this. budget limits the search
+    for this error, the change is marked truncated if it runs out.
+    """
+    budget = budget.start() if budget is not None else None
     error_tokens = get_statement_tokens(error.root_token)
     lhs_tokens = get_lhs_from_statement(error_tokens)
     
@@ -24,17 +35,8 @@ def fix_addition_subtraction(error: Error, phys_var_map: Dict[str, PhysVar], tok
     error_left_token = error_token.astOperand1
     error_right_token = error_token.astOperand2
     
-    error_left_unit = None
-    if error_left_token.variable:
-        error_left_unit = phys_var_map[error_left_token.variable.Id].units[0]
-    else:
-        error_left_unit = token_unit_map[error_left_token.Id]
-
-    error_right_unit = None
-    if error_right_token.variable:
-        error_right_unit = phys_var_map[error_right_token.variable.Id].units[0]
-    else:
-        error_right_unit = token_unit_map[error_right_token.Id]
+    error_left_unit = get_token_units(error_left_token, phys_var_map, token_unit_map)
+    error_right_unit = get_token_units(error_right_token, phys_var_map, token_unit_map)
 
     # Assumes that only one unit is incorrect
     token_to_fix = None
@@ -70,10 +72,16 @@ def fix_addition_subtraction(error: Error, phys_var_map: Dict[str, PhysVar], tok
     # TODO: This currently doesn't apply the rule a + b -> a * b
 
     candidate_changes = apply_unit_multiplication(token_to_fix, token_to_fix_unit, error_correct_unit, phys_var_map, 
-                                                  error.dependency_node, error.dependency_graph)[:max_fixes]
+                                                  error.dependency_node, error.dependency_graph,
+                                                  live_only=live_only, engine=engine, search_cache=search_cache,
+                                                  budget=budget)
+    # Drop candidates which still leave the statement inconsistent, stopping once there are enough
+    candidate_changes = list(islice((c for c in candidate_changes
+                                     if change_resolves_error(error.root_token, error_token, token_to_fix, c,
+                                                              phys_var_map, token_unit_map)), max_fixes))
     
     # Returns token to be replaced and all candidate replacements
-    return [Change(token_to_fix, candidate_changes)]
+    return [Change(token_to_fix, candidate_changes, truncated=budget is not None and budget.truncated)]
 
 
 if __name__ == "__main__":
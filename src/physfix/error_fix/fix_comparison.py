@@ -1,39 +1,52 @@
 from __future__ import annotations
 
+from itertools import islice
 from typing import Dict
 
-from physfix.error_fix.error_fix_utils import (Change, Error, PhysVar, inverse_unit, apply_unit_multiplication)
-from physfix.parse.cpp_utils import (get_statement_tokens,
-                                     get_vars_from_statement, get_lhs_from_statement)
+from physfix.error_fix.error_fix_utils import (Change, Error, PhysVar, create_change_tree, get_token_units,
+                                               search_unit_changes)
+from physfix.error_fix.fixer_registry import register_fixer
+from physfix.error_fix.unit import Unit
+from physfix.error_fix.unit_inference import change_resolves_error
+from physfix.error_fix.unit_search import RecordedSearch, SearchBudget, UnitSearchCache
 
 # TODO: I think there's something wrong in the process of creating these changes because some tokens are missing after applying the change to source code
-def fix_comparison(error: Error, phys_var_map: Dict[str, PhysVar], token_unit_map: Dict[str, Dict],
-                   max_fixes=5):
-    """Make sure to run get_error_dependency_node on error before this"""
-    error_tokens = get_statement_tokens(error.root_token)
+@register_fixer("COMPARISON_INCOMPATIBLE_UNITS")
+def fix_comparison(error: Error, phys_var_map: Dict[str, PhysVar], token_unit_map: Dict[str, Unit],
+                   max_fixes=5, live_only=True, engine="python",
+                   search_cache: UnitSearchCache = None, budget: SearchBudget = None):
+    """Make sure to run get_error_dependency_node on error before this. budget limits the search
+    for this error, the changes are marked truncated if it runs out.
+    """
+    budget = budget.start() if budget is not None else None
     lhs_token_root = error.error_token.astOperand1
     rhs_token_root = error.error_token.astOperand2
     
-    lhs_unit = None
-    if lhs_token_root.variable:
-        lhs_unit = phys_var_map[lhs_token_root.variable.Id].units[0]
-    else:
-        lhs_unit = token_unit_map[lhs_token_root.Id]
-
-    rhs_unit = None
-    if rhs_token_root.variable:
-        rhs_unit = phys_var_map[rhs_token_root.variable.Id].units[0]
-    else:
-        rhs_unit = token_unit_map[rhs_token_root.Id]
-
-    # Assumes that only one unit is incorrect
+    lhs_unit = get_token_units(lhs_token_root, phys_var_map, token_unit_map)
+    rhs_unit = get_token_units(rhs_token_root, phys_var_map, token_unit_map)
+
+    def resolves_error(token_to_fix, change):
+        return change_resolves_error(error.root_token, error.error_token, token_to_fix, change,
+                                     phys_var_map, token_unit_map)
+
+    # Assumes that only one unit is incorrect. Multiplying the lhs by x is the same as dividing the
+    # rhs by x, so one search gives the changes for both sides
+    solutions = RecordedSearch(search_unit_changes(lhs_unit, rhs_unit, phys_var_map,
+                                                   error.dependency_node, error.dependency_graph,
+                                                   live_only=live_only, engine=engine, search_cache=search_cache,
+                                                   budget=budget))
+    lhs_changes = (create_change_tree(lhs_token_root, mult_vars, div_vars) for mult_vars, div_vars in solutions)
+    rhs_changes = (create_change_tree(rhs_token_root, div_vars, mult_vars) for mult_vars, div_vars in solutions)
+
     changes = []
-    changes.append(Change(lhs_token_root, 
-                          apply_unit_multiplication(lhs_token_root, lhs_unit, rhs_unit, phys_var_map, 
-                                                    error.dependency_node, error.dependency_graph)[:max_fixes]))
-    changes.append(Change(rhs_token_root, 
-                          apply_unit_multiplication(rhs_token_root, rhs_unit, lhs_unit, phys_var_map, 
-                                                    error.dependency_node, error.dependency_graph)[:max_fixes]))
+    lhs_changes = (c for c in lhs_changes if resolves_error(lhs_token_root, c))
+    changes.append(Change(lhs_token_root, list(islice(lhs_changes, max_fixes))))
+    rhs_changes = (c for c in rhs_changes if resolves_error(rhs_token_root, c))
+    changes.append(Change(rhs_token_root, list(islice(rhs_changes, max_fixes))))
+
+    if budget is not None and budget.truncated:
+        for change in changes:
+            change.truncated = True
 
     # Returns token to be replaced and all candidate replacements
     return changes
@@ -0,0 +1,165 @@
+"""Registry of fixers by Phys error type, and a dispatcher which runs fixers for many errors in
+parallel. Workers are forked after the errors and graphs are stored in a module global, so the
+graphs are shared with every worker once instead of being pickled per error. Work is sent to the
+workers one dependency graph at a time so errors in the same function share a search cache.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from physfix.error_fix.error_fix_utils import Change, Error, PhysVar
+from physfix.error_fix.expr_node import ExprNode
+from physfix.error_fix.unit import Unit
+from physfix.parse.cpp_parser import Token, Variable
+from physfix.parse.cpp_utils import get_root_token, get_statement_tokens
+
+logger = logging.getLogger(__name__)
+
+# Maps Phys error types to functions taking (error, phys_var_map, token_unit_map, **kwargs) and
+# returning a list of Change. Fixers register themselves when their module is imported.
+FIXERS: Dict[str, Callable[..., List[Change]]] = {}
+
+# Set before the worker pool is forked, workers read errors and units from here
+_WORKER_STATE: Dict = {}
+
+
+def register_fixer(error_type: str):
+    """Decorator which registers a fixer for a Phys error type"""
+    def decorator(fixer):
+        FIXERS[error_type] = fixer
+        return fixer
+
+    return decorator
+
+
+def get_fixer(error_type: str) -> Optional[Callable[..., List[Change]]]:
+    return FIXERS.get(error_type)
+
+
+def run_fixer(error: Error, phys_var_map: Dict[str, PhysVar], token_unit_map: Dict[str, Unit],
+              **fixer_kwargs) -> Optional[List[Change]]:
+    """Runs the fixer registered for the type of error, returns None if there isn't one"""
+    fixer = get_fixer(error.error_type)
+    if fixer is None:
+        return None
+
+    return fixer(error, phys_var_map, token_unit_map, **fixer_kwargs)
+
+
+def encode_expr(expr: ExprNode) -> Tuple:
+    """Replaces tokens and variables in an expression with their Ids so it can be sent between processes"""
+    if expr.token is not None:
+        return ("token", expr.token.Id)
+    elif expr.variable is not None:
+        return ("variable", expr.variable.Id)
+
+    return (expr.op,) + tuple(encode_expr(c) for c in expr.children)
+
+
+def decode_expr(encoded: Tuple, tokens: Dict[str, Token], variables: Dict[str, Variable]) -> ExprNode:
+    if encoded[0] == "token":
+        return ExprNode.from_token(tokens[encoded[1]])
+    elif encoded[0] == "variable":
+        return ExprNode.from_variable(variables[encoded[1]])
+
+    return ExprNode(encoded[0], tuple(decode_expr(c, tokens, variables) for c in encoded[1:]))
+
+
+def encode_changes(changes: List[Change]) -> List[Tuple]:
+    return [(c.token_to_fix.Id, [encode_expr(e) for e in c.changes], c.truncated) for c in changes]
+
+
+def decode_changes(encoded_changes: List[Tuple], error: Error) -> List[Change]:
+    """Rebuilds changes for an error from the tokens of its statement and the variables reaching it"""
+    tokens = {t.Id: t for t in get_statement_tokens(get_root_token(error.error_token))}
+    variables = {r.variable.Id: r.variable
+                 for r in error.dependency_graph.get_reaching_defs(error.dependency_node.cfgnode, interprocedural=True)}
+
+    return [Change(tokens[token_id], [decode_expr(e, tokens, variables) for e in encoded_exprs], truncated)
+            for token_id, encoded_exprs, truncated in encoded_changes]
+
+
+def group_by_graph(errors: List[Error]) -> List[List[int]]:
+    """Groups the indices of errors by their dependency graph, in the order graphs first appear"""
+    groups: Dict[int, List[int]] = {}
+    for idx, error in enumerate(errors):
+        groups.setdefault(id(error.dependency_graph), []).append(idx)
+
+    return list(groups.values())
+
+
+def _fix_in_worker(error_idxs: List[int]) -> Tuple[List[Optional[List[Tuple]]], int, int]:
+    """Fixes the errors of one dependency graph, returns their encoded changes and the hits and misses
+    of the worker's search cache while fixing them
+    """
+    state = _WORKER_STATE
+    search_cache = state["fixer_kwargs"].get("search_cache")
+    hits, misses = (search_cache.hits, search_cache.misses) if search_cache is not None else (0, 0)
+
+    encoded_changes = []
+    for error_idx in error_idxs:
+        changes = run_fixer(state["errors"][error_idx], state["phys_var_map"], state["token_unit_map"],
+                            **state["fixer_kwargs"])
+        encoded_changes.append(encode_changes(changes) if changes is not None else None)
+
+    if search_cache is None:
+        return encoded_changes, 0, 0
+
+    return encoded_changes, search_cache.hits - hits, search_cache.misses - misses
+
+
+def dispatch_fixers(errors: List[Error], phys_var_map: Dict[str, PhysVar], token_unit_map: Dict[str, Unit],
+                    max_workers: int = None, **fixer_kwargs) -> List[Optional[List[Change]]]:
+    """Runs the registered fixer for every error, returning results in the same order as errors.
+    Errors are fixed in a pool of forked worker processes, falling back to fixing them one at a time
+    if there's only one worker or processes can't be started. A worker dying raises BrokenProcessPool.
+    Each dependency graph (function) is sent to one worker, so its errors share the worker's copy of
+    search_cache. The searches stay in the workers, only their hit and miss counts are added to
+    search_cache.
+    """
+    groups = group_by_graph(errors)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(groups))
+
+    if max_workers > 1:
+        try:
+            context = multiprocessing.get_context("fork")
+        except ValueError:  # Platforms without fork
+            context = None
+
+        if context is not None:
+            _WORKER_STATE.update(errors=errors, phys_var_map=phys_var_map, token_unit_map=token_unit_map,
+                                 fixer_kwargs=fixer_kwargs)
+            executor = ProcessPoolExecutor(max_workers, mp_context=context)
+            try:
+                # Workers are started when the work is submitted. A fixer crashing a worker raises
+                # BrokenProcessPool when the results are read, which isn't caught
+                group_futures = executor.map(_fix_in_worker, groups)
+            except OSError as e:
+                logger.warning("Couldn't start fixer workers, fixing errors one at a time: %s", e)
+                executor.shutdown()
+                _WORKER_STATE.clear()
+            else:
+                try:
+                    with executor:
+                        group_results = list(group_futures)
+                finally:
+                    _WORKER_STATE.clear()
+
+                encoded_results: List[Optional[List[Tuple]]] = [None] * len(errors)
+                search_cache = fixer_kwargs.get("search_cache")
+                for error_idxs, (encoded_changes, hits, misses) in zip(groups, group_results):
+                    for error_idx, encoded in zip(error_idxs, encoded_changes):
+                        encoded_results[error_idx] = encoded
+                    if search_cache is not None:
+                        search_cache.hits += hits
+                        search_cache.misses += misses
+
+                return [decode_changes(r, e) if r is not None else None for e, r in zip(errors, encoded_results)]
+
+    return [run_fixer(e, phys_var_map, token_unit_map, **fixer_kwargs) for e in errors]
@@ -0,0 +1,202 @@
+"""Loader for Phys output.json. The errors and variables sections are decoded as usual, but
+token_units, which has an entry for every token of the file, is only scanned. Token Ids are
+stored as integers in a sorted array and units are decoded the first time they're looked up.
+"""
+from __future__ import annotations
+
+import json
+import re
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from physfix.error_fix.unit import Unit, to_probability, to_unit
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_KEY = re.compile(r'[ \t\n\r]*"((?:[^"\\]|\\.)*)"[ \t\n\r]*:[ \t\n\r]*')
+# Phys units are either a unit dict or a [unit dict, probability] list, neither nests further
+_FLAT_VALUE = re.compile(r"\{[^{}]*\}|\[[^\[\]]*\]")
+_FLAT_ENTRY = re.compile(r'"([^"]*)"[ \t\n\r]*:[ \t\n\r]*(\{[^{}]*\}|\[[^\[\]]*\])[ \t\n\r]*,?[ \t\n\r]*')
+
+_DECODER = json.JSONDecoder()
+
+
+def parse_token_id(token_id: str) -> Optional[int]:
+    """Cppcheck token Ids are hex addresses such as 0x55d0, returns None for anything else. Only Ids
+    which hex() gives back unchanged are parsed, so iterating the table returns the original Ids.
+    """
+    if not token_id.startswith("0x"):
+        return None
+
+    try:
+        key = int(token_id, 16)
+    except ValueError:
+        return None
+
+    return key if hex(key) == token_id and key < 1 << 64 else None
+
+
+def _peek(text: str, pos: int) -> str:
+    """Returns the character at pos, raising ValueError instead of IndexError at the end of the text"""
+    if pos >= len(text):
+        raise ValueError(f"Unexpected end of Phys output at {pos}")
+
+    return text[pos]
+
+
+class TokenUnitTable(Mapping):
+    """Read-only map from token Id to Unit. Each token stores an 8 byte Id and a 4 byte index into
+    the distinct unit texts, which are decoded into Units on first lookup.
+    """
+    def __init__(self, token_ids: List[str] = (), unit_texts: List[str] = ()):
+        self.unit_texts: List[str] = []  # Distinct raw JSON units
+        self.units: List[Optional[Unit]] = []  # Decoded units by the same index, None until looked up
+        self.probabilities: List[Optional[float]] = []  # Probabilities Phys gave the units, None until looked up
+        self.other_units: Dict[str, int] = {}  # Ids which aren't hex, to unit index
+
+        unit_text_ids: Dict[str, int] = {}
+        entries = []
+        for token_id, text in zip(token_ids, unit_texts):
+            if text not in unit_text_ids:
+                unit_text_ids[text] = len(self.unit_texts)
+                self.unit_texts.append(text)
+                self.units.append(None)
+                self.probabilities.append(None)
+
+            key = parse_token_id(token_id)
+            if key is None:
+                self.other_units[token_id] = unit_text_ids[text]
+            else:
+                entries.append((key, unit_text_ids[text]))
+
+        entries.sort()
+        self.keys = array("Q", (k for k, _ in entries))
+        self.unit_ids = array("I", (u for _, u in entries))
+
+    def _decode(self, unit_id: int):
+        unit_json = json.loads(self.unit_texts[unit_id])
+        self.units[unit_id] = to_unit(unit_json)
+        self.probabilities[unit_id] = to_probability(unit_json)
+
+    def _get_unit(self, unit_id: int) -> Unit:
+        if self.units[unit_id] is None:
+            self._decode(unit_id)
+
+        return self.units[unit_id]
+
+    def get_probability(self, token_id: str) -> Optional[float]:
+        """Returns the probability Phys gave the unit of a token, or None if the token has no unit"""
+        unit_id = self._find(token_id)
+        if unit_id is None:
+            return None
+
+        if self.probabilities[unit_id] is None:
+            self._decode(unit_id)
+
+        return self.probabilities[unit_id]
+
+    def _find(self, token_id: str) -> Optional[int]:
+        """Returns the unit index of a token Id"""
+        key = parse_token_id(token_id) if isinstance(token_id, str) else None
+        if key is None:
+            return self.other_units.get(token_id)
+
+        idx = bisect_left(self.keys, key)
+        if idx < len(self.keys) and self.keys[idx] == key:
+            return self.unit_ids[idx]
+
+        return None
+
+    def __getitem__(self, token_id: str) -> Unit:
+        unit_id = self._find(token_id)
+        if unit_id is None:
+            raise KeyError(token_id)
+
+        return self._get_unit(unit_id)
+
+    def __contains__(self, token_id) -> bool:
+        return self._find(token_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        # Ids are given back in cppcheck's format, lowercase hex without leading zeros
+        for key in self.keys:
+            yield hex(key)
+        yield from self.other_units
+
+    def __len__(self) -> int:
+        return len(self.keys) + len(self.other_units)
+
+
+def _decode_key(key_match) -> str:
+    key = key_match.group(1)
+    return json.loads(f'"{key}"') if "\\" in key else key
+
+
+def _scan_token_units(text: str, pos: int) -> Tuple[TokenUnitTable, int]:
+    """Scans the token_units object starting at pos without decoding its values"""
+    if not text.startswith("{", pos):
+        raise ValueError(f"Expected token_units object at {pos}")
+    pos = _WHITESPACE.match(text, pos + 1).end()
+
+    token_ids, unit_texts = [], []
+    while _peek(text, pos) != "}":
+        # Most entries match in one go, anything else is decoded piece by piece
+        entry_match = _FLAT_ENTRY.match(text, pos)
+        if entry_match is not None and "\\" not in entry_match.group(1):
+            token_ids.append(entry_match.group(1))
+            unit_texts.append(entry_match.group(2))
+            pos = entry_match.end()
+            continue
+
+        key_match = _KEY.match(text, pos)
+        if key_match is None:
+            raise ValueError(f"Expected token Id at {pos}")
+        token_ids.append(_decode_key(key_match))
+        pos = key_match.end()
+
+        value_match = _FLAT_VALUE.match(text, pos)
+        if value_match is not None:
+            end = value_match.end()
+        else:
+            end = _DECODER.raw_decode(text, pos)[1]
+        unit_texts.append(text[pos:end])
+
+        pos = _WHITESPACE.match(text, end).end()
+        if _peek(text, pos) == ",":
+            pos = _WHITESPACE.match(text, pos + 1).end()
+
+    return TokenUnitTable(token_ids, unit_texts), pos + 1
+
+
+def loads_phys_output(text: str) -> Dict:
+    """Same as json.loads on Phys output, except token_units is a TokenUnitTable"""
+    pos = _WHITESPACE.match(text).end()
+    if not text.startswith("{", pos):
+        raise ValueError("Phys output should be a JSON object")
+    pos = _WHITESPACE.match(text, pos + 1).end()
+
+    output = {}
+    while _peek(text, pos) != "}":
+        key_match = _KEY.match(text, pos)
+        if key_match is None:
+            raise ValueError(f"Expected section name at {pos}")
+        pos = key_match.end()
+
+        section = _decode_key(key_match)
+        if section == "token_units":
+            output[section], pos = _scan_token_units(text, pos)
+        else:
+            output[section], pos = _DECODER.raw_decode(text, pos)
+
+        pos = _WHITESPACE.match(text, pos).end()
+        if _peek(text, pos) == ",":
+            pos = _WHITESPACE.match(text, pos + 1).end()
+
+    return output
+
+
+def load_phys_output(output_path: str) -> Dict:
+    """Loads Phys output.json, see loads_phys_output"""
+    with open(output_path) as f:
+        return loads_phys_output(f.read())
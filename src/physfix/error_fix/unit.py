@@ -0,0 +1,146 @@
+"""Interned units. A unit is a vector of exponents over a global registry of dimension names"""
+from __future__ import annotations
+
+import weakref
+from fractions import Fraction
+from functools import lru_cache
+from itertools import zip_longest
+from typing import Dict, List, Tuple, Union
+
+# Dimension names in the order they were first seen, exponent vectors are indexed by position
+_DIMENSIONS: List[str] = []
+_DIMENSION_IDS: Dict[str, int] = {}
+
+# Units are interned while they're in use, so the table doesn't grow with every unit a search visits
+_INTERNED: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+# Phys writes fractional exponents as floats, they're rounded to the nearest fraction with at most
+# this denominator so 0.333... is the same exponent as 1/3
+MAX_EXPONENT_DENOMINATOR = 1000
+
+# Products and quotients of the most recent pairs of units
+OPERATION_CACHE_SIZE = 4096
+
+
+def to_exponent(value: Union[int, float, Fraction]) -> Fraction:
+    """Converts an exponent to an exact fraction, rounding floats to the nearest simple fraction"""
+    if isinstance(value, float):
+        return Fraction(value).limit_denominator(MAX_EXPONENT_DENOMINATOR)
+
+    return Fraction(value)
+
+
+def get_dimension_id(name: str) -> int:
+    """Returns the position of a dimension in exponent vectors, registering it if it's new"""
+    if name not in _DIMENSION_IDS:
+        _DIMENSION_IDS[name] = len(_DIMENSIONS)
+        _DIMENSIONS.append(name)
+
+    return _DIMENSION_IDS[name]
+
+
+def get_dimensions() -> List[str]:
+    """Returns every registered dimension name"""
+    return list(_DIMENSIONS)
+
+
+class Unit:
+    """Immutable unit. Exponents are exact fractions and trailing zeros are trimmed, so equal units
+    have the same exponent tuple and are the same object. Units can be compared with == or is and
+    used as dict keys.
+    """
+    __slots__ = ("exponents", "__weakref__")
+
+    def __new__(cls, exponents: Tuple[Union[int, float, Fraction], ...] = ()):
+        exponents = [to_exponent(e) for e in exponents]
+        while exponents and exponents[-1] == 0:
+            exponents.pop()
+        exponents = tuple(exponents)
+
+        unit = _INTERNED.get(exponents)
+        if unit is None:
+            unit = super().__new__(cls)
+            object.__setattr__(unit, "exponents", exponents)
+            _INTERNED[exponents] = unit
+
+        return unit
+
+    @staticmethod
+    def from_dict(unit_dict: Dict[str, Union[int, float]]) -> Unit:
+        """Creates unit from a Phys unit dict such as {"meter": 1, "second": -2}"""
+        exponents = [Fraction(0)] * len(_DIMENSIONS)
+        for name, expt in unit_dict.items():
+            dimension_id = get_dimension_id(name)
+            if dimension_id >= len(exponents):
+                exponents.extend([Fraction(0)] * (dimension_id + 1 - len(exponents)))
+            exponents[dimension_id] = to_exponent(expt)
+
+        return Unit(tuple(exponents))
+
+    def to_dict(self) -> Dict[str, Union[int, float]]:
+        """Serializes unit to a Phys unit dict, leaving out zero exponents"""
+        unit_dict = {}
+        for name, expt in zip(_DIMENSIONS, self.exponents):
+            if expt != 0:
+                unit_dict[name] = int(expt) if expt.denominator == 1 else float(expt)
+
+        return unit_dict
+
+    def __mul__(self, other: Unit) -> Unit:
+        return _multiply(self, other)
+
+    def __truediv__(self, other: Unit) -> Unit:
+        return _divide(self, other)
+
+    def __pow__(self, power: Union[int, float, Fraction]) -> Unit:
+        power = to_exponent(power)
+        return Unit(tuple(e * power for e in self.exponents))
+
+    def __bool__(self):
+        """Dimensionless units are falsy, like the empty unit dicts Phys uses for them"""
+        return bool(self.exponents)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Unit is immutable")
+
+    def __reduce__(self):
+        # Dimension positions differ between processes, so pickle by name and intern again on load
+        return Unit.from_dict, (self.to_dict(),)
+
+    def __repr__(self):
+        return f"Unit({self.to_dict()})"
+
+
+@lru_cache(maxsize=OPERATION_CACHE_SIZE)
+def _multiply(a: Unit, b: Unit) -> Unit:
+    return Unit(tuple(x + y for x, y in zip_longest(a.exponents, b.exponents, fillvalue=0)))
+
+
+@lru_cache(maxsize=OPERATION_CACHE_SIZE)
+def _divide(a: Unit, b: Unit) -> Unit:
+    return Unit(tuple(x - y for x, y in zip_longest(a.exponents, b.exponents, fillvalue=0)))
+
+
+DIMENSIONLESS = Unit()
+
+
+def to_unit(unit: Union[Unit, Dict, List]) -> Unit:
+    """Converts a unit from Phys output into a Unit. Phys gives units either as a dict or as a
+    list whose first element is the dict
+    """
+    if isinstance(unit, Unit):
+        return unit
+    elif isinstance(unit, list):
+        return Unit.from_dict(unit[0])
+
+    return Unit.from_dict(unit)
+
+
+def to_probability(unit: Union[Unit, Dict, List]) -> float:
+    """Returns the probability Phys gave a unit in its output. Units given as a [unit dict, probability]
+    list carry their probability, units given without one are certain.
+    """
+    if isinstance(unit, list) and len(unit) > 1:
+        return float(unit[1])
+
+    return 1.0
@@ -0,0 +1,120 @@
+"""Forward unit propagation over token trees. Used to check candidate changes in memory
+instead of writing patches and rerunning Phys on them.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Union
+
+import attr
+from physfix.error_fix.error_fix_utils import (PhysVar, divide_units, expt_units, get_token_units,
+                                               multiply_units, units_equal)
+from physfix.error_fix.expr_node import ExprNode
+from physfix.error_fix.unit import DIMENSIONLESS, Unit
+from physfix.parse.cpp_parser import Token
+
+ADDITION_OPS = ["+", "-"]
+COMPARISON_OPS = ["<", ">", "<=", ">=", "==", "!="]
+ASSIGNMENT_OPS = ["=", "+=", "-="]
+
+
+@attr.s(eq=False)
+class UnitInference:
+    """Recomputes the units of a token tree from the units of its variables. Tokens in replacements
+    are swapped for their replacement (a token tree or an ExprNode) so a change can be checked
+    without modifying the tree.
+    A unit of None means the unit is unknown, which is compatible with any unit.
+    """
+    phys_var_map: Dict[str, PhysVar] = attr.ib()
+    token_unit_map: Dict[str, Unit] = attr.ib()
+    replacements: Dict[Token, Union[Token, ExprNode]] = attr.ib(factory=dict)
+    inconsistencies: List[Token] = attr.ib(factory=list)  # Tokens whose operands have different units
+
+    def infer(self, token: Token) -> Optional[Unit]:
+        """Returns the unit of token, recording any inconsistent operations found along the way"""
+        if not token:
+            return None
+
+        token = self.replacements.get(token, token)
+        if isinstance(token, ExprNode):
+            return self._infer_expr(token)
+
+        return self._infer_token(token)
+
+    def _infer_expr(self, expr: ExprNode) -> Optional[Unit]:
+        if expr.token is not None:
+            # The replaced term itself, which mustn't be replaced again
+            return self._infer_token(expr.token)
+        elif expr.variable is not None:
+            phys_var = self.phys_var_map.get(expr.variable.Id)
+            return phys_var.units[0] if phys_var and phys_var.units else None
+
+        left_unit, right_unit = [self._infer_expr(c) for c in expr.children]
+        if left_unit is None or right_unit is None:
+            return None
+
+        return multiply_units(left_unit, right_unit) if expr.op == "*" else divide_units(left_unit, right_unit)
+
+    def _infer_token(self, token: Token) -> Optional[Unit]:
+        if token.variable:
+            return get_token_units(token, self.phys_var_map, self.token_unit_map)
+        elif token.isNumber:
+            return None
+        elif token.str == "*" and token.astOperand2:
+            return self._combine(multiply_units, token)
+        elif token.str == "/":
+            return self._combine(divide_units, token)
+        elif token.str in ADDITION_OPS and token.astOperand2:
+            return self._check_same(token, self.infer(token.astOperand1), self.infer(token.astOperand2))
+        elif token.str in ADDITION_OPS:  # Unary minus/plus
+            return self.infer(token.astOperand1)
+        elif token.str in COMPARISON_OPS:
+            self._check_same(token, self.infer(token.astOperand1), self.infer(token.astOperand2))
+            return DIMENSIONLESS
+        elif token.str in ASSIGNMENT_OPS:
+            return self._check_same(token, self.infer(token.astOperand1), self.infer(token.astOperand2))
+        elif token.str == "(" and token.astOperand1 and token.astOperand1.str == "sqrt":
+            arg_unit = self.infer(token.astOperand2)
+            return expt_units(arg_unit, 0.5) if arg_unit is not None else None
+
+        # Anything else (function calls, member access, ...) keeps the unit Phys gave it, but its
+        # operands are still checked
+        if token.str == "(":
+            self.infer(token.astOperand2)
+        else:
+            self.infer(token.astOperand1)
+            self.infer(token.astOperand2)
+
+        return get_token_units(token, self.phys_var_map, self.token_unit_map)
+
+    def _combine(self, op, token: Token) -> Optional[Unit]:
+        # Constants scale a unit without changing it
+        left_unit = DIMENSIONLESS if token.astOperand1 and token.astOperand1.isNumber else self.infer(token.astOperand1)
+        right_unit = DIMENSIONLESS if token.astOperand2 and token.astOperand2.isNumber else self.infer(token.astOperand2)
+
+        if left_unit is None or right_unit is None:
+            return None
+
+        return op(left_unit, right_unit)
+
+    def _check_same(self, token: Token, left_unit: Optional[Unit], right_unit: Optional[Unit]) -> Optional[Unit]:
+        if left_unit is not None and right_unit is not None and not units_equal(left_unit, right_unit):
+            self.inconsistencies.append(token)
+
+        return left_unit if left_unit is not None else right_unit
+
+
+def change_resolves_error(root_token: Token, error_token: Token, token_to_fix: Token, change: Union[Token, ExprNode],
+                          phys_var_map: Dict[str, PhysVar], token_unit_map: Dict[str, Unit]) -> bool:
+    """Checks that replacing token_to_fix with change leaves no inconsistency at the error token
+    or at any operation above it in the statement
+    """
+    inference = UnitInference(phys_var_map, token_unit_map, {token_to_fix: change})
+    inference.infer(root_token)
+
+    error_path = set()
+    cur = error_token
+    while cur:
+        error_path.add(cur)
+        cur = cur.astParent
+
+    return not any(t in error_path for t in inference.inconsistencies)
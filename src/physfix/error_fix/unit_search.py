@@ -0,0 +1,475 @@
+"""Search for the variables to multiply or divide a term by so it has a target unit. Variables are
+treated as multisets, so a*b and b*a are the same candidate and each candidate is found once.
+"""
+from __future__ import annotations
+
+import time
+from functools import reduce
+from itertools import combinations_with_replacement
+from math import gcd
+from typing import Dict, Generator, Iterator, List, Optional, Sequence, Tuple
+
+import attr
+from physfix.error_fix.unit import DIMENSIONLESS, Unit
+
+try:
+    import numpy as np
+except ImportError:  # numpy is an optional dependency, only needed for the numpy engine
+    np = None
+
+# A pick is 2 * candidate index to multiply by the candidate or 2 * candidate index + 1 to divide by it.
+# Candidates are sorted tuples of picks, so they are unique and ordered lexicographically.
+Picks = Tuple[int, ...]
+
+MEET_IN_THE_MIDDLE_DEPTH = 3  # Searches for more variables than this meet in the middle
+TIME_CHECK_INTERVAL = 1024  # States expanded between checks of the clock
+
+
+@attr.s(eq=False)
+class SearchBudget:
+    """Limits on the wall-clock seconds and expanded states of one error's search, None is unlimited.
+    A search which runs out of budget stops with the candidates found so far and sets truncated.
+    """
+    max_seconds: float = attr.ib(default=None)
+    max_states: int = attr.ib(default=None)
+    states: int = attr.ib(default=0, init=False)
+    truncated: bool = attr.ib(default=False, init=False)
+    start_time: float = attr.ib(default=None, init=False)
+    _next_time_check: int = attr.ib(default=0, init=False, repr=False)
+
+    def start(self) -> SearchBudget:
+        """Returns an unused budget with the same limits whose clock starts now"""
+        budget = SearchBudget(self.max_seconds, self.max_states)
+        budget.start_time = time.monotonic()
+
+        return budget
+
+    def expand(self, states: int = 1) -> bool:
+        """Counts expanded states, returns False once the budget has run out"""
+        if self.truncated:
+            return False
+
+        self.states += states
+        if self.max_states is not None and self.states > self.max_states:
+            self.truncated = True
+        elif self.max_seconds is not None and self.states >= self._next_time_check:
+            self._next_time_check = self.states + TIME_CHECK_INTERVAL
+            if self.start_time is None:
+                self.start_time = time.monotonic()
+            elif time.monotonic() - self.start_time > self.max_seconds:
+                self.truncated = True
+
+        return not self.truncated
+
+
+def unit_norm(unit: Unit) -> float:
+    """Sum of the absolute exponents of a unit"""
+    return sum(abs(e) for e in unit.exponents)
+
+
+def has_conflict(picks: Picks) -> bool:
+    """Checks if a candidate both multiplies and divides by the same variable"""
+    return any(p % 2 == 1 and p - 1 in picks for p in picks)
+
+
+def get_pick_units(candidate_units: Sequence[Unit]) -> List[Unit]:
+    """Returns the unit each pick removes from the unit still needed"""
+    pick_units = []
+    for u in candidate_units:
+        pick_units.append(u)
+        pick_units.append(DIMENSIONLESS / u)
+
+    return pick_units
+
+
+class BudgetSlot:
+    """Holds the budget of whichever error is consuming a search. Shared searches are resumed by
+    different errors, so engines charge the budget in the slot when they expand states.
+    """
+    def __init__(self, budget: SearchBudget = None):
+        self.budget = budget
+
+    def expand(self, states: int = 1) -> bool:
+        return self.budget is None or self.budget.expand(states)
+
+
+# Level steps are generators which yield the candidates found so far whenever the budget in their
+# slot runs out, continue when resumed, and return the complete level.
+LevelSteps = Generator[List[Picks], None, List[Picks]]
+
+
+def _finish(steps: Generator):
+    """Runs steps with an unlimited budget to completion"""
+    try:
+        while True:
+            next(steps)
+    except StopIteration as e:
+        return e.value
+
+
+def _depth_first_level_steps(needed: Unit, pick_units: List[Unit], size: int, max_norm: float,
+                             slot: BudgetSlot) -> LevelSteps:
+    """Extends candidates one pick at a time up to size picks, pruning candidates whose remaining
+    unit is further from dimensionless than the remaining picks could cover. The depth first search
+    uses an explicit stack so it can pause anywhere.
+    """
+    level: List[Picks] = []
+
+    # (picks, smallest next pick, unit still needed), popped in lexicographic order
+    stack = [((), 0, needed)]
+    while stack:
+        while not slot.expand():
+            yield list(level)
+
+        picks, start, remaining = stack.pop()
+        slots = size - len(picks)
+        if slots == 0:
+            if remaining is DIMENSIONLESS:
+                level.append(picks)
+            continue
+
+        if unit_norm(remaining) > slots * max_norm:
+            continue
+
+        for p in range(len(pick_units) - 1, start - 1, -1):
+            # Picks are sorted so the multiplication of a variable comes right before its division
+            if p % 2 == 1 and picks and picks[-1] == p - 1:
+                continue
+
+            stack.append((picks + (p,), p, remaining / pick_units[p]))
+
+    return level
+
+
+def _depth_first_level(needed: Unit, pick_units: List[Unit], size: int, max_norm: float) -> List[Picks]:
+    return _finish(_depth_first_level_steps(needed, pick_units, size, max_norm, BudgetSlot()))
+
+
+def _half_states_steps(pick_units: List[Unit], size: int,
+                       slot: BudgetSlot) -> Generator[List[Picks], None, Dict[Unit, List[Picks]]]:
+    """Groups every candidate with size picks by the unit it removes"""
+    half_states: Dict[Unit, List[Picks]] = {}
+    for picks in combinations_with_replacement(range(len(pick_units)), size):
+        while not slot.expand():
+            yield []
+
+        if has_conflict(picks):
+            continue
+
+        unit = DIMENSIONLESS
+        for p in picks:
+            unit = unit * pick_units[p]
+        half_states.setdefault(unit, []).append(picks)
+
+    return half_states
+
+
+def _meet_in_the_middle_level_steps(needed: Unit, pick_units: List[Unit], size: int,
+                                    half_states: Dict[int, Dict[Unit, List[Picks]]], slot: BudgetSlot) -> LevelSteps:
+    """Finds candidates by joining two halves with matching units instead of enumerating whole
+    candidates. half_states is filled in as needed and can be shared between sizes.
+    """
+    left_size = size // 2
+    right_size = size - left_size
+    for half_size in [left_size, right_size]:
+        if half_size not in half_states:
+            half_states[half_size] = yield from _half_states_steps(pick_units, half_size, slot)
+
+    found = set()
+    for left_unit, left_picks in half_states[left_size].items():
+        for right_picks in half_states[right_size].get(needed / left_unit, []):
+            while not slot.expand(len(left_picks)):
+                yield sorted(found)
+
+            for picks in left_picks:
+                merged = tuple(sorted(picks + right_picks))
+                if not has_conflict(merged):
+                    found.add(merged)
+
+    return sorted(found)
+
+
+def _meet_in_the_middle_level(needed: Unit, pick_units: List[Unit], size: int,
+                              half_states: Dict[int, Dict[Unit, List[Picks]]]) -> List[Picks]:
+    return _finish(_meet_in_the_middle_level_steps(needed, pick_units, size, half_states, BudgetSlot()))
+
+
+def _to_exponent_matrix(units: List[Unit]):
+    """Stacks exponent vectors into an integer matrix, scaling fractional exponents by their
+    common denominator so comparisons are exact
+    """
+    denominators = [e.denominator for u in units for e in u.exponents]
+    scale = reduce(lambda a, b: a * b // gcd(a, b), denominators, 1)
+    num_dimensions = max((len(u.exponents) for u in units), default=0)
+
+    matrix = np.zeros((len(units), num_dimensions), dtype=np.int64)
+    for i, u in enumerate(units):
+        for j, e in enumerate(u.exponents):
+            matrix[i, j] = int(e * scale)
+
+    return matrix
+
+
+def _iter_numpy_level_steps(needed: Unit, pick_units: List[Unit], max_vars: int, slot: BudgetSlot,
+                            batch_size: int = 4096) -> Iterator[Tuple[List[Picks], bool]]:
+    """Same as the python engine but extends every candidate of a level at once. Candidates are rows
+    of pick indices and their units are summed exponent vectors, so matching the needed unit and
+    pruning by L1 distance are array operations.
+    """
+    matrix = _to_exponent_matrix([needed] + pick_units)
+    needed_vector, pick_matrix = matrix[0], matrix[1:]
+    max_norm = np.abs(pick_matrix).sum(axis=1).max() if len(pick_units) else 0
+    num_picks = len(pick_units)
+
+    def get_matches(picks, sums) -> List[Picks]:
+        matches = np.all(sums == needed_vector, axis=1)
+        return [tuple(int(p) for p in row) for row in picks[matches]]
+
+    # Candidates of the current size in lexicographic order and the exponents they remove
+    picks = np.zeros((1, 0), dtype=np.int64)
+    sums = np.zeros((1, len(needed_vector)), dtype=np.int64)
+
+    for size in range(max_vars + 1):
+        if size > 0:
+            new_picks, new_sums = [], []
+            for start in range(0, len(picks), batch_size):
+                batch_picks, batch_sums = picks[start:start + batch_size], sums[start:start + batch_size]
+
+                # Extend each row with every pick at least as large as its last pick
+                last = batch_picks[:, -1] if size > 1 else np.zeros(len(batch_picks), dtype=np.int64)
+                counts = num_picks - last
+                while not slot.expand(int(counts.sum())):
+                    yield [m for p, s in zip(new_picks, new_sums) for m in get_matches(p, s)], False
+
+                rows = np.repeat(np.arange(len(batch_picks)), counts)
+                offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                next_picks = last[rows] + offsets
+
+                extended = np.hstack([batch_picks[rows], next_picks[:, None]])
+                extended_sums = batch_sums[rows] + pick_matrix[next_picks]
+
+                # Multiplying and dividing by the same variable, the division always directly follows
+                keep = np.ones(len(rows), dtype=bool)
+                if size > 1:
+                    keep &= ~((next_picks % 2 == 1) & (last[rows] == next_picks - 1))
+
+                # Prune candidates too far from the needed unit for the picks left
+                remaining_norm = np.abs(needed_vector - extended_sums).sum(axis=1)
+                keep &= remaining_norm <= (max_vars - size) * max_norm
+
+                new_picks.append(extended[keep])
+                new_sums.append(extended_sums[keep])
+
+            picks = np.vstack(new_picks) if new_picks else np.zeros((0, size), dtype=np.int64)
+            sums = np.vstack(new_sums) if new_sums else np.zeros((0, len(needed_vector)), dtype=np.int64)
+
+        yield get_matches(picks, sums), True
+
+
+def _iter_level_steps(needed: Unit, pick_units: List[Unit], max_vars: int, engine: str,
+                      slot: BudgetSlot) -> Iterator[Tuple[List[Picks], bool]]:
+    """Yields (candidates, complete) for 0, 1, ... max_vars picks, each level sorted lexicographically.
+    When the budget in slot runs out, the candidates found so far in the level are yielded with
+    complete False and the level continues if the iterator is resumed.
+    """
+    def drive(steps: LevelSteps):
+        while True:
+            try:
+                partial = next(steps)
+            except StopIteration as e:
+                return e.value
+            yield partial, False
+
+    if engine == "numpy":
+        if np is None:
+            raise ImportError("The numpy unit search engine requires numpy, install physfix[numpy]")
+        yield from _iter_numpy_level_steps(needed, pick_units, max_vars, slot)
+    elif max_vars > MEET_IN_THE_MIDDLE_DEPTH:
+        half_states: Dict[int, Dict[Unit, List[Picks]]] = {}
+        for size in range(max_vars + 1):
+            level = yield from drive(_meet_in_the_middle_level_steps(needed, pick_units, size, half_states, slot))
+            yield level, True
+    else:
+        max_norm = max((unit_norm(u) for u in pick_units), default=0)
+        for size in range(max_vars + 1):
+            level = yield from drive(_depth_first_level_steps(needed, pick_units, size, max_norm, slot))
+            yield level, True
+
+
+def iter_levels(needed: Unit, pick_units: List[Unit], max_vars: int, engine: str = "python",
+                budget: SearchBudget = None) -> Iterator[List[Picks]]:
+    """Yields the candidates with 0, 1, ... max_vars picks, each level sorted lexicographically.
+    Levels are only searched when they're reached. The numpy engine gives the same results.
+    If the budget runs out, the level being searched is yielded with the candidates found so far
+    and no more levels are searched.
+    """
+    for level, complete in _iter_level_steps(needed, pick_units, max_vars, engine, BudgetSlot(budget)):
+        yield level
+        if not complete:
+            return
+
+
+Result = Tuple[List[int], List[int]]
+
+
+def _iter_search_steps(cur_unit: Unit, target_unit: Unit, candidate_units: Sequence[Unit], max_vars: int,
+                       candidate_costs: Optional[Sequence[float]], engine: str,
+                       slot: BudgetSlot) -> Iterator[Tuple[List[Result], bool]]:
+    """search_unit_products a level at a time, yields (results, complete) like _iter_level_steps"""
+    needed = target_unit / cur_unit
+    pick_units = get_pick_units(candidate_units)
+
+    for level, complete in _iter_level_steps(needed, pick_units, max_vars, engine, slot):
+        if candidate_costs is not None:
+            level = sorted(level, key=lambda picks: sum(candidate_costs[p // 2] for p in picks))
+
+        yield [([p // 2 for p in picks if p % 2 == 0], [p // 2 for p in picks if p % 2 == 1]) for picks in level], complete
+
+
+def search_unit_products(cur_unit: Unit, target_unit: Unit, candidate_units: Sequence[Unit], max_vars: int,
+                         candidate_costs: Sequence[float] = None, engine: str = "python",
+                         budget: SearchBudget = None) -> Iterator[Result]:
+    """Lazily finds every multiset of at most max_vars candidates which, multiplied or divided onto
+    cur_unit, gives target_unit. Yields (indices to multiply by, indices to divide by) tuples with the
+    fewest variables first. Ties are broken by the summed candidate_costs, then lexicographically.
+    Costs such as -log(probability) make the most likely products come first. engine is "python" or
+    "numpy". Pass a started budget to stop early, see SearchBudget.
+    """
+    for results, complete in _iter_search_steps(cur_unit, target_unit, candidate_units, max_vars, candidate_costs,
+                                                engine, BudgetSlot(budget)):
+        yield from results
+        if not complete:
+            return
+
+
+class RecordedSearch:
+    """Records the results of a search generator so it can be iterated again. Iterating past the
+    recorded results continues the original search.
+    """
+    def __init__(self, search: Iterator[Tuple[List, List]]):
+        self.search = search
+        self.results: List[Tuple[List, List]] = []
+        self.done = False
+
+    def __iter__(self) -> Iterator[Tuple[List, List]]:
+        idx = 0
+        while True:
+            if idx < len(self.results):
+                yield self.results[idx]
+                idx += 1
+                continue
+
+            if self.done:
+                return
+
+            try:
+                self.results.append(next(self.search))
+            except StopIteration:
+                self.done = True
+
+
+class SharedSearch:
+    """A search shared by errors. Complete levels are recorded and replayed for free, and each error
+    pays for the part of the search it runs with its own budget. An error which runs out of budget in
+    the middle of a level gets the results found so far, the next error continues the level.
+    """
+    def __init__(self, cur_unit: Unit, target_unit: Unit, candidate_units: Sequence[Unit], max_vars: int,
+                 candidate_costs: Sequence[float] = None, engine: str = "python"):
+        self.slot = BudgetSlot()
+        self.steps = _iter_search_steps(cur_unit, target_unit, candidate_units, max_vars, candidate_costs,
+                                        engine, self.slot)
+        self.levels: List[List[Result]] = []
+        self.done = False
+
+    def iter_levels(self, budget: SearchBudget = None) -> Iterator[Tuple[List[Result], bool]]:
+        """Yields (results, complete) a level at a time like _iter_search_steps, stopping after an
+        incomplete level
+        """
+        idx = 0
+        while True:
+            if idx < len(self.levels):
+                yield self.levels[idx], True
+                idx += 1
+                continue
+
+            if self.done:
+                return
+
+            self.slot.budget = budget
+            try:
+                results, complete = next(self.steps)
+            except StopIteration:
+                self.done = True
+                continue
+            finally:
+                self.slot.budget = None
+
+            if complete:
+                self.levels.append(results)
+            else:
+                # Partial levels aren't recorded, the error which finishes the level records all of it
+                yield results, False
+                return
+
+
+def get_canonical_order(candidate_units: Sequence[Unit], candidate_costs: Optional[Sequence[float]]) -> List[int]:
+    """Returns the candidate indices sorted by unit and cost. Searches only depend on the multiset of
+    candidates, so errors whose variables are in a different order can share a search.
+    """
+    def key(idx):
+        return candidate_units[idx].exponents, candidate_costs[idx] if candidate_costs is not None else 0
+
+    return sorted(range(len(candidate_units)), key=key)
+
+
+class UnitSearchCache:
+    """Shares searches between errors with the same candidate units. Errors in the same function
+    usually have the same reaching variables, so a file's searches are only done once. Searches only
+    depend on the unit still needed (target unit / current unit) and the multiset of candidate units
+    and costs, which is what they're keyed by. Each error pays for the part of a shared search it
+    runs with its own budget, see SharedSearch.
+    """
+    def __init__(self):
+        self.searches: Dict[Tuple, SharedSearch] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def search_unit_products(self, cur_unit: Unit, target_unit: Unit, candidate_units: Sequence[Unit], max_vars: int,
+                             candidate_costs: Sequence[float] = None,
+                             engine: str = "python",
+                             budget: SearchBudget = None) -> Iterator[Result]:
+        """Same as search_unit_products, replaying the results of an earlier identical search"""
+        needed = target_unit / cur_unit
+        order = get_canonical_order(candidate_units, candidate_costs)
+        units = tuple(candidate_units[i] for i in order)
+        costs = tuple(candidate_costs[i] for i in order) if candidate_costs is not None else None
+        key = (needed, units, costs, max_vars)
+
+        if key in self.searches:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.searches[key] = SharedSearch(cur_unit, target_unit, units, max_vars, costs, engine)
+
+        return self._iter_results(self.searches[key], order, candidate_costs, budget)
+
+    @staticmethod
+    def _iter_results(search: SharedSearch, order: List[int], candidate_costs: Optional[Sequence[float]],
+                      budget: SearchBudget) -> Iterator[Result]:
+        """Maps the results of a shared search back to the caller's candidate indices. Ties within a
+        level are sorted again so the results are in the same order as an uncached search.
+        """
+        def get_sort_key(result: Result):
+            mult_vars, div_vars = result
+            picks = tuple(sorted([2 * i for i in mult_vars] + [2 * i + 1 for i in div_vars]))
+            if candidate_costs is None:
+                return picks
+
+            return sum(candidate_costs[p // 2] for p in picks), picks
+
+        for results, complete in search.iter_levels(budget):
+            results = [(sorted(order[i] for i in mult_vars), sorted(order[i] for i in div_vars))
+                       for mult_vars, div_vars in results]
+            yield from sorted(results, key=get_sort_key)
+            if not complete:
+                return
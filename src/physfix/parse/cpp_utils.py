@@ -47,6 +47,19 @@ def token_to_stmt_str(t: Token) -> List[str]:
     return tokens_to_str(get_statement_tokens(t))
 
 
+def get_call_arguments(call_token: Token) -> List[Token]:
+    """Returns the root token of each argument of a function call. call_token is the '(' token"""
+    def flatten(t: Token) -> List[Token]:
+        if not t:
+            return []
+        elif t.str == ",":
+            return flatten(t.astOperand1) + flatten(t.astOperand2)
+
+        return [t]
+
+    return flatten(call_token.astOperand2)
+
+
 def get_root_token(t: Token) -> Token:
     """Returns the root of a token tree"""
     while t.astParent:
@@ -0,0 +1,135 @@
+"""Content-addressed cache of Phys outputs and dumps, so unchanged files aren't checked again.
+Entries are keyed by a hash of the source, the local headers it includes and the Phys version,
+and the least recently used entries are evicted once the cache is over its size limit.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from typing import List, Optional, Tuple
+
+_INCLUDE = re.compile(rb'^[ \t]*#[ \t]*include[ \t]*"([^"]+)"', re.MULTILINE)
+
+OUTPUT_NAME = "output.json"
+DUMP_NAME = "source.dump"
+
+
+def get_phys_image_id(image: str = "phys") -> Optional[str]:
+    """Returns the id of the Phys docker image, or None if docker can't find it"""
+    try:
+        result = subprocess.run(["docker", "image", "inspect", "--format", "{{.Id}}", image],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    except OSError:
+        return None
+
+    return result.stdout.strip() if result.returncode == 0 and result.stdout.strip() else None
+
+
+def get_local_includes(source_path: str) -> List[str]:
+    """Returns the headers a file includes with quotes, and the headers they include, which exist
+    relative to the including file. System headers are left out since they don't change.
+    """
+    includes = []
+    seen = {os.path.abspath(source_path)}
+    stack = [os.path.abspath(source_path)]
+    while stack:
+        path = stack.pop()
+        with open(path, "rb") as f:
+            for include in _INCLUDE.findall(f.read()):
+                include_path = os.path.abspath(os.path.join(os.path.dirname(path), include.decode()))
+                if include_path not in seen and os.path.isfile(include_path):
+                    seen.add(include_path)
+                    includes.append(include_path)
+                    stack.append(include_path)
+
+    return sorted(includes)
+
+
+class PhysCache:
+    """Maps a source file and its includes to Phys's output.json and dump"""
+    def __init__(self, cache_dir: str, phys_version: str, max_bytes: int = 1 << 30):
+        self.cache_dir = cache_dir
+        self.phys_version = phys_version  # Docker image id of Phys, see get_phys_image_id
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get_key(self, source_path: str, original_path: str = None) -> str:
+        """Hashes the Phys version, the path and contents of the source and its local includes. The
+        path is part of the key since Phys writes it into the dump. If the source is a copy, pass the
+        file it was copied from as original_path so includes are found next to the original.
+        """
+        key_hash = hashlib.sha256()
+        key_hash.update(self.phys_version.encode())
+        includes = get_local_includes(original_path if original_path is not None else source_path)
+        for path in [os.path.abspath(source_path)] + includes:
+            key_hash.update(b"\0" + path.encode() + b"\0")
+            with open(path, "rb") as f:
+                key_hash.update(hashlib.sha256(f.read()).digest())
+
+        return key_hash.hexdigest()
+
+    def get(self, key: str, output_path: str, dump_path: str) -> bool:
+        """Copies a cached output and dump to the given paths, returns False if there's no entry"""
+        entry_dir = os.path.join(self.cache_dir, key)
+        try:
+            shutil.copyfile(os.path.join(entry_dir, OUTPUT_NAME), output_path)
+            shutil.copyfile(os.path.join(entry_dir, DUMP_NAME), dump_path)
+            os.utime(entry_dir)  # Most recently used
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+
+        self.hits += 1
+        return True
+
+    def put(self, key: str, output_path: str, dump_path: str):
+        """Stores the output and dump of a Phys run, then evicts entries until the cache fits"""
+        entry_dir = os.path.join(self.cache_dir, key)
+        if os.path.exists(entry_dir):
+            return
+
+        # Entries are written to a temporary folder first so readers never see half an entry
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp")
+        try:
+            shutil.copyfile(output_path, os.path.join(tmp_dir, OUTPUT_NAME))
+            shutil.copyfile(dump_path, os.path.join(tmp_dir, DUMP_NAME))
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if os.path.isdir(entry_dir):  # Another run stored the same entry first
+                return
+            raise
+
+        self.evict()
+
+    def get_entries(self) -> List[Tuple[float, int, str]]:
+        """Returns (last used time, size, path) of every entry"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isdir(entry_dir):
+                continue
+
+            size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+            entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+
+        return entries
+
+    def evict(self):
+        """Removes the least recently used entries until the cache is at most max_bytes"""
+        entries = sorted(self.get_entries())
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in entries:
+            if total_bytes <= self.max_bytes:
+                break
+
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_bytes -= size
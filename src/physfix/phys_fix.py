@@ -1,28 +1,55 @@
 from __future__ import annotations
 from genericpath import exists
 
-import json
 import os
 import shutil
 import subprocess
 from collections import deque
 from copy import deepcopy
-from typing import List
+from typing import Dict, List, Optional
 
 from lxml import etree
 
 from physfix.dataflow.ast_to_cfg import ASTToCFG
+from physfix.dataflow.call_graph import SummaryCache
 from physfix.dataflow.dependency_graph import CFGToDependencyGraph
 from physfix.error_fix.error_fix_utils import (Change, Error, PhysVar,
                                                get_connected_errors,
                                                get_root_errors,
                                                get_token_unit_map)
-from physfix.error_fix.fix_addition_subtraction import fix_addition_subtraction
-from physfix.error_fix.fix_comparison import fix_comparison
+from physfix.error_fix.fix_addition_subtraction import fix_addition_subtraction  # noqa: F401 Registers fixer
+from physfix.error_fix.fix_comparison import fix_comparison  # noqa: F401 Registers fixer
+from physfix.error_fix.fixer_registry import dispatch_fixers
+from physfix.error_fix.phys_output import load_phys_output
+from physfix.error_fix.unit_search import SearchBudget, UnitSearchCache
 from physfix.parse.cpp_utils import get_root_token, get_statement_tokens
 from physfix.parse.dump_to_ast import DumpToAST
+from physfix.phys_cache import PhysCache, get_phys_image_id
+from physfix.phys_worker import PhysWorkerPool
+from physfix.srcml import NSMAP, STRIP_NAMESPACE_XSLT, SrcmlConverter, pos_attrib, src_tag
 
 DIR_HERE = os.path.dirname(__file__)
+PHYSFIX_FOLDER = os.path.join(DIR_HERE, "data")
+
+
+def create_phys_pool(size: int = 1, timeout: float = None) -> PhysWorkerPool:
+    """Starts Phys workers which can check any file PhysFix copies into its data folder. Workers
+    which take longer than timeout seconds on a file are restarted.
+    """
+    if not os.path.exists(PHYSFIX_FOLDER):
+        os.makedirs(PHYSFIX_FOLDER)
+
+    return PhysWorkerPool([os.path.join(DIR_HERE, "run_phys_worker.sh"), PHYSFIX_FOLDER], size, timeout)
+
+
+def create_phys_cache(max_bytes: int = 1 << 30) -> Optional[PhysCache]:
+    """Opens the Phys cache in PhysFix's data folder, or returns None if the Phys image can't be found"""
+    phys_version = get_phys_image_id()
+    if phys_version is None:
+        return None
+
+    return PhysCache(os.path.join(PHYSFIX_FOLDER, "phys_cache"), phys_version, max_bytes)
+
 
 class bcolors:
 	RED    = "\x1b[31m"
@@ -32,12 +59,24 @@ class bcolors:
 
 class PhysFix:
     """Full pipeline for fixing unit inconsistencies in Phys"""
-    def __init__(self, source_file_path: str, max_fixes=5, interactive=False):
+    def __init__(self, source_file_path: str, max_fixes=5, interactive=False, max_workers=None,
+                 search_budget: SearchBudget = None, phys_pool: PhysWorkerPool = None, phys_cache: PhysCache = None,
+                 srcml_converter: SrcmlConverter = None, interprocedural=True, use_ssa=True):
         self.max_fixes = max_fixes
         self.interactive = interactive
-
+        self.max_workers = max_workers  # Processes used to fix errors, defaults to the number of cores
+        self.search_budget = search_budget  # Per-error limits on the fix search, unlimited if None
+        self.phys_pool = phys_pool  # Long-lived Phys workers, see create_phys_pool. Runs docker per file if None
+        self.phys_cache = phys_cache  # Outputs of earlier Phys runs, Phys always runs if None
+        self.interprocedural = interprocedural  # Fixes can also use global variables defined in callers and callees
+        self.use_ssa = use_ssa  # Reaching definitions from SSA def-use chains instead of the dense solution
+        self.srcml_converter = srcml_converter
+        if srcml_converter is None:
+            self.srcml_converter = SrcmlConverter(os.path.join(PHYSFIX_FOLDER, "srcml_cache"))
+
+        self.original_source_path = source_file_path  # Its local includes aren't copied
         self.source_file_name = os.path.basename(source_file_path)
-        self.physfix_folder = os.path.join(DIR_HERE, "data")
+        self.physfix_folder = PHYSFIX_FOLDER
 
         # Copy source file into new folder
         self.source_file_path = os.path.join(self.physfix_folder,
@@ -52,18 +91,28 @@ class PhysFix:
         self.source_directory = os.path.dirname(self.source_file_path)
 
     def run_phys(self, mount_path: str, file_path: str):
-        """Runs Phys on a file"""
+        """Runs Phys on a file, unless the cache has its output and dump"""
         output_path = os.path.join(mount_path, "output.json")
+        dump_path = f"{file_path}.dump"
+
+        cache_key = None
+        if self.phys_cache is not None:
+            cache_key = self.phys_cache.get_key(file_path, self.original_source_path)
+        if cache_key is None or not self.phys_cache.get(cache_key, output_path, dump_path):
+            if not os.path.exists(output_path):
+                with open(output_path, "w") as _:
+                    pass
+
+            if self.phys_pool is not None:
+                self.phys_pool.run(file_path, output_path)
+            else:
+                subprocess.run([os.path.join(DIR_HERE, "run_phys.sh"), mount_path, file_path, output_path])
 
-        if not os.path.exists(output_path):
-            with open(output_path, "w") as _:
-                pass
-
-        subprocess.run([os.path.join(DIR_HERE, "run_phys.sh"), mount_path, file_path, output_path])
+            if cache_key is not None and os.path.getsize(output_path) > 0 and os.path.exists(dump_path):
+                self.phys_cache.put(cache_key, output_path, dump_path)
 
-        output_dict = None
-        with open(output_path) as f:
-            output_dict = json.load(f)
+        # Token units are only decoded for the tokens which are looked up
+        output_dict = load_phys_output(output_path)
 
         os.remove(output_path)
 
@@ -71,22 +120,37 @@ class PhysFix:
 
     def run_source_ml(self, file_path: str, ouput_path: str):
         """Runs srcml on a file"""
-        subprocess.run(["srcml", "--position", file_path, "-o", ouput_path])
+        self.srcml_converter.convert(file_path, ouput_path)
+
+    def get_srcml_path(self) -> str:
+        return os.path.join(self.source_directory, f"{os.path.splitext(self.source_file_name)[0]}.xml")
+
+    def fix(self) -> List[str]:
+        """Finds changes for the file's errors and writes a patched file for each, returns their paths"""
+        return self.apply_changes(self.generate_changes())
 
-    def fix(self):
+    def generate_changes(self) -> List[Change]:
+        """Runs Phys and returns the changes chosen for its errors"""
         phys_output_dict = self.run_phys(os.path.dirname(self.source_file_path), self.source_file_path)
+        phys_vars = PhysVar.from_dict(phys_output_dict)
+        var_unit_map = PhysVar.create_unit_map(phys_vars)
 
         # Get AST/CFG/DependencyGraph
         dump_to_ast = DumpToAST(f"{self.source_file_path}.dump")
         dump_to_ast.convert()
         ast_to_cfg = ASTToCFG(dump_to_ast)
         ast_to_cfg.convert()
-        cfg_to_dependency = CFGToDependencyGraph(ast_to_cfg)
+        # Function summaries are shared between all files fixed from this folder
+        summary_cache = None
+        if self.interprocedural:
+            summary_cache = SummaryCache(os.path.join(self.physfix_folder, "function_summaries.json"))
+        cfg_to_dependency = CFGToDependencyGraph(ast_to_cfg, use_ssa=self.use_ssa, interprocedural=self.interprocedural,
+                                                 summary_cache=summary_cache, phys_var_map=var_unit_map)
         cfg_to_dependency.convert()
         dependency_graph = cfg_to_dependency.dependency_graph
 
         # Get errors arbitrarily for now (and only addition/subtraction)
-        phys_errors = Error.from_dict(phys_output_dict, dependency_graph)
+        phys_errors = Error.from_dict(phys_output_dict, dependency_graph, cfg_to_dependency.statement_index)
         connected_errors = get_connected_errors(phys_errors)
         # TODO: Right now we get the root error but there are also cases where the statement we should change doesn't have an error
         root_errors = [get_root_errors(e) for e in connected_errors]
@@ -94,22 +158,18 @@ class PhysFix:
         # phys_errors = [e for e in phys_errors if e.error_type == "ADDITION_OF_INCOMPATIBLE_UNITS"]
 
         if not phys_errors:
-            return
+            return []
 
-        phys_vars = PhysVar.from_dict(phys_output_dict)
-        var_unit_map = PhysVar.create_unit_map(phys_vars)
         token_unit_map = get_token_unit_map(phys_output_dict)
+        search_cache = UnitSearchCache()  # Errors in the same function often need the same search
 
-        changes = []
-        for e in phys_errors:
-            change = None
-            if e.error_type == "ADDITION_OF_INCOMPATIBLE_UNITS":
-                change = fix_addition_subtraction(e, var_unit_map, token_unit_map, 
-                                                  max_fixes=self.max_fixes)
-            elif e.error_type == "COMPARISON_INCOMPATIBLE_UNITS":
-                change = fix_comparison(e, var_unit_map, token_unit_map,
-                                        max_fixes=self.max_fixes)
+        # Root errors are independent so functions are fixed in parallel, errors in a function share a worker
+        error_changes = dispatch_fixers(phys_errors, var_unit_map, token_unit_map, max_workers=self.max_workers,
+                                        max_fixes=self.max_fixes, search_cache=search_cache,
+                                        budget=self.search_budget)
 
+        changes = []
+        for e, change in zip(phys_errors, error_changes):
             if not change:
                 continue
 
@@ -158,8 +218,10 @@ class PhysFix:
                     error_message.append(t.str)
 
             print(" ".join(error_message))
+            if change.truncated:
+                print("Search stopped early, these are the best changes found in time")
             for idx in range(len(change.changes)):
-                print(f"{idx + 1}. {change.changes[idx]}")
+                print(f"{idx + 1}. {change.changes[idx].to_token()}")
 
             change_input = None
             while True:
@@ -171,11 +233,20 @@ class PhysFix:
             change.changes = [change.changes[int(change_input) - 1]]
             changes.append(change)
 
+        return changes
+
+    def apply_changes(self, changes: List[Change], srcml_converted=False) -> List[str]:
+        """Writes a patched file for every change, returns their paths. srcML is only generated when there
+        are changes, pass srcml_converted if get_srcml_path was already converted, e.g. by fix_workspace.
+        """
+        if not changes:
+            return []
+
         # Get srcml file
-        srcml_output_path = os.path.join(self.source_directory,
-                                         f"{os.path.splitext(self.source_file_name)[0]}.xml")
-        self.run_source_ml(self.source_file_path, srcml_output_path)
-        srcml_xml = self.load_srcml_xml(srcml_output_path, strip_namespace=True)
+        srcml_output_path = self.get_srcml_path()
+        if not srcml_converted:
+            self.run_source_ml(self.source_file_path, srcml_output_path)
+        srcml_xml = self.load_srcml_xml(srcml_output_path)
 
         # Create XLST files
         xslt_output_prefix = os.path.join(self.source_directory, 
@@ -185,29 +256,20 @@ class PhysFix:
         patched_files = []
         for path in xslt_path:
             patched_files.append(f"{os.path.splitext(path)[0]}.cpp")
-            self.apply_xslt(deepcopy(srcml_xml), path, 
-                            f"{os.path.splitext(path)[0]}.cpp")
+            self.apply_xslt(deepcopy(srcml_xml), path, os.path.splitext(path)[0])
+
+        return patched_files
 
     def load_srcml_xml(self, xml_path, strip_namespace=False):
+        """Parses srcML. Patching works on the namespaced tree, strip_namespace is only for reading
+        the tree without prefixes
+        """
         it = etree.parse(xml_path)
 
         if strip_namespace:
-            self._stripNs(it.getroot())
+            it = STRIP_NAMESPACE_XSLT(it)
         return it
 
-    def _stripNs(self, el):
-        '''Recursively search this element tree, removing namespaces.'''
-        if el.tag.startswith("{"):
-            el.tag = el.tag.split('}', 1)[1]  # strip namespace
-        keys = list(el.attrib.keys())
-        for k in keys:
-            if k.startswith("{"):
-                k2 = k.split('}', 1)[1]
-                el.attrib[k2] = el.attrib[k]
-                del el.attrib[k]
-        for child in el:
-            self._stripNs(child)
-
     def root_token_to_xml(self, token):
         """Takes root token and turns it into xml elements"""
         if not token:
@@ -215,42 +277,42 @@ class PhysFix:
 
         xml_elems = []
         if token.variableId:
-            elem = etree.Element("name")
+            elem = etree.Element(src_tag("name"))
             elem.text = token.str
             return [elem]
         else:
             if token.str in "*/+-<>" or token.str in ["<=", ">="]:
-                elem = etree.Element("operator")
+                elem = etree.Element(src_tag("operator"))
                 elem.text = token.str
                 mid = [elem]
                 left = self.root_token_to_xml(token.astOperand1)
                 right = self.root_token_to_xml(token.astOperand2)
                 xml_elems = left + mid + right
             elif token.str == "(":
-                left = etree.Element("call")
-                left = etree.SubElement(left, "name")
+                left = etree.Element(src_tag("call"))
+                left = etree.SubElement(left, src_tag("name"))
                 left.text = token.astOperand1.str
-                mid = etree.SubElement(left, "argument_list")
+                mid = etree.SubElement(left, src_tag("argument_list"))
                 mid.text = "("
                 mid.tail = ")"
                 
                 cur = token.astOperand2
                 while cur and cur.str == ",":
-                    arg = etree.SubElement(mid, "argument")
+                    arg = etree.SubElement(mid, src_tag("argument"))
                     arg.tail = ","
-                    arg = etree.SubElement(arg, "expr")
+                    arg = etree.SubElement(arg, src_tag("expr"))
                     arg = arg.extend(self.root_token_to_xml(cur.astOperand1))
 
                     cur = cur.astOperand2
 
                 if cur:
-                    arg = etree.SubElement(mid, "argument")
-                    arg = etree.SubElement(arg, "expr")
+                    arg = etree.SubElement(mid, src_tag("argument"))
+                    arg = etree.SubElement(arg, src_tag("expr"))
                     arg = arg.extend(self.root_token_to_xml(cur))
 
                 xml_elems.append(left)
             else:
-                mid = [etree.Element("literal")]
+                mid = [etree.Element(src_tag("literal"))]
                 mid[0].text = token.str
                 left = self.root_token_to_xml(token.astOperand1)
                 right = self.root_token_to_xml(token.astOperand2)
@@ -268,12 +330,12 @@ class PhysFix:
             token_to_fix_root = get_root_token(token_to_fix)
             statement_tokens = get_statement_tokens(token_to_fix_root)
             token_line_num = token_to_fix_root.linenr
-            exprs = srcml_xml_root.findall(".//expr")
+            exprs = srcml_xml_root.iterfind(".//src:expr", NSMAP)
             line_elem = []
 
             # Find the xml line with the matching line number
             for e in exprs:
-                if e.get("start").startswith(str(token_line_num)):
+                if e.get(pos_attrib("start")).startswith(f"{token_line_num}:"):
                     line_elem.append(e)
 
             cur_token = statement_tokens[0]
@@ -313,13 +375,13 @@ class PhysFix:
             if elem_to_fix.text == "(":
                 elem_to_fix = elem_parent_map[elem_to_fix]
 
-            change_xml_elems = [self.root_token_to_xml(c) for c in c.changes]
+            change_xml_elems = [self.root_token_to_xml(c.to_token()) for c in c.changes]
 
             xslt_paths = []
             for idx, change_sub_elem in enumerate(change_xml_elems):
-                xslt_root = etree.XML('''<?xml version = "1.0"?>
+                xslt_root = etree.XML(f'''<?xml version = "1.0"?>
         <xsl:stylesheet version = "1.0" 
-        xmlns:xsl = "http://www.w3.org/1999/XSL/Transform">
+        xmlns:xsl = "http://www.w3.org/1999/XSL/Transform" xmlns:src="{NSMAP['src']}" xmlns:pos="{NSMAP['pos']}">
             <xsl:template match="@*|node()">
                 <xsl:copy>
                     <xsl:apply-templates select="@*|node()"/>
@@ -327,8 +389,10 @@ class PhysFix:
             </xsl:template>
         </xsl:stylesheet>''')
                 xslt_tree = etree.ElementTree(xslt_root)
+                elem_name = etree.QName(elem_to_fix).localname
+                elem_start, elem_end = elem_to_fix.get(pos_attrib("start")), elem_to_fix.get(pos_attrib("end"))
                 xslt_match = etree.SubElement(xslt_tree.getroot(), "{http://www.w3.org/1999/XSL/Transform}template",
-                                              match=f"//{elem_to_fix.tag}[@start='{elem_to_fix.get('start')}'][@end='{elem_to_fix.get('end')}']")
+                                              match=f"//src:{elem_name}[@pos:start='{elem_start}'][@pos:end='{elem_end}']")
                 xslt_match.extend(change_sub_elem)
                 xslt_path = f"{output_file_prefix}_{c_idx}_{idx}.xslt"
                 xslt_tree.write(xslt_path)
@@ -348,6 +412,24 @@ class PhysFix:
         with open(f"{output_path}.cpp", "wb") as f:
             f.write(etree.tostring(t, method='text'))
 
+
+def fix_workspace(source_file_paths: List[str], srcml_converter: SrcmlConverter = None,
+                  **phys_fix_kwargs) -> Dict[str, List[str]]:
+    """Fixes many files, converting every file with changes to srcML in one srcml run. Returns the
+    patched files of each source file.
+    """
+    if srcml_converter is None:
+        srcml_converter = SrcmlConverter(os.path.join(PHYSFIX_FOLDER, "srcml_cache"))
+
+    phys_fixes = [PhysFix(p, srcml_converter=srcml_converter, **phys_fix_kwargs) for p in source_file_paths]
+    file_changes = [(p, f.generate_changes()) for p, f in zip(source_file_paths, phys_fixes)]
+
+    to_convert = [f for f, (_, changes) in zip(phys_fixes, file_changes) if changes]
+    srcml_converter.convert_many([f.source_file_path for f in to_convert], [f.get_srcml_path() for f in to_convert])
+
+    return {p: f.apply_changes(changes, srcml_converted=True) for f, (p, changes) in zip(phys_fixes, file_changes)}
+
+
 def main():
     phys_fix = PhysFix("/home/rewong/physfix/extern/phys/data/FrenchVanilla/src/turtlebot_example/src/turtlebot_example_node.cpp")
     # phys_fix = PhysFix("/home/rewong/physfix/tests/dump_to_ast_test/test_21.cpp", interactive=True)
@@ -0,0 +1,154 @@
+"""Long-lived Phys processes. Starting a container and importing Phys for every file takes longer
+than checking a small file, so workers are started once and sent files over a pipe.
+
+Workers read one JSON request per line on stdin and write one JSON response per line on stdout:
+    {"id": 0, "source_path": "/data/a/a.cpp", "output_path": "/data/a/output.json"}
+    {"id": 0, "ok": true, "output_path": "/data/a/output.json", "dump_path": "/data/a/a.cpp.dump"}
+or {"id": 0, "ok": false, "error": "..."} if Phys failed on the file. Paths are the same inside and
+outside the worker, so the folder with the sources has to be mounted at the same path.
+phys_worker_main.py is the worker run inside the Phys container.
+"""
+from __future__ import annotations
+
+import json
+import queue
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, List, Sequence, Tuple
+
+import attr
+
+
+class PhysWorkerError(Exception):
+    """Phys failed on a file or the worker process died"""
+
+
+@attr.s(eq=False)
+class PhysResult:
+    output_path: str = attr.ib()
+    dump_path: str = attr.ib()
+
+
+def _read_lines(stdout: IO[str], lines: queue.Queue):
+    """Moves the lines a worker writes into a queue so they can be waited for with a timeout. An
+    empty line marks the end of the output.
+    """
+    for line in stdout:
+        lines.put(line)
+    lines.put("")
+
+
+class PhysWorker:
+    """One Phys process, started on the first file and restarted if it dies. A worker which takes
+    longer than timeout seconds to answer is killed.
+    """
+    def __init__(self, command: Sequence[str], timeout: float = None):
+        self.command = list(command)
+        self.timeout = timeout
+        self.process: subprocess.Popen = None
+        self.lines: queue.Queue = None
+        self.reader: threading.Thread = None
+        self.next_request_id = 0
+
+    def is_running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        universal_newlines=True, bufsize=1)
+        self.lines = queue.Queue()
+        self.reader = threading.Thread(target=_read_lines, args=(self.process.stdout, self.lines), daemon=True)
+        self.reader.start()
+
+    def run(self, source_path: str, output_path: str) -> PhysResult:
+        """Runs Phys on a file, writing its output to output_path and its dump next to the source"""
+        if not self.is_running():
+            self.start()
+
+        request_id = self.next_request_id
+        self.next_request_id += 1
+
+        request = {"id": request_id, "source_path": source_path, "output_path": output_path}
+        try:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+            response_line = self.lines.get(timeout=self.timeout)
+        except (BrokenPipeError, OSError) as e:
+            self.close()
+            raise PhysWorkerError(f"Phys worker stopped while checking {source_path}") from e
+        except queue.Empty:
+            self.close(kill=True)
+            raise PhysWorkerError(f"Phys worker took longer than {self.timeout}s to check {source_path}")
+
+        if not response_line:
+            self.close()
+            raise PhysWorkerError(f"Phys worker stopped while checking {source_path}")
+
+        try:
+            response = json.loads(response_line)
+        except ValueError as e:
+            # Anything else the worker printed leaves it out of sync, restart it
+            self.close(kill=True)
+            raise PhysWorkerError(f"Phys worker wrote {response_line.strip()!r} instead of a response") from e
+        if response.get("id") != request_id:
+            # The worker is out of sync, restart it rather than pairing responses with the wrong files
+            self.close()
+            raise PhysWorkerError(f"Phys worker answered request {response.get('id')} instead of {request_id}")
+        if not response.get("ok"):
+            raise PhysWorkerError(f"Phys failed on {source_path}: {response.get('error')}")
+
+        return PhysResult(response["output_path"], response["dump_path"])
+
+    def close(self, kill: bool = False):
+        """Stops the worker, waiting for it to finish its input unless kill is set"""
+        if self.process is None:
+            return
+
+        if kill:
+            self.process.kill()
+        try:
+            self.process.stdin.close()  # Workers exit at the end of their input
+        except OSError:  # Already dead
+            pass
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+        self.reader.join(timeout=10)
+        self.process.stdout.close()
+        self.process = None
+        self.lines = self.reader = None
+
+
+class PhysWorkerPool:
+    """Runs files on a fixed number of workers, each file goes to whichever worker is idle"""
+    def __init__(self, command: Sequence[str], size: int = 1, timeout: float = None):
+        self.workers = [PhysWorker(command, timeout) for _ in range(size)]
+        self.idle_workers: queue.Queue = queue.Queue()
+        for w in self.workers:
+            self.idle_workers.put(w)
+
+    def run(self, source_path: str, output_path: str) -> PhysResult:
+        worker = self.idle_workers.get()
+        try:
+            return worker.run(source_path, output_path)
+        finally:
+            self.idle_workers.put(worker)
+
+    def run_many(self, files: List[Tuple[str, str]]) -> List[PhysResult]:
+        """Runs (source path, output path) pairs on every worker at once, results are in the same order"""
+        with ThreadPoolExecutor(len(self.workers)) as executor:
+            return list(executor.map(lambda f: self.run(*f), files))
+
+    def close(self):
+        for w in self.workers:
+            w.close()
+
+    def __enter__(self) -> PhysWorkerPool:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
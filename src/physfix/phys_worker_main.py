@@ -0,0 +1,56 @@
+"""Phys worker run inside the Phys container by run_phys_worker.sh. Reads requests from stdin and
+runs the Phys command given as arguments on each file, answering on stdout with the protocol in
+phys_worker.py. Only uses the standard library since it runs with the container's Python.
+
+    usage: phys_worker_main.py PHYS_COMMAND...
+"""
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List
+
+MAX_ERROR_CHARS = 2000
+
+
+def check_file(request: Dict, phys_command: List[str]) -> Dict:
+    """Runs Phys on the file of a request, returns the response"""
+    source_path, output_path = request["source_path"], request["output_path"]
+    dump_path = f"{source_path}.dump"
+
+    # Phys's own output goes into the response, anything it printed on stdout would break the protocol
+    result = subprocess.run(phys_command + [source_path, "--output_file", output_path],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    if result.returncode != 0 or not os.path.exists(dump_path):
+        error = result.stdout[-MAX_ERROR_CHARS:] or f"Phys exited with {result.returncode}"
+        return {"id": request["id"], "ok": False, "error": error}
+
+    return {"id": request["id"], "ok": True, "output_path": output_path, "dump_path": dump_path}
+
+
+def main(argv: List[str] = None) -> int:
+    phys_command = sys.argv[1:] if argv is None else argv
+    if not phys_command:
+        print(__doc__, file=sys.stderr)
+        return 2
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+
+        request = None
+        try:
+            request = json.loads(line)
+            response = check_file(request, phys_command)
+        except (ValueError, KeyError, OSError) as e:
+            request_id = request.get("id") if isinstance(request, dict) else None
+            response = {"id": request_id, "ok": False, "error": f"Bad request: {e}"}
+
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
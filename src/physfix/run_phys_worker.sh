@@ -0,0 +1,13 @@
+#!/bin/bash
+# Starts a long-lived Phys worker for the sources under $1, see phys_worker.py for the protocol.
+# The container runs phys_worker_main.py with the image's entrypoint as the Phys command, so every
+# file is checked in one container instead of starting a container per file
+DIR_HERE="$(cd "$(dirname "$0")" && pwd)"
+PHYS_COMMAND=$(docker image inspect --format '{{join .Config.Entrypoint " "}}' phys)
+if [ -z "$PHYS_COMMAND" ]; then
+    echo "Couldn't find the entrypoint of the phys image" >&2
+    exit 1
+fi
+
+exec docker run -i --rm -v "$1":"$1" -v "$DIR_HERE":/physfix_worker:ro --entrypoint python3 phys \
+    /physfix_worker/phys_worker_main.py $PHYS_COMMAND
@@ -0,0 +1,126 @@
+"""Converts source files to srcML. Conversions are cached by source hash, and files missing from the
+cache are converted together in one srcml archive which is then split back into one file per unit.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import Dict, List, Sequence
+
+from lxml import etree
+
+SRC_NS = "http://www.srcML.org/srcML/src"
+POS_NS = "http://www.srcML.org/srcML/position"
+NSMAP = {"src": SRC_NS, "pos": POS_NS}  # Prefixes for find and xpath
+SRCML_OPTIONS = ["--position"]
+
+# Moves every element and attribute out of its namespace in one pass of libxslt
+STRIP_NAMESPACE_XSLT = etree.XSLT(etree.XML('''<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+    <xsl:template match="*">
+        <xsl:element name="{local-name()}">
+            <xsl:apply-templates select="@*|node()"/>
+        </xsl:element>
+    </xsl:template>
+    <xsl:template match="@*">
+        <xsl:attribute name="{local-name()}"><xsl:value-of select="."/></xsl:attribute>
+    </xsl:template>
+    <xsl:template match="comment()|processing-instruction()|text()">
+        <xsl:copy/>
+    </xsl:template>
+</xsl:stylesheet>'''))
+
+
+def src_tag(tag: str) -> str:
+    """Qualified name of a srcML element"""
+    return f"{{{SRC_NS}}}{tag}"
+
+
+def pos_attrib(name: str) -> str:
+    """Qualified name of a srcML position attribute, start or end"""
+    return f"{{{POS_NS}}}{name}"
+
+
+class SrcmlConverter:
+    """Runs srcml, reusing earlier conversions of the same source if cache_dir is given"""
+    def __init__(self, cache_dir: str = None, srcml_command: Sequence[str] = ("srcml",)):
+        self.cache_dir = cache_dir
+        self.srcml_command = list(srcml_command)
+        self.runs = 0  # srcml processes started
+
+        if cache_dir is not None and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get_key(self, source_path: str) -> str:
+        """Hashes the options, path and contents of a source, srcML records the path in the unit"""
+        key_hash = hashlib.sha256(" ".join(SRCML_OPTIONS).encode())
+        key_hash.update(b"\0" + os.path.abspath(source_path).encode() + b"\0")
+        with open(source_path, "rb") as f:
+            key_hash.update(f.read())
+
+        return key_hash.hexdigest()
+
+    def _get_cached(self, source_path: str, output_path: str) -> bool:
+        if self.cache_dir is None:
+            return False
+
+        cache_path = os.path.join(self.cache_dir, f"{self.get_key(source_path)}.xml")
+        if not os.path.exists(cache_path):
+            return False
+
+        shutil.copyfile(cache_path, output_path)
+        return True
+
+    def _put_cached(self, source_path: str, output_path: str):
+        if self.cache_dir is None:
+            return
+
+        # Copy then rename so readers never see half a file
+        cache_path = os.path.join(self.cache_dir, f"{self.get_key(source_path)}.xml")
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp")
+        os.close(fd)
+        shutil.copyfile(output_path, tmp_path)
+        os.replace(tmp_path, cache_path)
+
+    def convert(self, source_path: str, output_path: str):
+        self.convert_many([source_path], [output_path])
+
+    def convert_many(self, source_paths: List[str], output_paths: List[str]):
+        """Converts each source to the output path at the same position with one srcml run"""
+        missing = [(s, o) for s, o in zip(source_paths, output_paths) if not self._get_cached(s, o)]
+        if not missing:
+            return
+
+        if len(missing) == 1:
+            source_path, output_path = missing[0]
+            self.runs += 1
+            subprocess.run(self.srcml_command + SRCML_OPTIONS + [source_path, "-o", output_path], check=True)
+        else:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                archive_path = os.path.join(tmp_dir, "archive.xml")
+                self.runs += 1
+                subprocess.run(self.srcml_command + SRCML_OPTIONS + [s for s, _ in missing] + ["-o", archive_path],
+                               check=True)
+                split_archive(archive_path, {s: o for s, o in missing})
+
+        for source_path, output_path in missing:
+            self._put_cached(source_path, output_path)
+
+
+def split_archive(archive_path: str, output_paths: Dict[str, str]):
+    """Writes every unit of a srcml archive to the output path of its filename"""
+    archive = etree.parse(archive_path)
+    units = archive.getroot().findall(f"{{{SRC_NS}}}unit")
+
+    for unit in units:
+        filename = unit.get("filename")
+        if filename not in output_paths:
+            raise ValueError(f"Unexpected unit {filename} in srcml archive")
+
+        etree.ElementTree(unit).write(output_paths[filename], xml_declaration=True, encoding="UTF-8",
+                                      standalone=True)
+
+    if len(units) != len(output_paths):
+        raise ValueError(f"srcml archive has {len(units)} units, expected {len(output_paths)}")
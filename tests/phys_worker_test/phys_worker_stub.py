@@ -0,0 +1,34 @@
+"""Stands in for a Phys worker. Writes an empty Phys output and dump for every file, exits on
+files with crash in their name, prints a stray line for stray and never answers for hang
+"""
+import json
+import sys
+import time
+
+
+def main():
+    for line in sys.stdin:
+        request = json.loads(line)
+        source_path = request["source_path"]
+        if "crash" in source_path:
+            sys.exit(1)
+        if "hang" in source_path:
+            time.sleep(60)
+        if "stray" in source_path:
+            print("Checking", source_path, flush=True)
+
+        if "missing" in source_path:
+            response = {"id": request["id"], "ok": False, "error": "No such file"}
+        else:
+            with open(request["output_path"], "w") as f:
+                json.dump({"errors": [], "variables": [], "token_units": {}, "source_path": source_path}, f)
+            with open(f"{source_path}.dump", "w") as f:
+                f.write("<dumps/>")
+            response = {"id": request["id"], "ok": True, "output_path": request["output_path"],
+                        "dump_path": f"{source_path}.dump"}
+
+        print(json.dumps(response), flush=True)
+
+
+if __name__ == "__main__":
+    main()
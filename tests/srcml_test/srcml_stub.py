@@ -0,0 +1,27 @@
+"""Stands in for srcml. Wraps each file's text in a unit, in an archive if there are several files"""
+import sys
+from xml.sax.saxutils import escape, quoteattr
+
+SRC_NS = "http://www.srcML.org/srcML/src"
+
+
+def main():
+    args = sys.argv[1:]
+    output_path = args[args.index("-o") + 1]
+    source_paths = [a for a in args[:args.index("-o")] if not a.startswith("--")]
+
+    units = []
+    for path in source_paths:
+        with open(path) as f:
+            units.append(f'<unit filename={quoteattr(path)}><expr>{escape(f.read())}</expr></unit>')
+
+    with open(output_path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n')
+        if len(units) == 1:
+            f.write(units[0].replace("<unit ", f'<unit xmlns="{SRC_NS}" ', 1))
+        else:
+            f.write(f'<unit xmlns="{SRC_NS}">{"".join(units)}</unit>')
+
+
+if __name__ == "__main__":
+    main()
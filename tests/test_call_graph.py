@@ -0,0 +1,151 @@
+import os
+import tempfile
+import unittest
+
+from physfix.dataflow.ast_to_cfg import ASTToCFG
+from physfix.dataflow.call_graph import SummaryCache, get_function_key, is_return_node
+from physfix.dataflow.dependency_graph import CFGToDependencyGraph
+from physfix.error_fix.error_fix_utils import PhysVar, get_candidate_variables
+from physfix.parse.cpp_utils import get_statement_tokens
+from physfix.error_fix.unit import Unit
+from physfix.parse.dump_to_ast import DumpToAST
+
+DIR_HERE = os.path.dirname(__file__)
+
+
+class TestCallGraph(unittest.TestCase):
+    def setUp(self):
+        test_path = os.path.join(DIR_HERE, "dump_to_ast_test", "test_19.cpp.dump")
+        self.ast_to_cfg = ASTToCFG(DumpToAST(test_path))
+        self.ast_to_cfg.convert()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.cache_dir.name, "summaries.json")
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def get_cfg(self, name):
+        return next(c for c in self.ast_to_cfg.function_cfgs if c.function_declaration.name == name)
+
+    def get_statement_nodes(self, dependency_graph, statement):
+        return [n for n in dependency_graph.nodes if n.cfgnode.get_type() == "basic"
+                and " ".join(t.str for t in get_statement_tokens(n.cfgnode.token)).startswith(statement)]
+
+    def test_summaries(self):
+        cfg_to_dependency = CFGToDependencyGraph(self.ast_to_cfg, interprocedural=True,
+                                                 summary_cache=SummaryCache(self.cache_path))
+        cfg_to_dependency.convert()
+        call_graph = cfg_to_dependency.call_graph
+        summaries = {c.function_declaration.name: s for c, s in cfg_to_dependency.summaries.items()}
+
+        # mult is called by goal_d which is called by main
+        order = [c.function_declaration.name for c in call_graph.get_bottom_up_order()]
+        self.assertLess(order.index("mult"), order.index("goal_d"))
+        self.assertLess(order.index("goal_d"), order.index("main"))
+
+        # return x * y
+        self.assertEqual(summaries["mult"].argument_names, ["x", "y"])
+        self.assertEqual(summaries["mult"].return_arguments, [0, 1])
+        self.assertEqual(summaries["goal_d"].return_arguments, [])
+
+        main = self.get_cfg("main")
+        for call_site in call_graph.call_sites[main]:
+            self.assertEqual(len(call_site.get_arguments()), 3)
+
+        # Arguments of calls are still uses of the call statement
+        goal_d_graph = cfg_to_dependency.function_graphs[self.get_cfg("goal_d")]
+        [err_d_node] = self.get_statement_nodes(goal_d_graph, "err_d =")
+        self.assertIn("err_x", [v.nameToken.str for v in goal_d_graph.def_use_pairs[err_d_node.cfgnode].use])
+        self.assertIn("err_x", [n.variable.nameToken.str for n in err_d_node.previous])
+
+        # Summaries are reused from the cache
+        cache = SummaryCache(self.cache_path)
+        self.assertEqual(len(cache.summaries), len(self.ast_to_cfg.function_cfgs))
+
+        cfg_to_dependency_2 = CFGToDependencyGraph(self.ast_to_cfg, interprocedural=True, summary_cache=cache)
+        cfg_to_dependency_2.convert()
+        for cfg, summary in cfg_to_dependency_2.summaries.items():
+            self.assertIs(summary, cache.get(summary.key))
+            self.assertEqual(summary, cfg_to_dependency.summaries[cfg])
+
+    def test_summary_keys(self):
+        cfg_to_dependency = CFGToDependencyGraph(self.ast_to_cfg, interprocedural=True)
+        cfg_to_dependency.convert()
+        cfgs = {c.function_declaration.name: c for c in self.ast_to_cfg.function_cfgs}
+        summaries = {c.function_declaration.name: s for c, s in cfg_to_dependency.summaries.items()}
+
+        # Functions with callees are keyed by their callees' summaries too
+        self.assertEqual(summaries["mult"].key, get_function_key(cfgs["mult"]))
+        self.assertEqual(summaries["goal_d"].key,
+                         get_function_key(cfgs["goal_d"], [summaries[c.function_declaration.name].key
+                                                           for c in cfg_to_dependency.call_graph.get_callees(cfgs["goal_d"])]))
+        self.assertNotEqual(summaries["goal_d"].key, get_function_key(cfgs["goal_d"]))
+
+    def test_call_edges(self):
+        cfg_to_dependency = CFGToDependencyGraph(self.ast_to_cfg, interprocedural=True)
+        cfg_to_dependency.convert()
+        mult, goal_d = self.get_cfg("mult"), self.get_cfg("goal_d")
+        mult_graph, goal_d_graph = cfg_to_dependency.function_graphs[mult], cfg_to_dependency.function_graphs[goal_d]
+
+        # return x * y
+        [return_node] = [n for n in mult_graph.nodes if is_return_node(n.cfgnode)]
+        [x_node] = [n for n in mult_graph.nodes if n.cfgnode is mult.entry_block and n.variable.nameToken.str == "x"]
+        # err_d=sqrt(err_x*err_x+mult(err_x, 5))
+        [err_d_node] = self.get_statement_nodes(goal_d_graph, "err_d =")
+        [err_x_node] = self.get_statement_nodes(goal_d_graph, "err_x =")
+
+        self.assertEqual(return_node.call_next, {err_d_node})
+        self.assertEqual(err_d_node.call_previous, {return_node})
+        self.assertEqual(x_node.call_previous, {err_x_node})
+        self.assertEqual(err_x_node.call_next, {x_node})
+
+        # Call edges are rebuilt when a statement is replaced
+        cfg_to_dependency.replace_statement(goal_d_graph, err_d_node.cfgnode, err_d_node.cfgnode.token)
+        [new_err_d_node] = self.get_statement_nodes(goal_d_graph, "err_d =")
+        self.assertEqual(return_node.call_next, {new_err_d_node})
+        self.assertEqual(x_node.call_previous, {err_x_node})
+
+    def test_global_definitions(self):
+        for use_ssa in [False, True]:
+            cfg_to_dependency = CFGToDependencyGraph(self.ast_to_cfg, use_ssa=use_ssa, interprocedural=True)
+            cfg_to_dependency.convert()
+            mult, main = self.get_cfg("mult"), self.get_cfg("main")
+            mult_graph, main_graph = cfg_to_dependency.function_graphs[mult], cfg_to_dependency.function_graphs[main]
+
+            # vel_x is set by goal_d which main calls
+            [vel_node] = self.get_statement_nodes(main_graph, "vel . linear . x =")
+            reach_def = main_graph.get_reaching_defs(vel_node.cfgnode, interprocedural=True)
+            vel_x = next(r.variable for r in reach_def if r.variable.nameToken.str == "vel_x")
+            self.assertNotIn(vel_x, [r.variable for r in main_graph.get_reaching_defs(vel_node.cfgnode)])
+            self.assertTrue(all(r.def_node in self.get_cfg("goal_d").nodes for r in reach_def if r.variable is vel_x))
+
+            phys_var_map = {vel_x.Id: PhysVar("vel_x", vel_x.Id, [Unit.from_dict({"meter": 1, "second": -1})])}
+            self.assertEqual(get_candidate_variables(vel_node, main_graph, phys_var_map), [vel_x])
+
+            # err_x is set by goal_d before it calls mult, but mult doesn't use it
+            [return_node] = [n for n in mult_graph.nodes if is_return_node(n.cfgnode)]
+            reach_def = mult_graph.get_reaching_defs(return_node.cfgnode, interprocedural=True)
+            err_x = next(r.variable for r in reach_def if r.variable.nameToken.str == "err_x")
+            phys_var_map = {err_x.Id: PhysVar("err_x", err_x.Id, [Unit.from_dict({"meter": 1})])}
+            self.assertEqual(get_candidate_variables(return_node, mult_graph, phys_var_map, live_only=False), [err_x])
+            self.assertEqual(get_candidate_variables(return_node, mult_graph, phys_var_map), [])
+
+    def test_argument_units_not_cached(self):
+        mult = next(c for c in self.ast_to_cfg.function_cfgs if c.function_declaration.name == "mult")
+        x = mult.entry_block.function_arguments[0]
+        meter = PhysVar(x.nameToken.str, x.Id, [Unit.from_dict({"meter": 1})])
+        second = PhysVar(x.nameToken.str, x.Id, [Unit.from_dict({"second": 1})])
+        cache = SummaryCache(self.cache_path)
+
+        # Phys units belong to one file, the same function in another file gets that file's units
+        for phys_var in [meter, second]:
+            cfg_to_dependency = CFGToDependencyGraph(self.ast_to_cfg, interprocedural=True, summary_cache=cache,
+                                                     phys_var_map={x.Id: phys_var})
+            cfg_to_dependency.convert()
+            self.assertEqual(cfg_to_dependency.summaries[mult].argument_units[0], [phys_var.units[0].to_dict()])
+
+        self.assertTrue(all(not s.argument_units for s in SummaryCache(self.cache_path).summaries.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
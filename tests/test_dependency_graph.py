@@ -4,11 +4,24 @@ import unittest
 import yaml
 from physfix.dataflow.ast_to_cfg import ASTToCFG
 from physfix.dataflow.dependency_graph import CFGToDependencyGraph
+from physfix.error_fix.error_fix_utils import Error
+from physfix.parse.cpp_utils import get_root_token, get_statement_tokens
 from physfix.parse.dump_to_ast import DumpToAST
 from yaml.loader import SafeLoader
 
 DIR_HERE = os.path.dirname(__file__)
 
+
+def graph_signature(dependency_graph):
+    """Describes nodes and edges by CFG node ID and variable name, which don't depend on the parse"""
+    mapping = dependency_graph.cfg.create_node_mapping()
+
+    def node_key(n):
+        return mapping[n.cfgnode], n.variable.nameToken.str if n.variable else ""
+
+    return sorted((node_key(n), sorted(node_key(p) for p in n.previous)) for n in dependency_graph.nodes)
+
+
 class TestCFGToDependencyGraph(unittest.TestCase):
     def test(self):
         for i in range(1, 3):
@@ -35,6 +48,59 @@ class TestCFGToDependencyGraph(unittest.TestCase):
 
             self.assertEqual(graph_dict, sol_dict)
 
+    def test_components(self):
+        for i in range(1, 15):
+            test_path = os.path.join(DIR_HERE, "ast_to_cfg_test", f"test_{i}.cpp.dump")
+            dependency_graphs = CFGToDependencyGraph(ASTToCFG(DumpToAST(test_path))).convert()
+
+            for dependency_graph in dependency_graphs:
+                components = dependency_graph.get_connected_components()
+                self.assertEqual(sum(len(c) for c in components), len(dependency_graph.nodes))
+
+                for component_id, component in enumerate(components):
+                    self.assertEqual(set(dependency_graph.get_component_nodes(component_id)), component)
+
+                    # Every neighbour of a node is in the same component
+                    for n in component:
+                        self.assertEqual(dependency_graph.get_component_id(n), component_id)
+                        for neighbour in n.next | n.previous:
+                            self.assertTrue(dependency_graph.same_component(n, neighbour))
+
+    def test_condensation(self):
+        test_paths = [os.path.join(DIR_HERE, "ast_to_cfg_test", f"test_{i}.cpp.dump") for i in range(1, 15)]
+        test_paths.append(os.path.join(DIR_HERE, "data_dependency_test", "test_2.cpp.dump"))
+
+        for test_path in test_paths:
+            dependency_graphs = CFGToDependencyGraph(ASTToCFG(DumpToAST(test_path))).convert()
+
+            for dependency_graph in dependency_graphs:
+                sccs = dependency_graph.get_topological_order()
+                self.assertEqual(sum(len(c) for c in sccs), len(dependency_graph.nodes))
+
+                reachable = {}
+                for n in dependency_graph.nodes:
+                    reachable[n] = set()
+                    stack = [n]
+                    while stack:
+                        cur = stack.pop()
+                        for next_n in cur.next:
+                            if next_n not in reachable[n]:
+                                reachable[n].add(next_n)
+                                stack.append(next_n)
+
+                for n in dependency_graph.nodes:
+                    self.assertEqual(dependency_graph.forward_slice(n), reachable[n] | {n})
+                    self.assertEqual(dependency_graph.backward_slice(n),
+                                     {m for m in dependency_graph.nodes if n in reachable[m]} | {n})
+
+                    for next_n in n.next:
+                        self.assertLessEqual(dependency_graph.get_scc_id(n), dependency_graph.get_scc_id(next_n))
+
+                    for m in dependency_graph.nodes:
+                        same_scc = dependency_graph.get_scc_id(n) == dependency_graph.get_scc_id(m)
+                        mutually_reachable = n is m or (m in reachable[n] and n in reachable[m])
+                        self.assertEqual(same_scc, mutually_reachable)
+
     # def compare_inputs(self, d1, d2):
     #     if isinstance(d1, str):
     #         self.assertEqual(d1, d2)
@@ -48,7 +114,96 @@ class TestCFGToDependencyGraph(unittest.TestCase):
     #         for k, v in d1.items():
     #             self.assertTrue(k in d2)
     #             self.compare_inputs(v, d2[k])
-                
+
+    def test_replace_statement(self):
+        for i in range(1, 15):
+            test_path = os.path.join(DIR_HERE, "ast_to_cfg_test", f"test_{i}.cpp.dump")
+
+            for use_ssa in [False, True]:
+                # Update one parse incrementally and rebuild a second parse from scratch
+                ast_to_cfg = ASTToCFG(DumpToAST(test_path))
+                dependency_graphs = CFGToDependencyGraph(ast_to_cfg, use_ssa=use_ssa).convert()
+                expected_ast_to_cfg = ASTToCFG(DumpToAST(test_path))
+                expected_ast_to_cfg.convert()
+
+                for graph_idx, dependency_graph in enumerate(dependency_graphs):
+                    mapping = dependency_graph.cfg.create_node_mapping()
+                    basic_blocks = sorted((n for n in mapping if n.get_type() == "basic"), key=mapping.get)
+                    if len(basic_blocks) < 2:
+                        continue
+
+                    # Swap the first statement for the last one
+                    dependency_graph.replace_statement(basic_blocks[0], basic_blocks[-1].token)
+
+                    expected_cfg = expected_ast_to_cfg.function_cfgs[graph_idx]
+                    expected_mapping = expected_cfg.create_node_mapping()
+                    expected_blocks = sorted((n for n in expected_mapping if n.get_type() == "basic"),
+                                             key=expected_mapping.get)
+                    expected_blocks[0].token = expected_blocks[-1].token
+
+                    expected_graph = CFGToDependencyGraph(expected_ast_to_cfg, use_ssa=use_ssa)._create_dependency_graph(expected_cfg)
+                    self.assertEqual(graph_signature(dependency_graph), graph_signature(expected_graph))
+                    self.assertEqual(len(dependency_graph.get_topological_order()),
+                                     len(expected_graph.get_topological_order()))
+
+    def test_statement_index(self):
+        test_path = os.path.join(DIR_HERE, "ast_to_cfg_test", "test_5.cpp.dump")
+        cfg_to_dependency_graph = CFGToDependencyGraph(ASTToCFG(DumpToAST(test_path)))
+        dependency_graphs = cfg_to_dependency_graph.convert()
+
+        errors = []
+        for d in dependency_graphs:
+            for n in d.nodes:
+                if n.cfgnode.get_type() == "basic":
+                    error_token = get_statement_tokens(n.cfgnode.token)[0]
+                    errors.append({"root_token_id": n.cfgnode.token.Id, "token_id": error_token.Id,
+                                   "error_type": "ADDITION_OF_INCOMPATIBLE_UNITS"})
+                elif n.cfgnode.get_type() == "conditional":
+                    errors.append({"root_token_id": get_root_token(n.cfgnode.condition).Id, "token_id": "0x0",
+                                   "error_type": "COMPARISON_INCOMPATIBLE_UNITS"})
+        self.assertTrue(errors)
+
+        for e in Error.from_dict({"errors": errors}, dependency_graphs, cfg_to_dependency_graph.statement_index):
+            self.assertIn(e.dependency_node, e.dependency_graph.nodes)
+            self.assertIs(e.dependency_node.cfgnode, e.cfgnode)
+            self.assertIsNotNone(e.error_token)
+
+            if e.cfgnode.get_type() == "basic":
+                self.assertIs(e.root_token, e.cfgnode.token)
+                self.assertEqual(e.error_token.Id, e.error_token_id)
+            else:
+                self.assertIs(e.root_token, get_root_token(e.cfgnode.condition).astOperand2)
+
+    def test_statement_index_after_replace(self):
+        test_path = os.path.join(DIR_HERE, "ast_to_cfg_test", "test_5.cpp.dump")
+        cfg_to_dependency_graph = CFGToDependencyGraph(ASTToCFG(DumpToAST(test_path)))
+        dependency_graphs = cfg_to_dependency_graph.convert()
+        statement_index = cfg_to_dependency_graph.statement_index
+
+        replaced = False
+        for dependency_graph in dependency_graphs:
+            mapping = dependency_graph.cfg.create_node_mapping()
+            indexed = {n.cfgnode for n in dependency_graph.nodes}
+            basic_blocks = sorted((n for n in mapping if n.get_type() == "basic" and n in indexed), key=mapping.get)
+            if len(basic_blocks) < 2:
+                continue
+
+            old_root_token = basic_blocks[0].token
+            cfg_to_dependency_graph.replace_statement(dependency_graph, basic_blocks[0], basic_blocks[-1].token)
+            replaced = True
+
+            # The old statement is gone and the new one resolves to the edited block's current nodes
+            self.assertIsNone(statement_index.get_statement(old_root_token.Id))
+            entry = statement_index.get_statement(basic_blocks[-1].token.Id)
+            self.assertIs(entry.cfgnode, basic_blocks[0])
+            self.assertEqual(entry.dependency_nodes, [n for n in dependency_graph.nodes if n.cfgnode is basic_blocks[0]])
+        self.assertTrue(replaced)
+
+        # No entry points at nodes which were removed from their graph
+        for entry in statement_index.statements.values():
+            for n in entry.dependency_nodes:
+                self.assertIn(n, entry.dependency_graph.nodes)
+
 
 if __name__ == "__main__":
     unittest.main()
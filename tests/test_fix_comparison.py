@@ -0,0 +1,45 @@
+import unittest
+
+from physfix.error_fix.error_fix_utils import PhysVar
+from physfix.error_fix.fix_comparison import fix_comparison
+from physfix.error_fix.unit_search import SearchBudget
+
+from token_helpers import PHYS_VAR_MAP, make_comparison_error
+
+
+class TestFixComparison(unittest.TestCase):
+    def test_one_search_for_both_sides(self):
+        error = make_comparison_error()
+        lhs_change, rhs_change = fix_comparison(error, PHYS_VAR_MAP, {}, max_fixes=2)
+
+        # x / t < v and x < v * t
+        self.assertIs(lhs_change.token_to_fix, error.error_token.astOperand1)
+        self.assertEqual(repr(lhs_change.changes[0]), "x / t")
+        self.assertIs(rhs_change.token_to_fix, error.error_token.astOperand2)
+        self.assertEqual(repr(rhs_change.changes[0]), "t * v")
+        self.assertEqual(len(lhs_change.changes), 2)
+        self.assertEqual(len(rhs_change.changes), 2)
+        self.assertFalse(lhs_change.truncated or rhs_change.truncated)
+
+    def test_most_likely_first(self):
+        # s and t are both seconds, Phys is more certain about t
+        phys_var_map = dict(PHYS_VAR_MAP, s=PhysVar("s", "s", [[{"second": 1}, 0.5]]),
+                            t=PhysVar("t", "t", [[{"second": 1}, 0.9]]))
+        self.assertEqual(phys_var_map["t"].probabilities, [0.9])
+
+        lhs_change, rhs_change = fix_comparison(make_comparison_error(["s", "t"]), phys_var_map, {}, max_fixes=2)
+        self.assertEqual([repr(c) for c in lhs_change.changes], ["x / t", "x / s"])
+        self.assertEqual([repr(c) for c in rhs_change.changes], ["t * v", "s * v"])
+
+    def test_budget(self):
+        # The budget is started for every error, so one budget can be shared between calls
+        budget = SearchBudget(max_states=1)
+        for _ in range(2):
+            lhs_change, rhs_change = fix_comparison(make_comparison_error(), PHYS_VAR_MAP, {}, budget=budget)
+            self.assertTrue(lhs_change.truncated and rhs_change.truncated)
+            self.assertEqual(lhs_change.changes, [])
+        self.assertEqual(budget.states, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
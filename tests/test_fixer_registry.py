@@ -0,0 +1,74 @@
+import os
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+
+from physfix.error_fix.error_fix_utils import Error
+from physfix.error_fix.fixer_registry import FIXERS, dispatch_fixers, get_fixer, group_by_graph, register_fixer
+from physfix.error_fix.fix_comparison import fix_comparison
+from physfix.error_fix.unit_search import UnitSearchCache
+
+from token_helpers import PHYS_VAR_MAP, make_comparison_error
+
+
+class TestFixerRegistry(unittest.TestCase):
+    def test_dispatch(self):
+        self.assertIs(get_fixer("COMPARISON_INCOMPATIBLE_UNITS"), fix_comparison)
+
+        errors = [make_comparison_error() for _ in range(3)]
+        errors.insert(1, Error("0x1", "0x1", "UNKNOWN_ERROR_TYPE"))
+
+        serial = dispatch_fixers(errors, PHYS_VAR_MAP, {}, max_workers=1, max_fixes=3)
+        parallel = dispatch_fixers(errors, PHYS_VAR_MAP, {}, max_workers=2, max_fixes=3)
+
+        self.assertIsNone(serial[1])
+        self.assertIsNone(parallel[1])
+        for error, serial_changes, parallel_changes in zip(errors, serial, parallel):
+            if serial_changes is None:
+                continue
+
+            # Changes from workers are rebuilt from the tokens and variables of the error
+            for serial_change, parallel_change in zip(serial_changes, parallel_changes):
+                self.assertIs(parallel_change.token_to_fix, serial_change.token_to_fix)
+                self.assertEqual([repr(c) for c in parallel_change.changes], [repr(c) for c in serial_change.changes])
+                variables = [c.variable for c in parallel_change.changes[0].children if c.variable]
+                self.assertTrue(variables)
+                for variable in variables:
+                    self.assertIn(variable, {r.variable for r in error.dependency_graph.reach_definition[error.cfgnode]})
+
+    def test_errors_in_a_graph_share_a_worker(self):
+        first, second = make_comparison_error(), make_comparison_error()
+        # Two errors in each graph, interleaved
+        errors = [first, second, first, second]
+        self.assertEqual(group_by_graph(errors), [[0, 2], [1, 3]])
+
+        serial_cache, parallel_cache = UnitSearchCache(), UnitSearchCache()
+        serial = dispatch_fixers(errors, PHYS_VAR_MAP, {}, max_workers=1, max_fixes=3, search_cache=serial_cache)
+        parallel = dispatch_fixers(errors, PHYS_VAR_MAP, {}, max_workers=2, max_fixes=3, search_cache=parallel_cache)
+
+        # The second error of each graph replays the search of the first. Both graphs need the same
+        # search, so a worker which happens to fix both graphs gets another hit
+        self.assertGreaterEqual(parallel_cache.hits, 2)
+        self.assertEqual(parallel_cache.hits + parallel_cache.misses, 4)
+        self.assertEqual((serial_cache.hits, serial_cache.misses), (3, 1))
+        for serial_changes, parallel_changes in zip(serial, parallel):
+            self.assertEqual([[repr(e) for e in c.changes] for c in parallel_changes],
+                             [[repr(e) for e in c.changes] for c in serial_changes])
+
+    def test_crashed_worker(self):
+        @register_fixer("CRASHING_ERROR")
+        def crash(*_, **__):
+            os._exit(1)
+
+        try:
+            errors = [make_comparison_error(), make_comparison_error()]
+            errors[1].error_type = "CRASHING_ERROR"
+
+            # A dead worker isn't hidden by fixing the errors again one at a time
+            with self.assertRaises(BrokenProcessPool):
+                dispatch_fixers(errors, PHYS_VAR_MAP, {}, max_workers=2, max_fixes=3)
+        finally:
+            del FIXERS["CRASHING_ERROR"]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from physfix.phys_cache import PhysCache, get_local_includes
+
+
+def write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+class TestPhysCache(unittest.TestCase):
+    def test_key(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source_path = os.path.join(tmp_dir, "a.cpp")
+            write(source_path, '#include "a.h"\n#include <vector>\n#include "missing.h"\n')
+            write(os.path.join(tmp_dir, "a.h"), '#include "b.h"\n')
+            write(os.path.join(tmp_dir, "b.h"), "")
+
+            self.assertEqual(get_local_includes(source_path),
+                             sorted(os.path.join(tmp_dir, h) for h in ["a.h", "b.h"]))
+
+            cache = PhysCache(os.path.join(tmp_dir, "cache"), "image1")
+            key = cache.get_key(source_path)
+            self.assertEqual(cache.get_key(source_path), key)
+
+            # Changing an included header or the Phys version changes the key
+            write(os.path.join(tmp_dir, "b.h"), "int x;")
+            self.assertNotEqual(cache.get_key(source_path), key)
+            self.assertNotEqual(PhysCache(cache.cache_dir, "image2").get_key(source_path), cache.get_key(source_path))
+
+            # A copy without its headers is keyed by the includes of the file it was copied from
+            copy_dir = os.path.join(tmp_dir, "copy")
+            os.makedirs(copy_dir)
+            copy_path = os.path.join(copy_dir, "a.cpp")
+            with open(source_path) as f:
+                write(copy_path, f.read())
+            key = cache.get_key(copy_path, source_path)
+            self.assertNotEqual(key, cache.get_key(copy_path))
+            write(os.path.join(tmp_dir, "b.h"), "int y;")
+            self.assertNotEqual(cache.get_key(copy_path, source_path), key)
+
+    def test_get_put_evict(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path, dump_path = os.path.join(tmp_dir, "output.json"), os.path.join(tmp_dir, "a.cpp.dump")
+            cache = PhysCache(os.path.join(tmp_dir, "cache"), "image", max_bytes=250)
+
+            self.assertFalse(cache.get("a", output_path, dump_path))
+            for key in ["a", "b"]:
+                write(output_path, key * 50)
+                write(dump_path, key * 50)
+                cache.put(key, output_path, dump_path)
+                os.utime(os.path.join(cache.cache_dir, key), (0, 0) if key == "a" else (1, 1))
+
+            self.assertTrue(cache.get("a", output_path, dump_path))
+            with open(output_path) as f:
+                self.assertEqual(f.read(), "a" * 50)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+            # a was used last, so b is evicted to make room for c
+            write(output_path, "c" * 50)
+            cache.put("c", output_path, dump_path)
+            self.assertEqual(sorted(os.listdir(cache.cache_dir)), ["a", "c"])
+
+            # Storing an entry another run already stored isn't an error
+            os.rename(os.path.join(cache.cache_dir, "c"), os.path.join(tmp_dir, "c"))
+            exists = os.path.exists
+
+            # The other run stores c between the check for the entry and the rename
+            def store_first(path):
+                if path == os.path.join(cache.cache_dir, "c") and not exists(path):
+                    os.rename(os.path.join(tmp_dir, "c"), path)
+                    return False
+                return exists(path)
+
+            with mock.patch.object(os.path, "exists", store_first):
+                cache.put("c", output_path, dump_path)
+            self.assertEqual(sorted(os.listdir(cache.cache_dir)), ["a", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
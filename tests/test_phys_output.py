@@ -0,0 +1,83 @@
+import json
+import random
+import unittest
+
+from physfix.error_fix.error_fix_utils import get_token_unit_map
+from physfix.error_fix.phys_output import TokenUnitTable, loads_phys_output
+from physfix.error_fix.unit import to_unit
+
+
+def make_phys_output(rng, num_tokens):
+    units = [{"meter": 1}, {"second": -1, "meter": 1}, [{"kilogram": 1}, 0.25], {"meter": 0.5}]
+    token_units = {hex(rng.randrange(1, 2 ** 48)): rng.choice(units) for _ in range(num_tokens)}
+    # Ids which aren't cppcheck addresses are kept as they are
+    for token_id in ["not_hex", "abc", "0x0001", "0XAB"]:
+        token_units[token_id] = units[0]
+
+    return {
+        "errors": [{"root_token_id": "0x10", "token_id": "0x11", "error_type": "COMPARISON_INCOMPATIBLE_UNITS"}],
+        "variables": [{"var_name": "x", "var_id": "0x20", "units": [{"meter": 1}]}],
+        "token_units": token_units,
+    }
+
+
+class TestPhysOutput(unittest.TestCase):
+    def test_loads(self):
+        rng = random.Random(0)
+        output = make_phys_output(rng, 200)
+        expected_units = get_token_unit_map(output)
+
+        for indent in [None, 2]:
+            loaded = loads_phys_output(json.dumps(output, indent=indent))
+            self.assertEqual(loaded["errors"], output["errors"])
+            self.assertEqual(loaded["variables"], output["variables"])
+
+            token_units = get_token_unit_map(loaded)
+            self.assertIsInstance(token_units, TokenUnitTable)
+            self.assertIs(token_units, loaded["token_units"])
+
+            # Units are only decoded once they're looked up
+            self.assertLessEqual(len(token_units.unit_texts), 4)
+            self.assertTrue(all(u is None for u in token_units.units))
+
+            self.assertEqual(len(token_units), len(expected_units))
+            self.assertEqual(set(token_units), set(expected_units))
+            for token_id, unit in expected_units.items():
+                self.assertIs(token_units[token_id], unit)
+            self.assertIsNone(token_units.get("0x1"))
+            self.assertNotIn("0x1", token_units)
+
+    def test_empty_and_escaped(self):
+        loaded = loads_phys_output('{"errors": [], "token_units": {}, "variables": []}')
+        self.assertEqual(len(loaded["token_units"]), 0)
+        self.assertEqual(loaded["variables"], [])
+
+        loaded = loads_phys_output('{"token_units": {"a\\"b": {"meter": 1}}}')
+        self.assertIs(loaded["token_units"]['a"b'], to_unit({"meter": 1}))
+
+    def test_truncated(self):
+        text = json.dumps(make_phys_output(random.Random(1), 5))
+        for end in [0, 1, len(text) // 2, len(text) - 2, len(text) - 1]:
+            with self.assertRaises(ValueError):
+                loads_phys_output(text[:end])
+
+        for text in ['{"token_units": {"0x1": {"meter": 1}', '{"token_units": {"0x1": {"meter": 1}, ', '{"errors": []']:
+            with self.assertRaises(ValueError):
+                loads_phys_output(text)
+
+    def test_token_ids(self):
+        table = TokenUnitTable(["0x1a", "abc", "0x01a", "12"], ['{"meter": 1}'] * 4)
+        self.assertEqual(list(table.keys), [0x1a])
+        self.assertEqual(set(table), {"0x1a", "abc", "0x01a", "12"})
+        self.assertNotIn("0x1A", table)
+
+    def test_probabilities(self):
+        table = TokenUnitTable(["0x1", "0x2"], ['[{"meter": 1}, 0.25]', '{"second": 1}'])
+        self.assertEqual(table.get_probability("0x1"), 0.25)
+        self.assertEqual(table.get_probability("0x2"), 1.0)
+        self.assertIsNone(table.get_probability("0x3"))
+        self.assertIs(table["0x1"], to_unit({"meter": 1}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+from physfix.phys_worker import PhysWorkerError, PhysWorkerPool
+
+DIR_HERE = os.path.dirname(__file__)
+STUB_COMMAND = [sys.executable, os.path.join(DIR_HERE, "phys_worker_test", "phys_worker_stub.py")]
+# The worker which runs in the Phys container, checking files with a stand-in for the Phys command
+WORKER_COMMAND = [sys.executable, os.path.join(DIR_HERE, "..", "src", "physfix", "phys_worker_main.py"),
+                  sys.executable, os.path.join(DIR_HERE, "phys_worker_test", "phys_stub.py")]
+
+
+class TestPhysWorker(unittest.TestCase):
+    def test_pool(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, PhysWorkerPool(STUB_COMMAND, size=2) as pool:
+            files = [(os.path.join(tmp_dir, f"{i}.cpp"), os.path.join(tmp_dir, f"{i}.json")) for i in range(20)]
+            results = pool.run_many(files)
+
+            for (source_path, output_path), result in zip(files, results):
+                self.assertEqual(result.output_path, output_path)
+                self.assertEqual(result.dump_path, f"{source_path}.dump")
+                with open(output_path) as f:
+                    self.assertEqual(json.load(f)["source_path"], source_path)
+
+            # Each worker process is only started once
+            processes = [w.process for w in pool.workers]
+            pool.run_many(files)
+            self.assertEqual([w.process for w in pool.workers], processes)
+
+    def test_errors(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, PhysWorkerPool(STUB_COMMAND) as pool:
+            output_path = os.path.join(tmp_dir, "output.json")
+            with self.assertRaises(PhysWorkerError):
+                pool.run(os.path.join(tmp_dir, "missing.cpp"), output_path)
+
+            process = pool.workers[0].process
+            with self.assertRaises(PhysWorkerError):
+                pool.run(os.path.join(tmp_dir, "crash.cpp"), output_path)
+
+            # Crashed workers are restarted on the next file
+            pool.run(os.path.join(tmp_dir, "a.cpp"), output_path)
+            self.assertIsNot(pool.workers[0].process, process)
+
+    def test_protocol_errors(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, PhysWorkerPool(STUB_COMMAND, timeout=1) as pool:
+            output_path = os.path.join(tmp_dir, "output.json")
+
+            # Stray output and workers which stop answering restart the worker instead of pairing
+            # later responses with the wrong files
+            for name in ["stray.cpp", "hang.cpp"]:
+                process = pool.workers[0].process
+                with self.assertRaises(PhysWorkerError):
+                    pool.run(os.path.join(tmp_dir, name), output_path)
+                self.assertIsNone(pool.workers[0].process)
+
+                result = pool.run(os.path.join(tmp_dir, "a.cpp"), output_path)
+                self.assertEqual(result.output_path, output_path)
+                self.assertIsNot(pool.workers[0].process, process)
+
+    def test_worker_main(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, PhysWorkerPool(WORKER_COMMAND, size=2) as pool:
+            files = [(os.path.join(tmp_dir, f"{i}.cpp"), os.path.join(tmp_dir, f"{i}.json")) for i in range(4)]
+            for (source_path, output_path), result in zip(files, pool.run_many(files)):
+                self.assertEqual(result.dump_path, f"{source_path}.dump")
+                with open(output_path) as f:
+                    self.assertEqual(json.load(f)["source_path"], source_path)
+
+            # Phys failing on a file is reported without stopping the worker
+            process = pool.workers[0].process
+            with self.assertRaisesRegex(PhysWorkerError, "No such file"):
+                pool.run(os.path.join(tmp_dir, "missing.cpp"), os.path.join(tmp_dir, "missing.json"))
+            pool.run(*files[0])
+            self.assertIs(pool.workers[0].process, process)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import unittest
+
+from physfix.dataflow.ast_to_cfg import ASTToCFG
+from physfix.dataflow.reach_def import (ReachDefQuery, create_def_use_pairs, create_live_variables,
+                                        create_reach_definitions, reaching_defs_at)
+from physfix.dataflow.worklist import Worklist
+from physfix.parse.dump_to_ast import DumpToAST
+
+DIR_HERE = os.path.dirname(__file__)
+
+
+def naive_reach_definitions(cfg, def_use_pairs):
+    """Round robin solver used as a reference"""
+    reach = {n: set() for n in cfg.nodes}
+    reach_out = {n: set() for n in cfg.nodes}
+
+    changed = True
+    while changed:
+        changed = False
+        for n in cfg.nodes:
+            reach[n] = set()
+            for p in n.previous:
+                reach[n].update(reach_out[p])
+
+            define = def_use_pairs[n].define
+            new_reach_out = {(n, v) for v in define}
+            new_reach_out.update(r for r in reach[n] if r[1] not in define)
+
+            if new_reach_out != reach_out[n]:
+                reach_out[n] = new_reach_out
+                changed = True
+
+    return reach
+
+
+def naive_live_variables(cfg, def_use_pairs):
+    """Round robin solver used as a reference"""
+    live = {n: set() for n in cfg.nodes}
+
+    changed = True
+    while changed:
+        changed = False
+        for n in cfg.nodes:
+            live_out = set()
+            for next_node in n.next:
+                live_out.update(live[next_node])
+
+            new_live = (live_out - def_use_pairs[n].define) | def_use_pairs[n].use
+            if new_live != live[n]:
+                live[n] = new_live
+                changed = True
+
+    return live
+
+
+class TestReachDef(unittest.TestCase):
+    def load_cfgs(self, i):
+        test_path = os.path.join(DIR_HERE, "ast_to_cfg_test", f"test_{i}.cpp.dump")
+        return ASTToCFG(DumpToAST(test_path)).convert()
+
+    def test_worklist(self):
+        for i in range(1, 15):
+            for cfg in self.load_cfgs(i):
+                def_use_pairs = create_def_use_pairs(cfg)
+                worklist = Worklist.forward(cfg)
+                reach = create_reach_definitions(cfg, def_use_pairs, worklist)
+
+                expected = naive_reach_definitions(cfg, def_use_pairs)
+                for n in cfg.nodes:
+                    self.assertEqual({(r.def_node, r.variable) for r in reach[n]}, expected[n])
+
+                # Reverse postorder means only loops cause a node to be processed again
+                self.assertFalse(worklist)
+                self.assertLessEqual(max(worklist.iteration_counts.values()), 3)
+                if not any(n.get_type() == "conditional" for n in cfg.nodes):
+                    self.assertEqual(worklist.iterations, len(cfg.nodes))
+
+    def test_query(self):
+        for i in range(1, 15):
+            for cfg in self.load_cfgs(i):
+                def_use_pairs = create_def_use_pairs(cfg)
+                reach = create_reach_definitions(cfg, def_use_pairs)
+
+                # Query from the end of the function backwards so earlier results are reused
+                query = ReachDefQuery(cfg, def_use_pairs)
+                for n in reversed(cfg.nodes):
+                    self.assertEqual(query[n], reach[n])
+                    self.assertEqual(reaching_defs_at(cfg, n, def_use_pairs), reach[n])
+
+    def test_live_variables(self):
+        for i in range(1, 15):
+            for cfg in self.load_cfgs(i):
+                def_use_pairs = create_def_use_pairs(cfg)
+                worklist = Worklist.backward(cfg)
+                live = create_live_variables(cfg, def_use_pairs, worklist)
+
+                self.assertEqual(live, naive_live_variables(cfg, def_use_pairs))
+                self.assertLessEqual(max(worklist.iteration_counts.values()), 3)
+
+        # At the top of the loop in gcd, tmp is dead because it is redefined before being used
+        test_path = os.path.join(DIR_HERE, "data_dependency_test", "test_2.cpp.dump")
+        cfg = ASTToCFG(DumpToAST(test_path)).convert()[0]
+        def_use_pairs = create_def_use_pairs(cfg)
+        live = create_live_variables(cfg, def_use_pairs)
+        condition = next(n for n in cfg.nodes if n.get_type() == "conditional")
+        self.assertEqual({v.nameToken.str for v in live[condition]}, {"x", "y"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from lxml import etree
+
+from physfix.error_fix.error_fix_utils import Change
+from physfix.error_fix.expr_node import ExprNode
+from physfix.phys_fix import PhysFix
+from physfix.srcml import POS_NS, SRC_NS, SrcmlConverter
+
+from token_helpers import make_op_token, make_var_token
+
+DIR_HERE = os.path.dirname(__file__)
+STUB_COMMAND = [sys.executable, os.path.join(DIR_HERE, "srcml_test", "srcml_stub.py")]
+
+# srcml --position output for "x < v;" on line 3
+SRCML = f'''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<unit xmlns="{SRC_NS}" xmlns:pos="{POS_NS}" revision="1.0.0" language="C++" pos:tabs="8"><expr_stmt pos:start="3:1" pos:end="3:6"><expr pos:start="3:1" pos:end="3:5"><name pos:start="3:1" pos:end="3:1">x</name> <operator pos:start="3:3" pos:end="3:3">&lt;</operator> <name pos:start="3:5" pos:end="3:5">v</name></expr>;</expr_stmt>
+</unit>
+'''
+
+
+class TestSrcml(unittest.TestCase):
+    def test_convert_many(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source_paths = [os.path.join(tmp_dir, f"{i}.cpp") for i in range(5)]
+            output_paths = [f"{p}.xml" for p in source_paths]
+            for i, p in enumerate(source_paths):
+                with open(p, "w") as f:
+                    f.write(f"int x = {i};")
+
+            converter = SrcmlConverter(os.path.join(tmp_dir, "cache"), STUB_COMMAND)
+            converter.convert_many(source_paths, output_paths)
+            self.assertEqual(converter.runs, 1)
+
+            # The archive is split into one standalone unit per file
+            for i, (source_path, output_path) in enumerate(zip(source_paths, output_paths)):
+                unit = etree.parse(output_path).getroot()
+                self.assertEqual(unit.tag, f"{{{SRC_NS}}}unit")
+                self.assertEqual(unit.get("filename"), source_path)
+                self.assertEqual(unit.findtext(f"{{{SRC_NS}}}expr"), f"int x = {i};")
+                os.remove(output_path)
+
+            # Unchanged files come from the cache, changed files are converted again
+            with open(source_paths[0], "w") as f:
+                f.write("int y;")
+            converter.convert_many(source_paths, output_paths)
+            self.assertEqual(converter.runs, 2)
+            self.assertEqual(etree.parse(output_paths[0]).getroot().findtext(f"{{{SRC_NS}}}expr"), "int y;")
+            self.assertTrue(all(os.path.exists(p) for p in output_paths))
+
+            converter.convert(source_paths[0], output_paths[0])
+            self.assertEqual(converter.runs, 2)
+
+    def test_patch_namespaced(self):
+        x, v, t = make_var_token("x", "x"), make_var_token("v", "v"), make_var_token("t", "t")
+        comparison = make_op_token("<", x, v)
+        x.next, comparison.next = comparison, v
+        for token in [x, comparison, v]:
+            token.linenr = 3
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            srcml_path = os.path.join(tmp_dir, "a.xml")
+            with open(srcml_path, "w") as f:
+                f.write(SRCML)
+
+            # The patching methods don't use the file PhysFix was created for
+            phys_fix = PhysFix.__new__(PhysFix)
+            srcml_xml = phys_fix.load_srcml_xml(srcml_path)
+            change = Change(x, [ExprNode.from_op("/", ExprNode.from_variable(x.variable),
+                                                 ExprNode.from_variable(t.variable))])
+            xslt_paths = phys_fix.changes_to_xslt(srcml_xml, [change], os.path.join(tmp_dir, "a_patch"))
+
+            output_prefix = os.path.splitext(xslt_paths[0])[0]
+            phys_fix.apply_xslt(srcml_xml, xslt_paths[0], output_prefix)
+            with open(f"{output_prefix}.cpp") as f:
+                self.assertEqual(f.read().strip(), "x/t < v;")
+
+            stripped = phys_fix.load_srcml_xml(srcml_path, strip_namespace=True)
+            self.assertEqual(stripped.getroot().tag, "unit")
+            self.assertEqual(stripped.find(".//expr").get("start"), "3:1")
+            self.assertEqual(etree.tostring(stripped, method="text"), etree.tostring(srcml_xml, method="text"))
+
+
+if __name__ == "__main__":
+    unittest.main()
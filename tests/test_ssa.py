@@ -0,0 +1,64 @@
+import os
+import unittest
+
+from physfix.dataflow.ast_to_cfg import ASTToCFG
+from physfix.dataflow.dependency_graph import CFGToDependencyGraph
+from physfix.dataflow.reach_def import create_reach_definitions
+from physfix.error_fix.error_fix_utils import PhysVar, get_candidate_variables
+from physfix.error_fix.unit import Unit
+from physfix.parse.dump_to_ast import DumpToAST
+
+DIR_HERE = os.path.dirname(__file__)
+
+TEST_DUMPS = [os.path.join("ast_to_cfg_test", f"test_{i}.cpp.dump") for i in range(1, 15)] + \
+             [os.path.join("data_dependency_test", f"test_{i}.cpp.dump") for i in range(1, 3)]
+
+
+def graph_edges(dependency_graph):
+    """Maps (CFGNode, Variable) of each DependencyNode to the (CFGNode, Variable) of its previous nodes"""
+    return {(d.cfgnode, d.variable): {(p.cfgnode, p.variable) for p in d.previous} for d in dependency_graph.nodes}
+
+
+class TestSSA(unittest.TestCase):
+    def test(self):
+        for test_dump in TEST_DUMPS:
+            ast_to_cfg = ASTToCFG(DumpToAST(os.path.join(DIR_HERE, test_dump)))
+            dense_graphs = CFGToDependencyGraph(ast_to_cfg).convert()
+            ssa_graphs = CFGToDependencyGraph(ast_to_cfg, use_ssa=True).convert()
+
+            for dense, sparse in zip(dense_graphs, ssa_graphs):
+                self.assertEqual(graph_edges(dense), graph_edges(sparse))
+
+                reach = create_reach_definitions(dense.cfg, dense.def_use_pairs)
+                for n in dense.cfg.nodes:
+                    self.assertEqual(sparse.reach_definition[n], reach[n])
+                    self.assertEqual(sparse.ssa.reaching_defs_at(n), reach[n])
+
+                    for v in sparse.def_use_pairs[n].use:
+                        expected = {r for r in reach[n] if r.variable == v}
+                        self.assertEqual(sparse.ssa.reaching_definitions(n, v), expected)
+
+                # Fixers get the same candidates from the SSA form without the dense reaching definitions
+                variables = {r.variable for n in dense.cfg.nodes for r in reach[n]}
+                phys_var_map = {v.Id: PhysVar(v.nameToken.str, v.Id, [Unit.from_dict({"meter": 1})]) for v in variables}
+                sparse.reach_definition = None
+                for d in dense.nodes:
+                    self.assertEqual(get_candidate_variables(d, sparse, phys_var_map, live_only=False),
+                                     get_candidate_variables(d, dense, phys_var_map, live_only=False))
+
+                # Every node other than the entry block is dominated by the entry block
+                ssa = sparse.ssa
+                for n in ssa.reverse_postorder[1:]:
+                    dominator = n
+                    while dominator != ssa.idom[dominator]:
+                        dominator = ssa.idom[dominator]
+                    self.assertIs(dominator, sparse.cfg.entry_block)
+
+                # Phi functions can only be placed where control flow merges
+                for n, phis in ssa.phis.items():
+                    if phis:
+                        self.assertGreaterEqual(len(n.previous), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import gc
+import pickle
+import unittest
+
+from physfix.error_fix.error_fix_utils import PhysVar, get_token_unit_map, unit_diff
+from fractions import Fraction
+
+from physfix.error_fix import unit
+from physfix.error_fix.unit import DIMENSIONLESS, Unit
+
+
+class TestUnit(unittest.TestCase):
+    def test_interning(self):
+        velocity = Unit.from_dict({"meter": 1, "second": -1})
+        self.assertIs(velocity, Unit.from_dict({"second": -1, "meter": 1}))
+        self.assertIs(Unit.from_dict({"meter": 1, "second": 0}), Unit.from_dict({"meter": 1}))
+        self.assertIs(Unit.from_dict({"meter": 0}), DIMENSIONLESS)
+        self.assertFalse(DIMENSIONLESS)
+        self.assertEqual(len({velocity, Unit.from_dict({"meter": 1, "second": -1})}), 1)
+        self.assertIs(pickle.loads(pickle.dumps(velocity)), velocity)
+
+        # Float exponents from Phys are the same as the exact fraction
+        self.assertIs(Unit.from_dict({"meter": 1 / 3}), Unit((Fraction(1, 3),)))
+        self.assertIs(Unit.from_dict({"meter": 0.3333333333333333}) ** 3, Unit((1,)))
+
+    def test_unused_units_released(self):
+        """Units visited by a search aren't kept once nothing refers to them"""
+        base = Unit.from_dict({"kelvin": 1})
+        for i in range(2 * unit.OPERATION_CACHE_SIZE):
+            base / Unit.from_dict({"candela": i + 2})
+        gc.collect()
+
+        self.assertLessEqual(len(unit._INTERNED), 3 * unit.OPERATION_CACHE_SIZE)
+        self.assertLessEqual(unit._divide.cache_info().currsize, unit.OPERATION_CACHE_SIZE)
+
+    def test_algebra(self):
+        meter = Unit.from_dict({"meter": 1})
+        second = Unit.from_dict({"second": 1})
+        velocity = meter / second
+
+        self.assertEqual(velocity.to_dict(), {"meter": 1, "second": -1})
+        self.assertIs(velocity * second, meter)
+        self.assertIs(velocity / velocity, DIMENSIONLESS)
+        self.assertIs(unit_diff(meter, velocity), DIMENSIONLESS / second)
+
+        # sqrt keeps exact exponents
+        self.assertEqual((meter ** 0.5).to_dict(), {"meter": 0.5})
+        self.assertIs((meter ** 0.5) ** 2, meter)
+
+    def test_phys_output(self):
+        phys_var = PhysVar("v", "0x1", [[{"meter": 1, "second": -1}, 0.9], {"meter": 1}])
+        self.assertEqual(phys_var.units, [Unit.from_dict({"meter": 1, "second": -1}), Unit.from_dict({"meter": 1})])
+        self.assertEqual(phys_var.probabilities, [0.9, 1.0])
+        self.assertLess(phys_var.get_cost(), PhysVar("u", "0x2", [[{"meter": 1}, 0.5]]).get_cost())
+
+        token_unit_map = get_token_unit_map({"token_units": {"0x2": {"second": 1}}})
+        self.assertIs(token_unit_map["0x2"], Unit.from_dict({"second": 1}))
+
+
+if __name__ == "__main__":
+    unittest.main()
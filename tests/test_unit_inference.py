@@ -0,0 +1,101 @@
+import unittest
+
+from physfix.error_fix.error_fix_utils import PhysVar, create_change_tree, inverse_unit
+from physfix.error_fix.unit import DIMENSIONLESS, Unit
+from physfix.error_fix.unit_inference import UnitInference, change_resolves_error
+from physfix.parse.cpp_parser import Token
+
+from token_helpers import make_op_token, make_var_token
+
+
+class TestUnitInference(unittest.TestCase):
+    def setUp(self):
+        self.phys_var_map = {
+            "x": PhysVar("x", "x", [{"meter": 1}]),
+            "v": PhysVar("v", "v", [{"meter": 1, "second": -1}]),
+            "t": PhysVar("t", "t", [{"second": 1}]),
+        }
+
+    def test_inconsistent_addition(self):
+        # x = x + v
+        v = make_var_token("v", "v")
+        plus = make_op_token("+", make_var_token("x", "x"), v)
+        assign = make_op_token("=", make_var_token("x", "x"), plus)
+
+        inference = UnitInference(self.phys_var_map, {})
+        self.assertIs(inference.infer(assign), Unit.from_dict({"meter": 1}))
+        self.assertEqual(inference.inconsistencies, [plus])
+
+        # x = x + v * t
+        change = make_op_token("*", make_var_token("t", "t"), v.copy())
+        self.assertTrue(change_resolves_error(assign, plus, v, change, self.phys_var_map, {}))
+
+        # x = x + v / t
+        change = make_op_token("/", v.copy(), make_var_token("t", "t"))
+        self.assertFalse(change_resolves_error(assign, plus, v, change, self.phys_var_map, {}))
+
+    def test_unknown_units(self):
+        # x < y where y has no unit is not an inconsistency
+        comparison = make_op_token("<", make_var_token("x", "x"), make_var_token("y", "y"))
+
+        inference = UnitInference(self.phys_var_map, {})
+        self.assertIs(inference.infer(comparison), DIMENSIONLESS)
+        self.assertEqual(inference.inconsistencies, [])
+
+    def test_expr_node_change(self):
+        # x = x + v
+        v = make_var_token("v", "v")
+        plus = make_op_token("+", make_var_token("x", "x"), v)
+        assign = make_op_token("=", make_var_token("x", "x"), plus)
+        t = make_var_token("t", "t").variable
+
+        # x = x + t * v
+        change = create_change_tree(v, [t], [])
+        self.assertEqual(repr(change), "t * v")
+        self.assertTrue(change_resolves_error(assign, plus, v, change, self.phys_var_map, {}))
+
+        # x = x + v / t / t
+        change = create_change_tree(v, [], [t, t])
+        self.assertEqual(repr(change), "v / t / t")
+        self.assertFalse(change_resolves_error(assign, plus, v, change, self.phys_var_map, {}))
+
+        # Tokens are only created on demand, with new Ids except for the term being fixed
+        change_token = change.to_token()
+        self.assertEqual(repr(change_token), "v / t / t")
+        self.assertEqual(change_token.astOperand1.str, "/")
+        self.assertIs(change_token.astOperand1.astParent, change_token)
+        self.assertEqual(change_token.astOperand1.astOperand1.Id, v.Id)
+        self.assertNotEqual(change_token.astOperand2.Id, change_token.astOperand1.astOperand2.Id)
+
+    def test_inverse_unit(self):
+        phys_var_map = {
+            "a": PhysVar("a", "a", [{"meter": 1}]),
+            "b": PhysVar("b", "b", [{"second": 1}]),
+            "t": PhysVar("t", "t", [{"second": 1}]),
+            "k": PhysVar("k", "k", [{"meter": 1}]),
+            "x": PhysVar("x", "x", [{"meter": 1}]),
+        }
+
+        # y = a / (t * b) where y is m/(kg*s), so t * b needs kg*s and t needs kg
+        t = make_var_token("t", "t")
+        division = make_op_token("/", make_var_token("a", "a"), make_op_token("*", t, make_var_token("b", "b")))
+        make_op_token("=", make_var_token("y", "y"), division)
+        target = Unit.from_dict({"meter": 1, "kilogram": -1, "second": -1})
+        self.assertIs(inverse_unit(target, t, phys_var_map, {}), Unit.from_dict({"kilogram": 1}))
+
+        # y = sqrt(k * x) where y is m, so k * x needs m^2 and k needs m
+        k = make_var_token("k", "k")
+        sqrt_name = Token(None)
+        sqrt_name.Id, sqrt_name.str = "sqrt_token", "sqrt"
+        call = make_op_token("(", sqrt_name, make_op_token("*", k, make_var_token("x", "x")))
+        make_op_token("=", make_var_token("y", "y"), call)
+        self.assertIs(inverse_unit(Unit.from_dict({"meter": 1}), k, phys_var_map, {}), Unit.from_dict({"meter": 1}))
+
+        # Operands without units leave the needed unit unknown
+        u = make_var_token("u", "u")
+        make_op_token("=", make_var_token("y", "y"), make_op_token("*", u, make_var_token("w", "w")))
+        self.assertIsNone(inverse_unit(target, u, phys_var_map, {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
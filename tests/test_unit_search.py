@@ -0,0 +1,210 @@
+import random
+import time
+import unittest
+from itertools import combinations_with_replacement
+
+from physfix.error_fix.unit import DIMENSIONLESS, Unit
+from physfix.error_fix.unit_search import (_depth_first_level, _meet_in_the_middle_level, get_pick_units,
+                                           SearchBudget, UnitSearchCache, has_conflict, iter_levels, np,
+                                           search_unit_products, unit_norm)
+
+DIMENSIONS = ["meter", "second", "kilogram"]
+
+
+def random_unit(rng):
+    return Unit.from_dict({d: rng.randint(-2, 2) for d in DIMENSIONS})
+
+
+def brute_force(needed, pick_units, max_vars):
+    """Checks every sorted tuple of picks"""
+    levels = []
+    for size in range(max_vars + 1):
+        level = []
+        for picks in combinations_with_replacement(range(len(pick_units)), size):
+            unit = Unit()
+            for p in picks:
+                unit = unit * pick_units[p]
+            if unit is needed and not has_conflict(picks):
+                level.append(picks)
+        levels.append(level)
+
+    return levels
+
+
+def random_searches(seed, count):
+    """Yields (needed unit, pick units) of random searches, some of which have solutions"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        candidate_units = [random_unit(rng) for _ in range(rng.randint(1, 6))]
+
+        needed = Unit()
+        for u in rng.sample(candidate_units, min(2, len(candidate_units))):
+            needed = needed * u if rng.random() < 0.5 else needed / u
+
+        yield needed, get_pick_units(candidate_units)
+
+
+class TestUnitSearch(unittest.TestCase):
+    def test_engines_match(self):
+        for needed, pick_units in random_searches(0, 30):
+            max_norm = max(unit_norm(u) for u in pick_units)
+            half_states = {}
+            for size, expected in enumerate(brute_force(needed, pick_units, 4)):
+                self.assertEqual(_depth_first_level(needed, pick_units, size, max_norm), expected)
+                self.assertEqual(_meet_in_the_middle_level(needed, pick_units, size, half_states), expected)
+
+    @unittest.skipUnless(np is not None, "numpy not installed")
+    def test_numpy_engine_matches(self):
+        for needed, pick_units in random_searches(0, 30):
+            self.assertEqual(list(iter_levels(needed, pick_units, 4, engine="numpy")),
+                             brute_force(needed, pick_units, 4))
+
+        # sqrt gives fractional exponents
+        meter = Unit.from_dict({"meter": 1})
+        area = meter * meter
+        sqrt_candidates = [meter ** 0.5, area, Unit.from_dict({"second": 1})]
+        self.assertEqual(list(search_unit_products(meter ** 0.5, area, sqrt_candidates, 3, engine="numpy")),
+                         list(search_unit_products(meter ** 0.5, area, sqrt_candidates, 3)))
+
+    def test_search_unit_products(self):
+        meter = Unit.from_dict({"meter": 1})
+        second = Unit.from_dict({"second": 1})
+        velocity = meter / second
+
+        # x, t, t2, v
+        candidate_units = [meter, second, second, velocity]
+        results = list(search_unit_products(velocity, meter, candidate_units, 2))
+
+        # v * t, v * t2, v * x / v and so on, each multiset only once
+        self.assertEqual(results[:2], [([1], []), ([2], [])])
+        self.assertEqual(len(results), len(set((tuple(m), tuple(d)) for m, d in results)))
+        for mult_idxs, div_idxs in results:
+            self.assertFalse(set(mult_idxs) & set(div_idxs))
+
+            unit = velocity
+            for i in mult_idxs:
+                unit = unit * candidate_units[i]
+            for i in div_idxs:
+                unit = unit / candidate_units[i]
+            self.assertIs(unit, meter)
+
+        # Cheaper candidates come first within the same number of variables
+        costs = [0, 1, 0, 0]
+        self.assertEqual(next(search_unit_products(velocity, meter, candidate_units, 2, costs)), ([2], []))
+
+        # Levels past the first result are never searched
+        self.assertEqual(next(search_unit_products(velocity, meter, candidate_units * 20, 30)), ([1], []))
+
+    def test_search_cache(self):
+        meter = Unit.from_dict({"meter": 1})
+        second = Unit.from_dict({"second": 1})
+        candidate_units = [meter, second, meter / second]
+        expected = list(search_unit_products(meter / second, meter, candidate_units, 3))
+
+        cache = UnitSearchCache()
+        first = cache.search_unit_products(meter / second, meter, candidate_units, 3)
+        self.assertEqual(next(first), expected[0])
+
+        # Another error needing the same unit replays the first search and continues it
+        self.assertEqual(list(cache.search_unit_products(meter * meter / second, meter * meter, candidate_units, 3)),
+                         expected)
+        self.assertEqual(list(first), expected[1:])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        cache.search_unit_products(meter / second, meter, candidate_units, 2)
+        self.assertEqual(cache.misses, 2)
+
+        # Errors with the same variables in another order share the search, results use their own order
+        rng = random.Random(1)
+        candidate_units = [random_unit(rng) for _ in range(6)]
+        candidate_costs = [rng.randint(0, 2) for _ in range(6)]
+        needed = candidate_units[0] * candidate_units[1] / candidate_units[2]
+        cache = UnitSearchCache()
+        for _ in range(4):
+            order = list(range(6))
+            rng.shuffle(order)
+            units, costs = [candidate_units[i] for i in order], [candidate_costs[i] for i in order]
+            self.assertEqual(list(cache.search_unit_products(DIMENSIONLESS, needed, units, 3, costs)),
+                             list(search_unit_products(DIMENSIONLESS, needed, units, 3, costs)))
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def check_truncated(self, engine):
+        meter = Unit.from_dict({"meter": 1})
+        second = Unit.from_dict({"second": 1})
+        candidate_units = [meter, second, meter / second, second * second] * 3
+
+        for max_vars in [3, 5]:
+            expected = list(search_unit_products(meter / second, meter, candidate_units, max_vars, engine=engine))
+
+            budget = SearchBudget(max_states=1000).start()
+            results = list(search_unit_products(meter / second, meter, candidate_units, max_vars,
+                                                engine=engine, budget=budget))
+            self.assertTrue(budget.truncated)
+            self.assertTrue(results)
+            self.assertLessEqual(len(results), len(expected))
+            # Earlier levels are complete, the level which ran out has the candidates found so far
+            self.assertTrue(set(map(repr, results)) <= set(map(repr, expected)))
+            if max_vars == 3 or engine == "numpy":
+                self.assertEqual(results, expected[:len(results)])
+
+    @unittest.skipUnless(np is not None, "numpy not installed")
+    def test_numpy_budget(self):
+        self.check_truncated("numpy")
+
+    def test_budget(self):
+        meter = Unit.from_dict({"meter": 1})
+        second = Unit.from_dict({"second": 1})
+        candidate_units = [meter, second, meter / second, second * second] * 3
+
+        self.check_truncated("python")
+
+        # Unlimited budgets and searches within their budget aren't truncated
+        budget = SearchBudget().start()
+        self.assertEqual(list(search_unit_products(meter / second, meter, candidate_units, 3, budget=budget)),
+                         list(search_unit_products(meter / second, meter, candidate_units, 3)))
+        self.assertFalse(budget.truncated)
+        self.assertGreater(budget.states, 0)
+
+        budget = SearchBudget(max_seconds=0).start()
+        self.assertEqual(list(search_unit_products(meter / second, meter, candidate_units, 3, budget=budget)), [])
+        self.assertTrue(budget.truncated)
+
+        # Each error sharing a search pays for the part it runs with its own budget
+        expected = list(search_unit_products(meter / second, meter, candidate_units, 3))
+        cache = UnitSearchCache()
+        first_budget, second_budget = SearchBudget(max_states=1000).start(), SearchBudget().start()
+        first_results = list(cache.search_unit_products(meter / second, meter, candidate_units, 3, budget=first_budget))
+        second_results = list(cache.search_unit_products(meter / second, meter, candidate_units, 3, budget=second_budget))
+        self.assertTrue(first_budget.truncated)
+        self.assertTrue(first_results)
+        self.assertTrue(set(map(repr, first_results)) <= set(map(repr, expected)))
+        self.assertEqual(second_results, expected)
+        self.assertFalse(second_budget.truncated)
+        self.assertGreater(second_budget.states, 0)
+
+        third_budget = SearchBudget(max_states=1).start()
+        self.assertEqual(list(cache.search_unit_products(meter / second, meter, candidate_units, 3, budget=third_budget)),
+                         expected)
+        self.assertFalse(third_budget.truncated)
+
+    def test_shared_budget_clock(self):
+        """A later error resuming a shared search isn't stopped by the clock of the error which started it"""
+        meter = Unit.from_dict({"meter": 1})
+        second = Unit.from_dict({"second": 1})
+        candidate_units = [meter, second, meter / second, second * second] * 3
+        expected = list(search_unit_products(meter / second, meter, candidate_units, 3))
+
+        cache = UnitSearchCache()
+        first_budget = SearchBudget(max_seconds=0.05).start()
+        first = cache.search_unit_products(meter / second, meter, candidate_units, 3, budget=first_budget)
+        self.assertEqual(next(first), expected[0])
+
+        time.sleep(0.2)
+        second_budget = SearchBudget(max_seconds=10).start()
+        self.assertEqual(list(cache.search_unit_products(meter / second, meter, candidate_units, 3,
+                                                         budget=second_budget)), expected)
+        self.assertFalse(second_budget.truncated)
+
+
+if __name__ == "__main__":
+    unittest.main()
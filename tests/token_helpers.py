@@ -0,0 +1,51 @@
+"""Factories for the tokens, variables and errors shared by the tests"""
+from physfix.dataflow.cfg_node import BasicBlock
+from physfix.dataflow.dependency_graph import DependencyGraph, DependencyNode
+from physfix.dataflow.reach_def import ReachDef
+from physfix.error_fix.error_fix_utils import Error, PhysVar
+from physfix.parse.cpp_parser import Token, Variable
+
+PHYS_VAR_MAP = {
+    "x": PhysVar("x", "x", [{"meter": 1}]),
+    "v": PhysVar("v", "v", [{"meter": 1, "second": -1}]),
+    "t": PhysVar("t", "t", [{"second": 1}]),
+}
+
+
+def make_var_token(name, var_id):
+    token = Token(None)
+    token.Id = f"{name}_token"
+    token.str = name
+    token.variable = Variable({"id": var_id})
+    token.variable.nameToken = token
+    token.variableId = var_id
+    token.varId = var_id
+
+    return token
+
+
+def make_op_token(op, left, right):
+    token = Token(None)
+    token.Id = f"{op}_{left.Id}_{right.Id}"
+    token.str = op
+    token.astOperand1 = left
+    token.astOperand2 = right
+    left.astParent = token
+    right.astParent = token
+
+    return token
+
+
+def make_comparison_error(other_vars=("t",)):
+    """x < v where t (or other_vars) reaches the comparison"""
+    x, v = make_var_token("x", "x"), make_var_token("v", "v")
+    comparison = make_op_token("<", x, v)
+
+    cfgnode = BasicBlock(comparison)
+    dependency_node = DependencyNode(cfgnode, None)
+    reaching = [x, v] + [make_var_token(name, name) for name in other_vars]
+    reach_definition = {cfgnode: {ReachDef(cfgnode, var.variable) for var in reaching}}
+    dependency_graph = DependencyGraph(None, [dependency_node], reach_definition, {})
+
+    return Error(comparison.Id, comparison.Id, "COMPARISON_INCOMPATIBLE_UNITS", dependency_node,
+                 dependency_graph, cfgnode, comparison, comparison)